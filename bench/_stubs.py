@@ -0,0 +1,162 @@
+"""
+离线压测用的最小替身模块
+
+没有安装 AstrBot（以及 K 线渲染依赖的 jinja2 / playwright）时，
+在 sys.modules 中注册只包含插件用到的名字的替身，使 core 下的模块可以在普通 Python 环境中导入。
+已安装的真实模块优先，不会被替换。只供 bench/ 下的脚本使用。
+"""
+
+import importlib.util
+import logging
+import os
+import sys
+import types
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    module.__path__ = []  # 允许作为包导入子模块
+    sys.modules[name] = module
+    return module
+
+
+def _available(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class _Filter:
+    """filter 装饰器替身：所有装饰器原样返回被装饰的函数"""
+
+    class _Names:
+        def __getattr__(self, name):
+            return name
+
+    EventMessageType = _Names()
+    PermissionType = _Names()
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: (lambda func: func)
+
+
+class _MessageChain:
+    def __init__(self):
+        self.chain = []
+
+    def message(self, text: str):
+        self.chain.append(text)
+        return self
+
+
+class _Component:
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    @classmethod
+    def fromBytes(cls, content: bytes):
+        return cls(content)
+
+    @classmethod
+    def fromFileSystem(cls, path: str):
+        return cls(path)
+
+
+class _MessageType(Enum):
+    GROUP_MESSAGE = "GroupMessage"
+    FRIEND_MESSAGE = "FriendMessage"
+    OTHER_MESSAGE = "OtherMessage"
+
+
+@dataclass
+class _MessageSession:
+    platform_name: str
+    message_type: _MessageType
+    session_id: str
+
+    def __str__(self):
+        return f"{self.platform_name}:{self.message_type.value}:{self.session_id}"
+
+    @staticmethod
+    def from_str(session: str) -> "_MessageSession":
+        platform_name, message_type, session_id = session.split(":", 2)
+        return _MessageSession(platform_name, _MessageType(message_type), session_id)
+
+
+class _Star:
+    def __init__(self, context, *args, **kwargs):
+        self.context = context
+
+
+def install_stubs(data_dir: Path | None = None, log_level: int = logging.WARNING):
+    """注册缺少的依赖的替身
+
+    Args:
+        data_dir: get_astrbot_data_path() 返回的目录（只在使用替身时生效）
+        log_level: 替身 logger 的级别
+    """
+    if not _available("astrbot"):
+        logger = logging.getLogger("astrbot")
+        logger.setLevel(log_level)
+        if not logger.handlers:
+            logger.addHandler(logging.StreamHandler())
+        data_path = str(data_dir or os.environ.get("ASTRBOT_DATA", "data"))
+
+        _module("astrbot")
+        _module("astrbot.api", logger=logger, AstrBotConfig=dict)
+        _module(
+            "astrbot.api.event",
+            AstrMessageEvent=object,
+            MessageChain=_MessageChain,
+            filter=_Filter(),
+        )
+        _module("astrbot.api.star", Context=object, Star=_Star, register=lambda *a, **k: (lambda c: c))
+        _module(
+            "astrbot.api.message_components",
+            Image=_Component,
+            Plain=_Component,
+            Reply=_Component,
+        )
+        _module("astrbot.core")
+        _module("astrbot.core.platform", MessageType=_MessageType)
+        _module("astrbot.core.platform.message_session", MessageSession=_MessageSession)
+        _module("astrbot.core.utils")
+        _module("astrbot.core.utils.astrbot_path", get_astrbot_data_path=lambda: data_path)
+
+    if not _available("jinja2"):
+
+        class _Environment:
+            def __init__(self, *args, **kwargs):
+                self.filters = {}
+
+        _module("jinja2", Environment=_Environment, FileSystemLoader=_Component)
+
+    if not _available("playwright"):
+
+        def _async_playwright():
+            raise RuntimeError("playwright 未安装")
+
+        _module("playwright")
+        _module("playwright.async_api", async_playwright=_async_playwright)
+
+
+def load_core(root: Path, *names: str) -> types.SimpleNamespace:
+    """导入 core 下的模块，跳过 core/__init__（避免导入 cave/user 依赖的 mikuchat SDK）"""
+    if "core" not in sys.modules:
+        package = types.ModuleType("core")
+        package.__path__ = [str(root / "core")]
+        sys.modules["core"] = package
+    modules = {name: importlib.import_module(f"core.{name}") for name in names}
+    return types.SimpleNamespace(**modules)
+
+
+__all__ = [
+    "install_stubs",
+    "load_core",
+]
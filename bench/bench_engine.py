@@ -0,0 +1,333 @@
+"""
+交易引擎离线基准
+
+不需要 AstrBot 运行环境（缺少的依赖用 _stubs.py 中的替身代替），在临时目录中建库，测量：
+    market_tick           N 个币种的一次市场更新（变化度 + 价格 + 写入价格记录）
+    pending_orders        M 个挂单（不成交）时的 check_and_execute_pending_orders
+    liquidations          P 个未平仓合约（不爆仓）时的 check_and_execute_liquidations
+    funding               P 个未平仓合约时的 apply_funding_rates
+    price_history         K 条价格记录时 get_price_history 读取最近一天
+    kline_ring / kline_db bi_history 的 K 线聚合（10 分钟周期命中内存缓冲区 / 60 分钟周期读数据库），不渲染图片
+    save_accounts         U 个修改过的常驻账户时的 save_bi_data
+    load_accounts         load_bi_data 后从数据库冷加载 U 个账户
+每项重复 --repeat 次，输出最小/中位/平均耗时。结果可写入 JSON，并与之前的结果对比：
+    python bench/bench_engine.py --json bench_engine.json
+    python bench/bench_engine.py --compare bench_engine.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from _stubs import install_stubs, load_core  # noqa: E402
+
+REGRESSION_THRESHOLD = 0.10  # 对比时中位耗时变慢超过10%视为回退
+
+
+class BenchEvent:
+    """基准用的最小消息事件"""
+
+    def __init__(self, sender_id: str = "bench"):
+        self.sender_id = sender_id
+
+    def get_sender_id(self) -> str:
+        return self.sender_id
+
+    def plain_result(self, text):
+        return text
+
+    def image_result(self, url_or_path):
+        return url_or_path
+
+    def chain_result(self, chain):
+        return chain
+
+
+def add_coins(bi, count: int):
+    """把币种扩充到 count 个（新币种按现有币种的参数轮换）"""
+    base = list(bi.COINS)
+    for i in range(len(bi.COINS), count):
+        template = base[i % len(base)]
+        coin = f"C{i:03d}"
+        bi.COINS.append(coin)
+        bi.INITIAL_PRICES[coin] = bi.INITIAL_PRICES[template]
+        bi.VOLATILITY_BASE[coin] = bi.VOLATILITY_BASE[template]
+        bi.dynamic_means[coin] = bi.INITIAL_PRICES[template]
+        bi.current_volatility[coin] = bi.VOLATILITY_BASE[template]
+        bi.market_prices[coin] = bi.INITIAL_PRICES[template]
+        bi.liquidity_pressure[coin] = 0.0
+
+
+def seed_pending_orders(bi, count: int, per_user: int = 10):
+    """每个用户 per_user 个不会成交的挂单"""
+    now = datetime.now()
+    for u in range((count + per_user - 1) // per_user):
+        user_id = f"order_user_{u}"
+        bi.init_user(user_id)
+        orders = []
+        for j in range(min(per_user, count - u * per_user)):
+            coin = bi.COINS[j % len(bi.COINS)]
+            price = bi.market_prices[coin]
+            is_buy = j % 2 == 0
+            orders.append(
+                {
+                    "order_id": f"{user_id}_{j}",
+                    "type": "buy" if is_buy else "sell",
+                    "coin": coin,
+                    "amount": 1.0,
+                    "price": price * (0.5 if is_buy else 2.0),
+                    "created_at": now,
+                    "expires_at": now + timedelta(hours=1),
+                }
+            )
+        bi.pending_orders[user_id] = orders
+
+
+def seed_positions(bi, count: int, rng: random.Random):
+    """count 个远离爆仓价的仓位，多头占七成（资金费率不为0）"""
+    now = datetime.now()
+    for i in range(count):
+        user_id = f"position_user_{i % 500}"
+        bi.init_user(user_id)
+        coin = bi.COINS[i % len(bi.COINS)]
+        price = bi.market_prices[coin]
+        direction = "long" if rng.random() < 0.7 else "short"
+        bi.add_contract_position(
+            {
+                "position_id": f"pos_{i}",
+                "user_id": user_id,
+                "coin": coin,
+                "direction": direction,
+                "amount": 1.0,
+                "entry_price": price,
+                "leverage": 2,
+                "margin": price / 2,
+                "opened_at": now,
+                "liquidation_price": price * (0.1 if direction == "long" else 10.0),
+            }
+        )
+
+
+def seed_price_history(bi, db_file: Path, coin: str, count: int, rng: random.Random):
+    """直接写入 count 条按分钟排列的价格记录（截止到现在），并重新预热内存缓冲区"""
+    conn = sqlite3.connect(str(db_file))
+    cursor = conn.cursor()
+    coin_id = bi._get_coin_id(cursor, coin)
+    now_ms = int(time.time() // 60 * 60_000)
+    price = bi.INITIAL_PRICES[coin]
+    rows = []
+    for i in range(count, 0, -1):
+        price = max(0.01, price * (1 + rng.uniform(-0.02, 0.02)))
+        rows.append((coin_id, now_ms - i * 60_000, price))
+    cursor.executemany(
+        "INSERT OR REPLACE INTO price_history (coin_id, ts, price) VALUES (?, ?, ?)", rows
+    )
+    conn.commit()
+    conn.close()
+    bi._warm_price_ring()
+
+
+def seed_accounts(bi, count: int, rng: random.Random) -> list[str]:
+    user_ids = [f"account_user_{i}" for i in range(count)]
+    bi._account_store.set_capacity(count)
+    for user_id in user_ids:
+        bi.init_user(user_id)
+        bi.user_balance[user_id] = bi.INITIAL_BALANCE - rng.uniform(0, 1000)
+        coin = rng.choice(bi.COINS)
+        bi.user_assets[user_id][coin]["amount"] = rng.uniform(0, 10)
+    return user_ids
+
+
+def measure(func, repeat: int, setup=None) -> list[float]:
+    """执行 repeat 次，返回每次耗时（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def drain(gen_factory):
+    async def run():
+        async for _ in gen_factory():
+            pass
+
+    return lambda: asyncio.run(run())
+
+
+def summarize(name: str, params: dict, timings: list[float]) -> dict:
+    return {
+        "name": name,
+        "params": params,
+        "runs": len(timings),
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+    }
+
+
+def run(args) -> list[dict]:
+    rng = random.Random(args.seed)
+    data_dir = Path(tempfile.mkdtemp(prefix="bench_engine_"))
+    install_stubs(data_dir)
+    core = load_core(ROOT, "bi", "bi_store")
+    bi = core.bi
+    bi.bi_stop_market_updates()
+    random.seed(args.seed)
+
+    async def no_render(*args, **kwargs):
+        return b""
+
+    bi.template_to_pic = no_render
+    bi.set_plugin_path("bench")
+    db_file = bi.DB_FILE
+    results = []
+
+    # 市场更新
+    add_coins(bi, args.coins)
+    timings = measure(lambda: (bi.update_volatility(), bi.update_market_prices()), args.repeat)
+    results.append(summarize("market_tick", {"coins": args.coins}, timings))
+
+    # 挂单检查
+    seed_pending_orders(bi, args.orders)
+    timings = measure(bi.check_and_execute_pending_orders, args.repeat)
+    results.append(summarize("pending_orders", {"orders": args.orders}, timings))
+
+    # 爆仓检查与资金费
+    seed_positions(bi, args.positions, rng)
+    timings = measure(bi.check_and_execute_liquidations, args.repeat)
+    results.append(summarize("liquidations", {"positions": args.positions}, timings))
+
+    def reset_funding_clock():
+        bi.last_funding_rate_time = 0
+
+    timings = measure(bi.apply_funding_rates, args.repeat, setup=reset_funding_clock)
+    results.append(summarize("funding", {"positions": args.positions}, timings))
+
+    # 价格历史与K线
+    coin = bi.COINS[0]
+    seed_price_history(bi, db_file, coin, args.history, rng)
+    end = datetime.now()
+    timings = measure(
+        lambda: bi.get_price_history(coin, start_time=end - timedelta(days=1), end_time=end),
+        args.repeat,
+    )
+    results.append(summarize("price_history", {"rows": args.history}, timings))
+    for name, timeframe in (("kline_ring", 10), ("kline_db", 60)):
+        timings = measure(
+            drain(lambda tf=timeframe: bi.bi_history(None, BenchEvent(), coin, tf)), args.repeat
+        )
+        results.append(
+            summarize(name, {"rows": args.history, "timeframe": timeframe}, timings)
+        )
+
+    # 账户保存与加载
+    user_ids = seed_accounts(bi, args.users, rng)
+
+    def touch_accounts():
+        for user_id in user_ids:
+            bi.user_balance[user_id] += 1
+
+    timings = measure(bi.save_bi_data, args.repeat, setup=touch_accounts)
+    results.append(summarize("save_accounts", {"users": args.users}, timings))
+
+    def load_accounts():
+        bi.load_bi_data()
+        store = core.bi_store.UserAccountStore(
+            bi.COINS,
+            bi.INITIAL_BALANCE,
+            capacity=len(user_ids),
+            positions_loader=bi._select_contract_positions,
+        )
+        store.set_db_file(db_file)
+        for user_id in user_ids:
+            store.get(user_id)
+
+    timings = measure(load_accounts, args.repeat)
+    results.append(summarize("load_accounts", {"users": args.users}, timings))
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def print_table(results: list[dict], baseline: dict[str, dict] | None = None):
+    header = f"{'benchmark':<16}{'params':<30}{'min ms':>10}{'median ms':>12}{'mean ms':>10}"
+    if baseline:
+        header += f"{'vs base':>10}"
+    print(header)
+    for result in results:
+        params = ",".join(f"{k}={v}" for k, v in result["params"].items())
+        line = (
+            f"{result['name']:<16}{params:<30}{result['min_ms']:>10.2f}"
+            f"{result['median_ms']:>12.2f}{result['mean_ms']:>10.2f}"
+        )
+        if baseline:
+            base = baseline.get(result["name"])
+            if base is None or base["params"] != result["params"]:
+                line += f"{'-':>10}"
+            else:
+                change = result["median_ms"] / base["median_ms"] - 1 if base["median_ms"] else 0.0
+                flag = " !" if change > REGRESSION_THRESHOLD else ""
+                line += f"{change * 100:>+9.1f}%{flag}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="交易引擎离线基准")
+    parser.add_argument("--coins", type=int, default=50, help="市场更新的币种数")
+    parser.add_argument("--orders", type=int, default=10_000, help="挂单数")
+    parser.add_argument("--positions", type=int, default=2_000, help="未平仓合约数")
+    parser.add_argument("--history", type=int, default=100_000, help="价格记录条数")
+    parser.add_argument("--users", type=int, default=2_000, help="账户数")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前写入的 JSON 结果对比（中位耗时）")
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print_table(results, baseline)
+    if args.json:
+        output = {
+            "meta": {
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "args": vars(args),
+            },
+            "results": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,226 @@
+"""
+MikuChat 命令离线压测
+
+在本地启动模拟服务器（见 mock_mikuchat.py），按相同的命令序列比较三种调用方式：
+    baseline       每条命令新建 httpx.AsyncClient，无缓存（原始实现）
+    pooled         共享连接池（mikuchat_client），无缓存
+    pooled+cache   插件当前实现：连接池 + 回声洞/用户缓存 + 随机回声洞预取 + 图片磁盘缓存
+输出每种方式的吞吐量、p50/p99 延迟、实际请求数和新建连接数。
+
+没有安装 AstrBot 时使用 _stubs 中的替身，可在普通 Python 环境中运行（需要 mikuchat SDK 和 httpx）：
+    python bench/bench_mikuchat.py --ops 1000 --concurrency 10 --latency 30
+    python bench/bench_mikuchat.py --json bench_output.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("MIKUCHAT_API_KEY", '{"2": "bench"}')
+
+from _stubs import install_stubs, load_core  # noqa: E402
+from mock_mikuchat import MockConfig, MockMikuChatServer  # noqa: E402
+
+COMMAND_WEIGHTS = {"cave_get": 0.4, "cave_select": 0.4, "user_get": 0.2}
+HOT_CAVES = 200  # cave_select 的编号范围（幂律分布，少数热门编号占多数请求）
+USERS = 50
+
+
+class BenchEvent:
+    """压测用的最小消息事件"""
+
+    class message_obj:
+        message_id = 0
+
+    def __init__(self, sender_id: int):
+        self.sender_id = sender_id
+
+    def get_sender_id(self) -> str:
+        return str(self.sender_id)
+
+    def plain_result(self, text):
+        return text
+
+    def image_result(self, url):
+        return url
+
+    def chain_result(self, chain):
+        return chain
+
+
+def make_workload(ops: int, seed: int) -> list[tuple[str, int]]:
+    """生成命令序列 [(命令, 参数)]"""
+    rng = random.Random(seed)
+    names = list(COMMAND_WEIGHTS)
+    weights = list(COMMAND_WEIGHTS.values())
+    workload = []
+    for _ in range(ops):
+        command = rng.choices(names, weights)[0]
+        if command == "cave_select":
+            arg = min(HOT_CAVES, int(rng.paretovariate(1.2)))
+        elif command == "user_get":
+            arg = 100000 + rng.randrange(USERS)
+        else:
+            arg = 0
+        workload.append((command, arg))
+    return workload
+
+
+async def run_baseline(command: str, arg: int):
+    """原始实现：每条命令一个新客户端"""
+    from mikuchat.apis import Cave, User
+
+    async with httpx.AsyncClient() as client:
+        if command == "cave_get":
+            await Cave(client=client).get_cave()
+        elif command == "cave_select":
+            await Cave(client=client).select_cave(id=arg)
+        else:
+            await User(client=client).get_user_info(qq=arg)
+
+
+def make_pooled(core):
+    async def run_pooled(command: str, arg: int):
+        from mikuchat.apis import Cave, User
+
+        if command == "cave_get":
+            await core.mikuchat_resilience.call_api(Cave, "get_cave")
+        elif command == "cave_select":
+            await core.mikuchat_resilience.call_api(Cave, "select_cave", id=arg)
+        else:
+            await core.mikuchat_resilience.call_api(User, "get_user_info", qq=arg)
+
+    return run_pooled
+
+
+def make_cached(core):
+    async def run_cached(command: str, arg: int):
+        if command == "cave_get":
+            messages = core.cave.cave_get(BenchEvent(0))
+        elif command == "cave_select":
+            messages = core.cave.cave_select(BenchEvent(0), arg)
+        else:
+            messages = core.user.user_get(BenchEvent(arg), arg)
+        async for _ in messages:
+            pass
+
+    return run_cached
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_scenario(name, runner, workload, concurrency, server) -> dict:
+    server.reset_stats()
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in workload:
+        queue.put_nowait(item)
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            command, arg = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                await runner(command, arg)
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "scenario": name,
+        "ops": len(workload),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ops": round(len(workload) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "server_requests": server.stats.requests,
+        "server_connections": server.stats.connections,
+    }
+
+
+async def main(args) -> list[dict]:
+    server = MockMikuChatServer(
+        MockConfig(
+            latency_ms=args.latency,
+            jitter_ms=args.jitter,
+            error_rate=args.error_rate,
+            image_bytes=args.image_bytes,
+        )
+    )
+    await server.start()
+
+    from mikuchat.apis._api import MikuChatApi
+
+    MikuChatApi.BASE_URL_BOT = server.base_url
+    image_dir = tempfile.TemporaryDirectory()
+    install_stubs(Path(image_dir.name))
+    # 跳过 core/__init__，避免导入 bi 并启动市场线程
+    core = load_core(ROOT, "cave", "user", "mikuchat_client", "mikuchat_resilience", "image_cache")
+    core.image_cache._image_cache = core.image_cache.DiskImageCache(Path(image_dir.name))
+
+    workload = make_workload(args.ops, args.seed)
+    scenarios = [
+        ("baseline", run_baseline),
+        ("pooled", make_pooled(core)),
+        ("pooled+cache", make_cached(core)),
+    ]
+    results = []
+    try:
+        for name, runner in scenarios:
+            results.append(
+                await run_scenario(name, runner, workload, args.concurrency, server)
+            )
+            await core.cave.stop_cave_prefetch()
+            await core.mikuchat_client.close_http_client()
+    finally:
+        await server.stop()
+        image_dir.cleanup()
+    return results
+
+
+def print_table(results: list[dict]):
+    columns = list(results[0])
+    widths = [max(len(col), *(len(str(r[col])) for r in results)) for col in columns]
+    print("  ".join(col.ljust(w) for col, w in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[col]).ljust(w) for col, w in zip(columns, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MikuChat 命令离线压测")
+    parser.add_argument("--ops", type=int, default=1000, help="命令条数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发数")
+    parser.add_argument("--latency", type=float, default=30.0, help="模拟服务器延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=10.0, help="延迟波动（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务器错误率")
+    parser.add_argument("--image-bytes", type=int, default=50_000, help="图片大小（字节）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
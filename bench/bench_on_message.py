@@ -0,0 +1,123 @@
+"""
+BiPlugin.on_message 微基准
+
+每条群消息都会调用 on_message 更新群聊活跃度。对比：
+    legacy    原实现：MessageSession.from_str 解析 + 白名单列表线性查找 + 再次 str(umo) + INFO 日志
+    current   当前实现：直接调用插件的 on_message（UMO 字符串在 frozenset 中查找一次）
+输出每秒可处理的消息数。
+
+需要在 AstrBot 的运行环境中执行（导入插件包会加载 core.bi 并启动市场线程，基准结束前会停止）：
+    python bench/bench_on_message.py --messages 200000 --groups 50
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import logging
+import random
+import sys
+import time
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGE = "mikuchat_plugin"
+
+
+def load_plugin():
+    """把仓库目录作为包导入，返回 main 模块"""
+    if PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE, ROOT / "__init__.py", submodule_search_locations=[str(ROOT)]
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[PACKAGE] = module
+        spec.loader.exec_module(module)
+    return importlib.import_module(f"{PACKAGE}.main")
+
+
+class FakeEvent:
+    __slots__ = ("unified_msg_origin",)
+
+    def __init__(self, umo: str):
+        self.unified_msg_origin = umo
+
+
+def make_sessions(groups: int) -> list[tuple[str, str, str]]:
+    return [("bench", "GroupMessage", str(100000 + i)) for i in range(groups)]
+
+
+def make_events(count: int, sessions, hit_rate: float, seed: int) -> list[FakeEvent]:
+    """生成消息事件，hit_rate 比例来自白名单群聊"""
+    rng = random.Random(seed)
+    events = []
+    for _ in range(count):
+        if rng.random() < hit_rate:
+            platform_id, message_type, session_id = rng.choice(sessions)
+        else:
+            platform_id, message_type, session_id = "bench", "GroupMessage", str(rng.randrange(10**6, 10**7))
+        events.append(FakeEvent(f"{platform_id}:{message_type}:{session_id}"))
+    return events
+
+
+def legacy_handler(bi, logger):
+    """原 on_message 的逻辑"""
+    from astrbot.core.platform.message_session import MessageSession
+
+    async def on_message(event):
+        try:
+            umo = MessageSession.from_str(event.unified_msg_origin)
+            if (umo.platform_name, umo.message_type.value, umo.session_id) in bi.get_whitelist_groups():
+                bi.update_group_activity(str(umo))
+                logger.info(f"[BiPlugin] 更新群聊活跃度: {umo}")
+        except Exception as e:
+            logger.info(f"[BiPlugin] 更新群聊活跃度失败: {e}")
+
+    return on_message
+
+
+async def measure(handler, events) -> float:
+    started = time.perf_counter()
+    for event in events:
+        await handler(event)
+    return len(events) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="on_message 微基准")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--groups", type=int, default=50, help="白名单群聊数")
+    parser.add_argument("--hit-rate", type=float, default=0.5, help="来自白名单群聊的消息比例")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    plugin_main = load_plugin()
+    bi = sys.modules[f"{PACKAGE}.core.bi"]
+    bi.bi_stop_market_updates()
+
+    from astrbot.api import logger
+
+    # 日志输出到空处理器，只计算格式化和分发的开销
+    logging.getLogger(getattr(logger, "name", "astrbot")).handlers[:] = [logging.NullHandler()]
+
+    sessions = make_sessions(args.groups)
+    bi.set_whitelist_groups(sessions)
+    events = make_events(args.messages, sessions, args.hit_rate, args.seed)
+
+    plugin = types.SimpleNamespace()
+    current = plugin_main.BiPlugin.on_message
+
+    async def current_handler(event):
+        await current(plugin, event)
+
+    results = {
+        "legacy": asyncio.run(measure(legacy_handler(bi, logger), events)),
+        "current": asyncio.run(measure(current_handler, events)),
+    }
+    for name, rate in results.items():
+        print(f"{name:<8} {rate:>12,.0f} msg/s  ({1e6 / rate:.2f} µs/msg)")
+    print(f"speedup  {results['current'] / results['legacy']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+交易命令负载模拟
+
+模拟大量用户在群里并发发送交易命令，直接驱动 core.bi 中的命令处理函数
+（BiPlugin 的命令方法只是把参数原样转发给它们），同时后台市场更新线程照常运行：
+- 命令按泊松过程到达（--rate 条/秒，持续 --duration 秒），每条命令一个协程，不等待上一条完成
+- 命令组合可配置，例如 --mix bi_buy=30,bi_sell=20,bi_assets=25,bi_history=5
+- 市场更新使用插件自己的工作线程，只把更新间隔缩短为 --tick-interval 秒
+输出吞吐量、各命令延迟分位数（从计划到达时间算起，包含排队）、事件循环延迟和内存增长。
+不需要 AstrBot 运行环境（缺少的依赖用 _stubs.py 中的替身代替），K 线图不渲染。
+
+    python bench/load_bi.py --users 2000 --rate 200 --duration 30
+    python bench/load_bi.py --mix bi_buy=50,bi_assets=50 --rate 500 --json load.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from _stubs import install_stubs, load_core  # noqa: E402
+from bench_engine import BenchEvent  # noqa: E402
+
+DEFAULT_MIX = (
+    "bi_buy=30,bi_sell=20,bi_assets=20,bi_history=5,bi_contract_open=10,"
+    "bi_contract_close=5,bi_contract_positions=5,bi_contract_history=5"
+)
+LAG_PROBE_INTERVAL = 0.05  # 事件循环延迟探测间隔（秒）
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def rss_mb() -> float:
+    """当前常驻内存（MB），无法读取 /proc 时退回到峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class CommandFactory:
+    """按命令名为随机用户生成命令处理函数的调用"""
+
+    def __init__(self, bi, users: int, rng: random.Random):
+        self.bi = bi
+        self.users = [f"load_user_{i}" for i in range(users)]
+        self.rng = rng
+
+    def make(self, command: str):
+        bi, rng = self.bi, self.rng
+        user_id = rng.choice(self.users)
+        event = BenchEvent(user_id)
+        coin = rng.choice(bi.COINS)
+        if command == "bi_buy":
+            return bi.bi_buy(event, coin, round(rng.uniform(0.1, 5), 2))
+        if command == "bi_sell":
+            return bi.bi_sell(event, coin, round(rng.uniform(0.1, 3), 2))
+        if command == "bi_assets":
+            return bi.bi_assets(event)
+        if command == "bi_history":
+            return bi.bi_history(None, event, coin, rng.choice((1, 5, 10, 60)))
+        if command == "bi_contract_open":
+            direction = rng.choice(("long", "short"))
+            return bi.bi_contract_open(event, coin, direction, round(rng.uniform(0.1, 2), 2))
+        if command == "bi_contract_close":
+            positions = bi.get_contract_positions(user_id)
+            position_id = rng.choice(positions)["position_id"] if positions else "none"
+            return bi.bi_contract_close(event, position_id)
+        if command == "bi_contract_positions":
+            return bi.bi_contract_positions(event)
+        if command == "bi_contract_history":
+            return bi.bi_contract_history(event, 5)
+        raise ValueError(f"不支持的命令: {command}")
+
+
+async def probe_loop_lag(samples: list[float], stop: asyncio.Event):
+    """定时 sleep，记录实际唤醒时间比预期晚多少（秒）"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + LAG_PROBE_INTERVAL
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def run_load(args, bi) -> dict:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    factory = CommandFactory(bi, args.users, rng)
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    lag_samples: list[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(probe_loop_lag(lag_samples, stop))
+    tasks: set[asyncio.Task] = set()
+    loop = asyncio.get_running_loop()
+
+    async def execute(command: str, scheduled: float):
+        try:
+            async for _ in factory.make(command):
+                pass
+        except Exception:
+            errors[command] += 1
+        latencies[command].append(loop.time() - scheduled)
+
+    started = loop.time()
+    deadline = started + args.duration
+    next_arrival = started
+    issued = 0
+    while True:
+        next_arrival += rng.expovariate(args.rate)
+        if next_arrival >= deadline:
+            break
+        delay = next_arrival - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        command = rng.choices(names, weights)[0]
+        task = asyncio.create_task(execute(command, next_arrival))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        issued += 1
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+    stop.set()
+    await lag_task
+
+    return {
+        "issued": issued,
+        "elapsed_s": elapsed,
+        "latencies": latencies,
+        "errors": errors,
+        "lag": lag_samples,
+    }
+
+
+def report(args, result: dict, ticks: int, memory: dict) -> dict:
+    all_latencies = [v for values in result["latencies"].values() for v in values]
+    summary = {
+        "users": args.users,
+        "target_rate": args.rate,
+        "duration_s": args.duration,
+        "issued": result["issued"],
+        "completed": len(all_latencies),
+        "errors": sum(result["errors"].values()),
+        "throughput_cmds": round(len(all_latencies) / result["elapsed_s"], 1),
+        "ticks": ticks,
+        "loop_lag_ms": {
+            "p50": round(percentile(result["lag"], 0.50) * 1000, 2),
+            "p99": round(percentile(result["lag"], 0.99) * 1000, 2),
+            "max": round(max(result["lag"], default=0.0) * 1000, 2),
+        },
+        "memory": memory,
+        "commands": {},
+    }
+    for command, values in sorted(result["latencies"].items()):
+        summary["commands"][command] = {
+            "count": len(values),
+            "errors": result["errors"].get(command, 0),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(max(values) * 1000, 2),
+            "mean_ms": round(statistics.fmean(values) * 1000, 2),
+        }
+
+    print(
+        f"命令 {summary['completed']}/{summary['issued']} 条，出错 {summary['errors']} 条，"
+        f"吞吐 {summary['throughput_cmds']} 条/秒（目标 {args.rate}），市场更新 {ticks} 次"
+    )
+    lag = summary["loop_lag_ms"]
+    print(f"事件循环延迟 p50 {lag['p50']}ms  p99 {lag['p99']}ms  max {lag['max']}ms")
+    print(
+        f"内存 RSS {memory['rss_start_mb']}MB -> {memory['rss_end_mb']}MB"
+        + (
+            f"，Python 堆增长 {memory['heap_growth_mb']}MB"
+            if "heap_growth_mb" in memory
+            else ""
+        )
+    )
+    print(f"{'command':<24}{'count':>7}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for command, stats in summary["commands"].items():
+        print(
+            f"{command:<24}{stats['count']:>7}{stats['errors']:>5}{stats['p50_ms']:>9.2f}"
+            f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['max_ms']:>9.2f}"
+        )
+    return summary
+
+
+def main(args):
+    install_stubs(Path(tempfile.mkdtemp(prefix="load_bi_")))
+    core = load_core(ROOT, "bi", "metrics")
+    bi = core.bi
+    bi.bi_stop_market_updates()
+
+    async def no_render(*args, **kwargs):
+        return b""
+
+    bi.template_to_pic = no_render
+    bi.set_plugin_path("load")
+    bi.set_user_cache_size(args.cache_size)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_start = rss_mb()
+
+    # 市场更新线程与命令并行运行
+    tick_hist = core.metrics.histogram("bi_tick_seconds")
+    ticks_before = tick_hist.count
+    bi.UPDATE_INTERVAL = args.tick_interval
+    bi.bi_start_market_updates()
+    try:
+        result = asyncio.run(run_load(args, bi))
+    finally:
+        bi.bi_stop_market_updates()
+    ticks = tick_hist.count - ticks_before
+
+    memory = {"rss_start_mb": round(rss_start, 1), "rss_end_mb": round(rss_mb(), 1)}
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        memory["heap_growth_mb"] = round(current / 1024 / 1024, 1)
+        memory["heap_peak_mb"] = round(peak / 1024 / 1024, 1)
+        tracemalloc.stop()
+
+    summary = report(args, result, ticks, memory)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="交易命令负载模拟")
+    parser.add_argument("--users", type=int, default=2000, help="模拟用户数")
+    parser.add_argument("--rate", type=float, default=200.0, help="平均每秒到达的命令数")
+    parser.add_argument("--duration", type=float, default=30.0, help="持续时间（秒）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="命令组合，格式 命令=权重,...")
+    parser.add_argument("--tick-interval", type=float, default=1.0, help="市场更新间隔（秒）")
+    parser.add_argument("--cache-size", type=int, default=1024, help="常驻内存的账户数")
+    parser.add_argument("--tracemalloc", action="store_true", help="用 tracemalloc 统计 Python 堆增长（较慢）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    main(parser.parse_args())
@@ -0,0 +1,260 @@
+"""
+本地 MikuChat API 模拟服务器
+
+实现 mikuchat SDK 用到的回声洞、用户、签到卡片接口以及图片下载，
+可以配置延迟、错误率和返回内容大小，用于离线压测 core/cave.py 和 core/user.py。
+只依赖标准库（asyncio），支持 HTTP/1.1 keep-alive，会统计请求数和新建连接数，
+可以直观看到连接池的效果。
+
+单独运行：
+    python bench/mock_mikuchat.py --port 8765 --latency 30 --error-rate 0.05
+
+SDK 指向模拟服务器：
+    MikuChatApi.BASE_URL_BOT = "http://127.0.0.1:8765/api"
+    环境变量 MIKUCHAT_API_KEY='{"2":"bench"}'
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import struct
+import zlib
+from dataclasses import dataclass, field
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+
+@dataclass
+class MockConfig:
+    """模拟服务器参数
+
+    Attributes:
+        latency_ms: 每个请求的基础延迟（毫秒）
+        jitter_ms: 延迟的随机波动（毫秒，均匀分布）
+        error_rate: 返回 500 的概率
+        image_bytes: 图片（签到卡片、回声洞图片）大小
+        cave_text_bytes: 回声洞文本长度
+        cave_count: 回声洞总数（编号 1..cave_count）
+        seed: 随机种子
+    """
+
+    latency_ms: float = 30.0
+    jitter_ms: float = 10.0
+    error_rate: float = 0.0
+    image_bytes: int = 50_000
+    cave_text_bytes: int = 200
+    cave_count: int = 1000
+    seed: int = 0
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    connections: int = 0
+    errors: int = 0
+    bytes_sent: int = 0
+    by_path: dict[str, int] = field(default_factory=dict)
+
+
+def _png(size: int) -> bytes:
+    """生成约 size 字节的合法 PNG（灰度图，未压缩数据块）"""
+    width = 256
+    height = max(1, size // (width + 1))
+    raw = b"".join(b"\x00" + bytes([y % 256]) * width for y in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw, 0))
+        + chunk(b"IEND", b"")
+    )
+
+
+class MockMikuChatServer:
+    """模拟 MikuChat API 的 HTTP 服务器"""
+
+    def __init__(self, config: MockConfig | None = None):
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self.port: int | None = None
+        self._rng = random.Random(self.config.seed)
+        self._server: asyncio.base_events.Server | None = None
+        self._image = _png(self.config.image_bytes)
+        self._names: dict[int, str] = {}
+        self._checked: dict[int, str] = {}  # qq -> 最后签到日期
+
+    @property
+    def base_url(self) -> str:
+        """SDK 使用的 BASE_URL_BOT"""
+        return f"http://127.0.0.1:{self.port}/api"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def reset_stats(self):
+        self.stats = MockStats()
+
+    # ---------- HTTP ----------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split(" ", 2)
+                headers: dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = b""
+                if int(headers.get("content-length", 0)):
+                    body = await reader.readexactly(int(headers["content-length"]))
+
+                status, content_type, payload = await self._dispatch(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(payload)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    ).encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+                self.stats.bytes_sent += len(payload)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> tuple[int, str, bytes]:
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if body:
+            params |= {k: v[-1] for k, v in parse_qs(body.decode()).items()}
+        path = url.path
+        self.stats.requests += 1
+        self.stats.by_path[path] = self.stats.by_path.get(path, 0) + 1
+
+        config = self.config
+        delay = config.latency_ms + self._rng.uniform(-config.jitter_ms, config.jitter_ms)
+        await asyncio.sleep(max(0.0, delay) / 1000)
+        if self._rng.random() < config.error_rate:
+            self.stats.errors += 1
+            return 500, "text/plain", b"mock error"
+
+        if path.startswith("/img/"):
+            return 200, "image/png", self._image
+        if path.endswith("/user/check/get"):
+            return 200, "image/png", self._image
+
+        match path.rsplit("/", 2)[-2:]:
+            case ["cave", "get_cave"]:
+                return self._json({"cave": self._cave(self._rng.randint(1, config.cave_count))})
+            case ["cave", "select_cave"]:
+                cave_id = int(params.get("id", 0))
+                if not 1 <= cave_id <= config.cave_count:
+                    return self._json({"cave": None}, code=404, msg="回声洞不存在")
+                return self._json({"cave": self._cave(cave_id)})
+            case ["user", "get_user_info"]:
+                return self._json({"user": self._user(int(params.get("qq", 0)))})
+            case ["user", "update_user_name"]:
+                qq = int(params.get("qq", 0))
+                self._names[qq] = params.get("name", "")
+                return self._json({"user": self._user(qq)})
+            case ["user", "update_user_check"]:
+                qq = int(params.get("qq", 0))
+                today = date.today().isoformat()
+                if self._checked.get(qq) == today:
+                    return self._json({"user": self._user(qq)}, code=302, msg="今日已签到")
+                self._checked[qq] = today
+                return self._json({"user": self._user(qq)})
+        return 404, "text/plain", b"not found"
+
+    # ---------- 数据 ----------
+
+    def _json(self, data: dict, code: int = 200, msg: str = "ok") -> tuple[int, str, bytes]:
+        return 200, "application/json", json.dumps({"code": code, "msg": msg} | data).encode()
+
+    def _cave(self, cave_id: int) -> dict:
+        """回声洞内容由编号决定，同一编号每次返回相同内容"""
+        cave_type = cave_id % 3
+        text = (f"回声洞{cave_id} " * self.config.cave_text_bytes)[: self.config.cave_text_bytes]
+        image_url = f"http://127.0.0.1:{self.port}/img/{cave_id}.png"
+        return {
+            "id": cave_id,
+            "type": cave_type,
+            "qq": 10000 + cave_id,
+            "string": image_url if cave_type == 1 else text,
+            "image": image_url if cave_type == 2 else None,
+            "time": "2024-01-01 00:00:00",
+        }
+
+    def _user(self, qq: int) -> dict:
+        return {
+            "qq": qq,
+            "id": qq % 100000,
+            "name": self._names.get(qq, f"user_{qq}"),
+            "favorability": 1.0,
+            "coin": 100,
+            "group": 0,
+            "item": {},
+        }
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="本地 MikuChat API 模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=30.0, help="基础延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=10.0, help="延迟波动（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--image-bytes", type=int, default=50_000, help="图片大小（字节）")
+    args = parser.parse_args()
+
+    server = MockMikuChatServer(
+        MockConfig(
+            latency_ms=args.latency,
+            jitter_ms=args.jitter,
+            error_rate=args.error_rate,
+            image_bytes=args.image_bytes,
+        )
+    )
+    await server.start(args.host, args.port)
+    print(f"MikuChat 模拟服务器已启动: {server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,149 @@
+"""
+市场离线快进模拟
+
+用 core.bi.fast_forward 在模拟时钟上连续执行市场更新（不等待，价格记录批量写入），
+固定种子时同样的参数总能得到同样的行情：
+- 可复现的基准：输出每秒更新次数和行情摘要（摘要中的 digest 相同即行情完全相同）
+- 参数调整：--set 修改引擎参数，--sweep 对一个参数的多个取值分别模拟并对比
+- 生成历史数据集：--out 指定数据目录，模拟结束后保留数据库（price_history 表）
+
+    python bench/simulate_market.py --ticks 100000 --seed 42
+    python bench/simulate_market.py --sweep MEAN_REVERSION_STRENGTH=0.05,0.1,0.2 --ticks 20000
+    python bench/simulate_market.py --set LIQUIDITY_DECAY_RATE=0.2 --events --out ./sim_data
+"""
+
+import argparse
+import hashlib
+import json
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from _stubs import install_stubs, load_core  # noqa: E402
+
+
+def parse_assignments(items: list[str]) -> dict[str, float]:
+    params = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        params[name.strip()] = float(value)
+    return params
+
+
+def reset_market(bi):
+    """把价格、均值、变化度和流动性压力恢复为初始值"""
+    bi.market_prices = dict(bi.INITIAL_PRICES)
+    bi.dynamic_means = dict(bi.INITIAL_PRICES)
+    bi.current_volatility = dict(bi.VOLATILITY_BASE)
+    bi.liquidity_pressure = dict.fromkeys(bi.COINS, 0.0)
+    bi.last_event_time = 0
+    bi.last_funding_rate_time = 0
+
+
+def max_drawdown(prices) -> float:
+    peak, worst = 0.0, 0.0
+    for price in prices:
+        peak = max(peak, price)
+        worst = max(worst, 1 - price / peak)
+    return worst
+
+
+def market_summary(bi) -> dict:
+    """每个币种的终值/初值、单次更新收益率标准差、最大回撤和相对动态均值的平均偏离"""
+    coins = {}
+    for coin in bi.COINS:
+        _, prices = bi.get_price_series(coin)
+        if len(prices) < 2:
+            continue
+        returns = [b / a - 1 for a, b in zip(prices, prices[1:])]
+        coins[coin] = {
+            "records": len(prices),
+            "growth": prices[-1] / bi.INITIAL_PRICES[coin],
+            "tick_stdev": statistics.pstdev(returns),
+            "max_drawdown": max_drawdown(prices),
+            "final_vs_mean": prices[-1] / bi.dynamic_means[coin] - 1,
+        }
+    digest = hashlib.sha256(
+        json.dumps({c: round(p, 10) for c, p in bi.market_prices.items()}, sort_keys=True).encode()
+    ).hexdigest()[:12]
+    return {"coins": coins, "digest": digest}
+
+
+def simulate(bi, run_name: str, params: dict[str, float], args) -> dict:
+    bi.set_plugin_path(run_name)
+    reset_market(bi)
+    for name, value in params.items():
+        if not hasattr(bi, name):
+            raise SystemExit(f"core.bi 中没有参数 {name}")
+        setattr(bi, name, type(getattr(bi, name))(value))
+    result = bi.fast_forward(
+        args.ticks,
+        step=args.step,
+        seed=args.seed,
+        start=args.start,
+        settle=args.settle,
+        events=args.events,
+    )
+    summary = market_summary(bi)
+    return {"name": run_name, "params": params, "run": result, **summary}
+
+
+def print_run(run: dict):
+    params = ",".join(f"{k}={v:g}" for k, v in run["params"].items()) or "默认参数"
+    stats = run["run"]
+    print(
+        f"[{params}] {stats['ticks']} 次更新，耗时 {stats['elapsed']:.2f}秒，"
+        f"{stats['ticks_per_second']:.0f} 次/秒，digest {run['digest']}"
+    )
+    print(f"  {'coin':<10}{'growth':>9}{'tick sd':>10}{'max dd':>9}{'vs mean':>10}")
+    for coin, stats in run["coins"].items():
+        print(
+            f"  {coin:<10}{stats['growth']:>9.3f}{stats['tick_stdev'] * 100:>9.3f}%"
+            f"{stats['max_drawdown'] * 100:>8.1f}%{stats['final_vs_mean'] * 100:>+9.1f}%"
+        )
+
+
+def main(args):
+    data_dir = Path(args.out) if args.out else Path(tempfile.mkdtemp(prefix="simulate_market_"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    install_stubs(data_dir)
+    core = load_core(ROOT, "bi")
+    bi = core.bi
+    bi.bi_stop_market_updates()
+
+    base = parse_assignments(args.set)
+    variants = [base]
+    if args.sweep:
+        name, _, values = args.sweep.partition("=")
+        variants = [{**base, name.strip(): float(v)} for v in values.split(",")]
+
+    runs = []
+    for i, params in enumerate(variants):
+        run = simulate(bi, f"sim_{i}" if len(variants) > 1 else "sim", params, args)
+        print_run(run)
+        runs.append(run)
+
+    if args.out:
+        print(f"数据已保存到 {data_dir / 'plugin_data'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "runs": runs}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="市场离线快进模拟")
+    parser.add_argument("--ticks", type=int, default=100_000, help="市场更新次数")
+    parser.add_argument("--step", type=float, default=60.0, help="每次更新的模拟间隔（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--start", type=float, help="模拟起点（秒级时间戳），默认使最后一次更新落在当前时间")
+    parser.add_argument("--settle", action="store_true", help="每次更新后检查挂单、爆仓和资金费")
+    parser.add_argument("--events", action="store_true", help="模拟随机事件的价格变动")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="修改引擎参数，可重复")
+    parser.add_argument("--sweep", metavar="NAME=V1,V2,...", help="对一个参数的多个取值分别模拟")
+    parser.add_argument("--out", help="数据目录（保留生成的数据库），默认使用临时目录")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    main(parser.parse_args())
@@ -1,11 +1,16 @@
 import asyncio
+import functools
 import json
 import random
 import sqlite3
 import threading
 import time
 import uuid
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from itertools import accumulate
 from pathlib import Path
 
 from astrbot.api import logger
@@ -15,21 +20,74 @@ from astrbot.core.platform import MessageType
 from astrbot.core.platform.message_session import MessageSession
 from astrbot.core.utils.astrbot_path import get_astrbot_data_path
 
+from .bi_store import (
+    DEFAULT_CACHE_CAPACITY,
+    AccountView,
+    PendingOrdersView,
+    UserAccountStore,
+)
+from .broadcast import BroadcastDispatcher
+from .event_pool import EventTextPool, build_batch_prompt
+from .group_activity import GroupActivityTracker
+from .hot_log import hot_count, hot_log, log_summaries
+from .metrics import format_stats, register_collector, timed, timer, write_prometheus
+from .profiler import (
+    arm,
+    armed,
+    disarm,
+    memory_snapshot,
+    profile_scope,
+    profiled,
+    set_profile_dir,
+    stop_memory_tracing,
+)
+from .llm_gateway import LLMGateway
+from .market_clock import MarketClock, SimulatedClock
 from .mikuchat_html_render import template_to_pic
+from .price_archive import PriceArchive
+from .price_retention import HOUR_MS, PriceRetention
+from .price_ring import DEFAULT_RING_CAPACITY, PriceRingBuffer
 
 # 数据文件路径 - 使用 AstrBot 插件专用目录，在初始化时设置
 DATA_FILE: Path | None = None
 DB_FILE: Path | None = None
+METRICS_FILE: Path | None = None  # 每次市场更新后写入的 Prometheus 指标快照
+
+# 价格历史分级保留（原始记录 -> 5分钟 -> 1小时 -> 1天K线）
+_price_retention = PriceRetention()
+RETENTION_TIME_BUDGET = 0.2  # 每次市场更新中降采样最多占用0.2秒
+_price_archive_enabled = True  # 降采样前是否把原始记录写入列式归档
+
+# 最近价格的内存环形缓冲区（由 add_price_record 写入，启动时从数据库预热）
+_price_ring = PriceRingBuffer(DEFAULT_RING_CAPACITY)
+
+# 币种名称 -> 数据库中的整数ID（price_coins 表）
+_coin_ids: dict[str, int] = {}
+
+# 批量写入模式下缓冲的价格记录 [(币种, 毫秒时间戳, 价格)]，None 表示逐条写入
+_price_batch: list[tuple[str, int, float]] | None = None
+PRICE_BATCH_SIZE = 10000  # 批量模式下每攒够这么多条写一次数据库
+
+# 市场引擎使用的随机数生成器和时钟（可替换为固定种子/模拟时钟，见 set_market_rng / set_market_clock）
+_rng = random.Random()
+_clock: MarketClock = MarketClock()
 
 
 def set_plugin_path(plugin_name: str):
     """设置数据文件路径，由插件类在初始化时调用"""
-    global DATA_FILE, DB_FILE
+    global DATA_FILE, DB_FILE, METRICS_FILE
     plugin_dir = Path(get_astrbot_data_path()) / "plugin_data" / plugin_name
     plugin_dir.mkdir(parents=True, exist_ok=True)
     DATA_FILE = plugin_dir / "bi_data.json"
     DB_FILE = plugin_dir / "bi_data.db"
+    METRICS_FILE = plugin_dir / "metrics.prom"
+    set_profile_dir(plugin_dir / "profiles")
     init_database()
+    if _price_archive_enabled:
+        _price_retention.archive = PriceArchive(plugin_dir / "price_archive")
+    _warm_price_ring()
+    _account_store.set_db_file(DB_FILE)
+    _event_pool.set_file(plugin_dir / "event_pool.json")
 
 
 def init_database():
@@ -41,22 +99,24 @@ def init_database():
         conn = sqlite3.connect(str(DB_FILE))
         cursor = conn.cursor()
 
-        # 创建价格历史表
+        # 创建数据库结构版本表
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS price_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                coin TEXT NOT NULL,
-                price REAL NOT NULL,
-                timestamp DATETIME NOT NULL
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER NOT NULL
             )
         """)
 
-        # 创建索引以提高查询效率
+        # 创建币种ID表
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_price_history_coin_timestamp
-            ON price_history(coin, timestamp)
+            CREATE TABLE IF NOT EXISTS price_coins (
+                coin_id INTEGER PRIMARY KEY,
+                coin TEXT UNIQUE NOT NULL
+            )
         """)
 
+        # 执行数据库结构迁移（会创建/转换价格历史表）
+        _migrate_database(cursor)
+
         # 创建合约持仓表
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS contract_positions (
@@ -139,36 +199,281 @@ def init_database():
             ON contract_liquidations(user_id)
         """)
 
+        # 创建用户账户表（积分余额）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_accounts (
+                user_id TEXT PRIMARY KEY,
+                balance REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+        # 创建用户收集品持有表
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_holdings (
+                user_id TEXT NOT NULL,
+                coin TEXT NOT NULL,
+                amount REAL NOT NULL,
+                total_cost REAL NOT NULL,
+                PRIMARY KEY (user_id, coin)
+            ) WITHOUT ROWID
+        """)
+
+        # 创建预约单表
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pending_orders (
+                order_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                type TEXT NOT NULL,
+                coin TEXT NOT NULL,
+                amount REAL NOT NULL,
+                price REAL NOT NULL,
+                created_at DATETIME NOT NULL,
+                expires_at DATETIME NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_pending_orders_user
+            ON pending_orders(user_id)
+        """)
+
         conn.commit()
+
+        # 加载币种ID
+        _coin_ids.clear()
+        cursor.execute("SELECT coin, coin_id FROM price_coins")
+        _coin_ids.update(cursor.fetchall())
+
         conn.close()
         logger.info(f"[Database] 数据库初始化完成: {DB_FILE}")
     except Exception as e:
         logger.error(f"[Database] 数据库初始化失败: {e}")
 
 
+def _get_schema_version(cursor: sqlite3.Cursor) -> int:
+    """获取当前数据库结构版本"""
+    cursor.execute("SELECT version FROM schema_version")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _set_schema_version(cursor: sqlite3.Cursor, version: int):
+    """设置数据库结构版本"""
+    cursor.execute("DELETE FROM schema_version")
+    cursor.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+
+
+def _migrate_v1(cursor: sqlite3.Cursor):
+    """v1: 价格历史改为 (coin_id, 毫秒时间戳) 主键的 WITHOUT ROWID 表
+
+    旧表: price_history(id, coin TEXT, price REAL, timestamp ISO-8601 TEXT)
+    新表: price_history(coin_id INTEGER, ts INTEGER, price REAL)
+    时间格式无法解析的旧记录跳过并记录日志
+    """
+    # 清理旧版本迁移中断时遗留的中间表
+    cursor.execute("DROP TABLE IF EXISTS price_history_v1")
+    cursor.execute("""
+        CREATE TABLE price_history_v1 (
+            coin_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            price REAL NOT NULL,
+            PRIMARY KEY (coin_id, ts)
+        ) WITHOUT ROWID
+    """)
+
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'price_history'"
+    )
+    if cursor.fetchone():
+        # 迁移旧数据，分批转换时间格式
+        read_cursor = cursor.connection.cursor()
+        read_cursor.execute("SELECT coin, price, timestamp FROM price_history")
+        migrated = 0
+        skipped = 0
+        while True:
+            rows = read_cursor.fetchmany(5000)
+            if not rows:
+                break
+            converted = []
+            for coin, price, timestamp in rows:
+                try:
+                    ts = _to_epoch_ms(datetime.fromisoformat(timestamp))
+                except (TypeError, ValueError, OverflowError, OSError):
+                    skipped += 1
+                    continue
+                converted.append((_get_coin_id(cursor, coin), ts, price))
+            cursor.executemany(
+                "INSERT OR REPLACE INTO price_history_v1 (coin_id, ts, price) VALUES (?, ?, ?)",
+                converted,
+            )
+            migrated += len(converted)
+        cursor.execute("DROP TABLE price_history")
+        logger.info(f"[Database] 已迁移 {migrated} 条价格历史记录到新表结构")
+        if skipped:
+            logger.warning(f"[Database] 跳过 {skipped} 条时间格式无法解析的价格历史记录")
+
+    cursor.execute("ALTER TABLE price_history_v1 RENAME TO price_history")
+
+
+def _migrate_v2(cursor: sqlite3.Cursor):
+    """v2: 新增降采样K线表（见 price_retention）"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS price_candles (
+            coin_id INTEGER NOT NULL,
+            resolution INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (coin_id, resolution, ts)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migrate_v3(cursor: sqlite3.Cursor):
+    """v3: K线记录开盘和收盘价格的时间，迟到的源数据可与已有K线合并
+
+    已有K线按开盘在周期起点、收盘在周期终点处理
+    """
+    cursor.execute("ALTER TABLE price_candles ADD COLUMN open_ts INTEGER")
+    cursor.execute("ALTER TABLE price_candles ADD COLUMN close_ts INTEGER")
+    cursor.execute("UPDATE price_candles SET open_ts = ts, close_ts = ts + resolution - 1")
+
+
+# 数据库结构迁移列表: (目标版本, 迁移函数)
+_MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+]
+
+
+def _migrate_database(cursor: sqlite3.Cursor):
+    """按版本顺序执行未完成的数据库结构迁移
+
+    每个迁移和版本号更新在一个显式事务中执行（sqlite3 模块不会为 DDL 自动开启事务），
+    失败时回滚，数据库保持在上一个版本，下次启动重新迁移。
+    """
+    conn = cursor.connection
+    version = _get_schema_version(cursor)
+    for target_version, migrate in _MIGRATIONS:
+        if version >= target_version:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        cursor.execute("BEGIN")
+        try:
+            migrate(cursor)
+            _set_schema_version(cursor, target_version)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            # 回滚后迁移中分配的币种ID无效
+            _coin_ids.clear()
+            raise
+        version = target_version
+        logger.info(f"[Database] 数据库结构已升级到 v{target_version}")
+
+
+def _get_coin_id(cursor: sqlite3.Cursor, coin: str) -> int:
+    """获取币种的整数ID，不存在时分配新ID"""
+    coin_id = _coin_ids.get(coin)
+    if coin_id is not None:
+        return coin_id
+    cursor.execute("INSERT OR IGNORE INTO price_coins (coin) VALUES (?)", (coin,))
+    cursor.execute("SELECT coin_id FROM price_coins WHERE coin = ?", (coin,))
+    coin_id = cursor.fetchone()[0]
+    _coin_ids[coin] = coin_id
+    return coin_id
+
+
+def _to_epoch_ms(dt: datetime) -> int:
+    """datetime 转毫秒时间戳（无时区时按本地时间）"""
+    return int(dt.timestamp() * 1000)
+
+
+@timed("bi_db_seconds")
 def add_price_record(coin: str, price: float, timestamp: datetime | None = None):
-    """添加价格记录到数据库"""
+    """添加价格记录到数据库（同时写入最近价格环形缓冲区）"""
     global DB_FILE
     if DB_FILE is None:
         return
     if timestamp is None:
-        timestamp = datetime.now()
+        timestamp = _clock.now()
+    ts = _to_epoch_ms(timestamp)
+    if _price_batch is not None:
+        _price_batch.append((coin, ts, price))
+        _price_ring.append(coin, ts, price)
+        if len(_price_batch) >= PRICE_BATCH_SIZE:
+            _flush_price_batch()
+        return
     try:
         conn = sqlite3.connect(str(DB_FILE))
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO price_history (coin, price, timestamp) VALUES (?, ?, ?)",
-            (coin, price, timestamp.isoformat()),
+            "INSERT OR REPLACE INTO price_history (coin_id, ts, price) VALUES (?, ?, ?)",
+            (_get_coin_id(cursor, coin), ts, price),
         )
         conn.commit()
         conn.close()
     except Exception as e:
         logger.error(f"[Database] 添加价格记录失败: {e}")
+        return
+    _price_ring.append(coin, ts, price)
+
+
+def _flush_price_batch():
+    """把缓冲的价格记录在一个事务中写入数据库"""
+    global _price_batch
+    if not _price_batch or DB_FILE is None:
+        return
+    rows, _price_batch = _price_batch, []
+    try:
+        conn = sqlite3.connect(str(DB_FILE))
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO price_history (coin_id, ts, price) VALUES (?, ?, ?)",
+            [(_get_coin_id(cursor, coin), ts, price) for coin, ts, price in rows],
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"[Database] 批量写入价格记录失败: {e}")
+
+
+@contextmanager
+def batched_price_records():
+    """代码块内的 add_price_record 先写入内存，每 PRICE_BATCH_SIZE 条和结束时批量写入数据库"""
+    global _price_batch
+    if _price_batch is not None:
+        # 已在批量模式中
+        yield
+        return
+    _price_batch = []
+    try:
+        yield
+    finally:
+        _flush_price_batch()
+        _price_batch = None
+
+
+def _warm_price_ring():
+    """从数据库加载每个币种最近的价格记录到环形缓冲区"""
+    _price_ring.clear()
+    for coin in COINS:
+        timestamps, prices = get_price_series(coin, limit=_price_ring.capacity)
+        _price_ring.extend(coin, timestamps, prices)
+    logger.info(
+        f"[Database] 最近价格缓冲区已预热: 每个币种 {_price_ring.capacity} 条，"
+        f"约 {_price_ring.memory_bytes() / 1024:.1f} KB"
+    )
 
 
 # ==================== 合约数据库操作函数 ====================
 
 
+@timed("bi_db_seconds")
 def add_contract_position(position: dict) -> bool:
     """添加合约持仓到数据库"""
     global DB_FILE
@@ -207,6 +512,7 @@ def add_contract_position(position: dict) -> bool:
         return False
 
 
+@timed("bi_db_seconds")
 def get_contract_positions(user_id: str) -> list[dict]:
     """从数据库获取用户的合约持仓"""
     global DB_FILE
@@ -214,39 +520,41 @@ def get_contract_positions(user_id: str) -> list[dict]:
         return []
     try:
         conn = sqlite3.connect(str(DB_FILE))
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT position_id, coin, direction, amount, entry_price, leverage, margin, liquidation_price, opened_at
-            FROM contract_positions
-            WHERE user_id = ? AND status = 'open'
-        """,
-            (user_id,),
-        )
-        rows = cursor.fetchall()
+        positions = _select_contract_positions(conn.cursor(), user_id)
         conn.close()
-
-        positions = []
-        for row in rows:
-            positions.append(
-                {
-                    "position_id": row[0],
-                    "coin": row[1],
-                    "direction": row[2],
-                    "amount": row[3],
-                    "entry_price": row[4],
-                    "leverage": row[5],
-                    "margin": row[6],
-                    "liquidation_price": row[7],
-                    "opened_at": datetime.fromisoformat(row[8]),
-                }
-            )
         return positions
     except Exception as e:
         logger.error(f"[Database] 获取合约持仓失败: {e}")
         return []
 
 
+def _select_contract_positions(cursor: sqlite3.Cursor, user_id: str) -> list[dict]:
+    """用已打开的游标查询用户的合约持仓（账户缓存加载账户时复用其连接）"""
+    cursor.execute(
+        """
+        SELECT position_id, coin, direction, amount, entry_price, leverage, margin, liquidation_price, opened_at
+        FROM contract_positions
+        WHERE user_id = ? AND status = 'open'
+    """,
+        (user_id,),
+    )
+    return [
+        {
+            "position_id": row[0],
+            "coin": row[1],
+            "direction": row[2],
+            "amount": row[3],
+            "entry_price": row[4],
+            "leverage": row[5],
+            "margin": row[6],
+            "liquidation_price": row[7],
+            "opened_at": datetime.fromisoformat(row[8]),
+        }
+        for row in cursor.fetchall()
+    ]
+
+
+@timed("bi_db_seconds")
 def close_contract_position(
     position_id: str, close_price: float, pnl: float, close_fee: float
 ) -> bool:
@@ -317,6 +625,7 @@ def close_contract_position(
         return False
 
 
+@timed("bi_db_seconds")
 def add_contract_liquidation(position: dict, current_price: float) -> bool:
     """记录爆仓"""
     global DB_FILE
@@ -341,7 +650,7 @@ def add_contract_liquidation(position: dict, current_price: float) -> bool:
                 position["entry_price"],
                 current_price,
                 position["margin"],
-                datetime.now().isoformat(),
+                _clock.now().isoformat(),
             ),
         )
 
@@ -363,6 +672,7 @@ def add_contract_liquidation(position: dict, current_price: float) -> bool:
         return False
 
 
+@timed("bi_db_seconds")
 def add_contract_funding_payment(
     position_id: str,
     user_id: str,
@@ -391,7 +701,7 @@ def add_contract_funding_payment(
                 amount,
                 rate,
                 payment_type,
-                datetime.now().isoformat(),
+                _clock.now().isoformat(),
             ),
         )
         conn.commit()
@@ -402,6 +712,7 @@ def add_contract_funding_payment(
         return False
 
 
+@timed("bi_db_seconds")
 def get_all_open_positions() -> list[dict]:
     """获取所有未平仓的合约（用于爆仓检查）"""
     global DB_FILE
@@ -439,6 +750,7 @@ def get_all_open_positions() -> list[dict]:
         return []
 
 
+@timed("bi_db_seconds")
 def get_contract_history(user_id: str, limit: int = 5) -> list[dict]:
     """获取合约历史记录"""
     global DB_FILE
@@ -481,6 +793,7 @@ def get_contract_history(user_id: str, limit: int = 5) -> list[dict]:
         return []
 
 
+@timed("bi_db_seconds")
 def get_contract_liquidations(user_id: str, limit: int = 5) -> list[dict]:
     """获取爆仓记录"""
     global DB_FILE
@@ -522,86 +835,141 @@ def get_contract_liquidations(user_id: str, limit: int = 5) -> list[dict]:
         return []
 
 
-def get_price_history(
+@timed("bi_db_seconds")
+def get_price_series(
     coin: str,
-    start_time: datetime | None = None,
-    end_time: datetime | None = None,
+    start_ms: int | None = None,
+    end_ms: int | None = None,
     limit: int | None = None,
-):
-    """从数据库获取价格历史
+) -> tuple[array, array]:
+    """从数据库获取价格历史（数组形式，不构造 datetime 对象）
 
     Args:
         coin: 币种名称
-        start_time: 开始时间
-        end_time: 结束时间
-        limit: 限制返回数量（按时间倒序）
+        start_ms: 开始时间（毫秒时间戳，含）
+        end_ms: 结束时间（毫秒时间戳，含）
+        limit: 限制返回数量（取最近的N条）
 
     Returns:
-        List[Dict]: 价格历史记录列表，每个记录包含 'timestamp' 和 'price'
+        (timestamps, prices): 按时间正序的 array('q') 毫秒时间戳和 array('d') 价格
     """
     global DB_FILE
+    # 窗口落在最近价格缓冲区内时不访问数据库
+    cached = _price_ring.window(coin, start_ms, end_ms, limit)
+    if cached is not None:
+        return cached
+
+    timestamps, prices = array("q"), array("d")
     if DB_FILE is None:
-        return []
+        return timestamps, prices
+    coin_id = _coin_ids.get(coin)
+    if coin_id is None:
+        return timestamps, prices
     try:
         conn = sqlite3.connect(str(DB_FILE))
         cursor = conn.cursor()
 
-        query = "SELECT timestamp, price FROM price_history WHERE coin = ?"
-        params = [coin]
-
-        if start_time:
-            query += " AND timestamp >= ?"
-            params.append(start_time.isoformat())
-        if end_time:
-            query += " AND timestamp <= ?"
-            params.append(end_time.isoformat())
+        query = "SELECT ts, price FROM price_history WHERE coin_id = ?"
+        params: list = [coin_id]
 
-        query += " ORDER BY timestamp DESC"
+        if start_ms is not None:
+            query += " AND ts >= ?"
+            params.append(start_ms)
+        if end_ms is not None:
+            query += " AND ts <= ?"
+            params.append(end_ms)
 
         if limit:
-            query += f" LIMIT {limit}"
+            query += " ORDER BY ts DESC LIMIT ?"
+            params.append(limit)
+        else:
+            query += " ORDER BY ts"
 
         cursor.execute(query, params)
         rows = cursor.fetchall()
+
+        if limit:
+            rows.reverse()  # 反转回时间正序
+
+        # 原始记录未覆盖的更早部分依次从列式归档、降采样K线读取
+        # （有 limit 时只从 before_ms 向前读取还缺的条数，不复制整段历史）
+        if not limit or len(rows) < limit:
+            before_ms = rows[0][0] if rows else (end_ms + 1 if end_ms is not None else None)
+            needed = limit - len(rows) if limit else None
+            archive_ts, archive_prices = _read_price_archive(coin, start_ms, before_ms, needed)
+
+            # 归档开始之前的部分只存在于K线中
+            candle_before = before_ms
+            archive = _price_retention.archive
+            archive_first = archive.first_timestamp(coin) if archive is not None else None
+            if archive_first is not None and (
+                candle_before is None or archive_first < candle_before
+            ):
+                candle_before = archive_first
+            if needed is None or len(archive_ts) < needed:
+                candle_ts, candle_prices = _price_retention.read_candles(
+                    cursor,
+                    coin_id,
+                    start_ms,
+                    candle_before,
+                    needed - len(archive_ts) if needed is not None else None,
+                )
+                timestamps.extend(candle_ts)
+                prices.extend(candle_prices)
+            timestamps.frombytes(archive_ts.cast("B"))
+            prices.frombytes(archive_prices.cast("B"))
         conn.close()
 
-        # 转换为与原来相同的格式
-        result = []
-        for row in reversed(rows):  # 反转回时间正序
-            result.append(
-                {"timestamp": datetime.fromisoformat(row[0]), "price": row[1]}
-            )
-        return result
+        for ts, price in rows:
+            timestamps.append(ts)
+            prices.append(price)
+        return timestamps, prices
     except Exception as e:
         logger.error(f"[Database] 获取价格历史失败: {e}")
-        return []
+        return array("q"), array("d")
 
 
-def cleanup_old_price_records(max_records: int = 10000):
-    """清理旧的价格记录，只保留最近N条"""
-    global DB_FILE
-    if DB_FILE is None:
-        return
-    try:
-        conn = sqlite3.connect(str(DB_FILE))
-        cursor = conn.cursor()
-        for coin in COINS:
-            cursor.execute(
-                """
-                DELETE FROM price_history
-                WHERE coin = ? AND id NOT IN (
-                    SELECT id FROM price_history
-                    WHERE coin = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                )
-            """,
-                (coin, coin, max_records),
-            )
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        logger.error(f"[Database] 清理旧记录失败: {e}")
+def _read_price_archive(
+    coin: str, start_ms: int | None, before_ms: int | None, limit: int | None = None
+) -> tuple[memoryview, memoryview]:
+    """从列式归档读取早于 before_ms 的记录（零拷贝切片），指定 limit 时只取最后 limit 条"""
+    archive = _price_retention.archive
+    end_ms = before_ms - 1 if before_ms is not None else None
+    if archive is None or (
+        start_ms is not None and end_ms is not None and start_ms > end_ms
+    ):
+        return memoryview(array("q")), memoryview(array("d"))
+    return archive.read(coin, start_ms, end_ms, limit)
+
+
+@timed("bi_db_seconds")
+def get_price_history(
+    coin: str,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+    limit: int | None = None,
+):
+    """从数据库获取价格历史
+
+    Args:
+        coin: 币种名称
+        start_time: 开始时间
+        end_time: 结束时间
+        limit: 限制返回数量（按时间倒序）
+
+    Returns:
+        List[Dict]: 价格历史记录列表，每个记录包含 'timestamp' 和 'price'
+    """
+    timestamps, prices = get_price_series(
+        coin,
+        start_ms=_to_epoch_ms(start_time) if start_time else None,
+        end_ms=_to_epoch_ms(end_time) if end_time else None,
+        limit=limit,
+    )
+    return [
+        {"timestamp": datetime.fromtimestamp(ts / 1000), "price": price}
+        for ts, price in zip(timestamps, prices)
+    ]
 
 
 # 虚拟币交易系统 - 轻量化版本
@@ -614,6 +982,8 @@ message_type: astrbot.core.platform MessageType
 session_id  : 群号/qq号
 """
 WHITELIST_SESSIONS: list[tuple[str, str, str]] = []
+# 白名单群聊的UMO字符串集合（由 set_whitelist_groups 预先计算，用于消息热路径查找）
+_whitelist_umos: frozenset[str] = frozenset()
 
 # 支持的收集品
 COINS = ["PIG", "GENSHIN", "DOGE", "SAKIKO", "WUWA", "SHIRUKU", "KIRINO"]
@@ -677,27 +1047,45 @@ EVENT_COOLDOWN = 1200  # 事件冷却时间20分钟
 last_event_time = 0  # 上次事件时间
 INACTIVITY_THRESHOLD = 3600  # 1小时无发言视为不活跃
 
+# 预生成的事件文案池（按币种、涨跌方向、幅度档位）
+_event_pool = EventTextPool(COINS)
+EVENT_POOL_REFILL_INTERVAL = 180  # 空闲时每3分钟补充一档文案
+_last_event_pool_refill = 0.0
+_event_pool_refilling = False
+_event_in_progress = False
+
 # 历史记录参数
 # 动态变化度存储
 current_volatility = dict(VOLATILITY_BASE)
 
 # 全局市场数据
 market_prices = INITIAL_PRICES.copy()
-last_update_time = time.time()
+last_update_time = _clock.time()
 
 # 流动性压力 {coin: pressure}，正值表示买盘压力（价格上涨），负值表示卖盘压力（价格下跌）
 liquidity_pressure: dict[str, float] = dict.fromkeys(COINS, 0.0)
 
+# 初始积分余额
+INITIAL_BALANCE = 10000.0
+
+# 用户账户存储（SQLite + LRU 缓存，首次访问时加载，淘汰时写回）
+_account_store = UserAccountStore(
+    COINS,
+    INITIAL_BALANCE,
+    capacity=DEFAULT_CACHE_CAPACITY,
+    positions_loader=_select_contract_positions,
+)
+
 # 用户资产数据
-user_assets: dict[str, dict] = {}  # {user_id: {coin: amount}}
-user_balance: dict[str, float] = {}  # {user_id: balance}
+user_assets: AccountView = AccountView(_account_store, "assets")  # {user_id: {coin: {amount, total_cost}}}
+user_balance: AccountView = AccountView(_account_store, "balance")  # {user_id: balance}
 
 # 挂单数据存储
 # {user_id: [{
 #     'order_id': str, 'type': 'buy'/'sell', 'coin': str, 'amount': float,
 #     'price': float, 'created_at': datetime, 'expires_at': datetime
 # }]}
-pending_orders: dict[str, list[dict]] = {}
+pending_orders: PendingOrdersView = PendingOrdersView(_account_store)
 ORDER_EXPIRY_HOURS = 1  # 挂单有效期1小时
 
 # 合约数据存储
@@ -709,11 +1097,11 @@ ORDER_EXPIRY_HOURS = 1  # 挂单有效期1小时
 #     }],
 #     'funding_payments': []  # 资金费记录
 # }}
-user_contracts: dict[str, dict] = {}
-last_funding_rate_time = time.time()
+user_contracts: AccountView = AccountView(_account_store, "contracts")
+last_funding_rate_time = _clock.time()
 
-# 群聊活跃度记录 {group_umo: last_message_timestamp}
-group_last_activity: dict[str, float] = {}
+# 群聊活跃度索引（按最后发言时间排序，附带每个群聊的消息速率）
+_group_activity = GroupActivityTracker(INACTIVITY_THRESHOLD, clock=lambda: _clock.time())
 
 # 后台定时更新控制
 market_update_thread = None
@@ -723,6 +1111,33 @@ market_update_lock = threading.Lock()
 # 插件上下文（用于调用LLM和发送消息）
 _plugin_context: Context | None = None
 
+# 事件群发调度器（并发发送、按平台限速、单群超时）
+_broadcaster = BroadcastDispatcher()
+
+# LLM调用网关（provider缓存、超时、并发和每小时调用次数上限）
+_llm_gateway = LLMGateway()
+EVENT_POOL_LLM_TIMEOUT = 60.0  # 后台预生成文案不影响事件播报，允许更长的超时
+
+
+def _collect_metrics():
+    """交易系统各组件已有的统计，导出指标时读取"""
+    samples = [
+        ("bi_accounts_resident", {}, _account_store.resident_count),
+        ("bi_active_groups", {}, len(_get_active_groups())),
+        ("bi_event_pool_size", {}, _event_pool.size()),
+        ("bi_event_pool_hits", {}, _event_pool.hits),
+        ("bi_event_pool_misses", {}, _event_pool.misses),
+        ("bi_broadcasts", {}, _broadcaster.broadcasts),
+        ("bi_broadcast_sent", {}, _broadcaster.sent),
+        ("bi_broadcast_failed", {}, _broadcaster.failed),
+    ]
+    for name, value in _llm_gateway.snapshot().items():
+        samples.append((f"bi_llm_{name}", {}, value))
+    return samples
+
+
+register_collector(_collect_metrics)
+
 
 def market_update_worker():
     """市场更新工作线程"""
@@ -733,26 +1148,45 @@ def market_update_worker():
             # 等待更新间隔
             time.sleep(UPDATE_INTERVAL)
 
-            # 执行市场更新
-            with market_update_lock:
-                update_volatility()
-                update_market_prices()
+            # 执行市场更新（各阶段耗时记录到 bi_tick_stage_seconds，预约了剖析时同时剖析）
+            with profile_scope("tick"), timer("bi_tick_seconds"):
+                with timer("bi_tick_stage_seconds", stage="prices"):
+                    with market_update_lock:
+                        update_volatility()
+                        update_market_prices()
 
-            logger.info(
-                f"[Market] 自动更新完成 - 时间: {datetime.now().strftime('%H:%M:%S')}"
-            )
+                hot_log("tick", "[Market] 自动更新完成 - 时间: {:%H:%M:%S}", datetime.now())
+
+                # 检查并执行挂单
+                with timer("bi_tick_stage_seconds", stage="pending_orders"):
+                    check_and_execute_pending_orders()
+
+                # 检查爆仓
+                with timer("bi_tick_stage_seconds", stage="liquidations"):
+                    check_and_execute_liquidations()
+
+                # 应用资金费率
+                with timer("bi_tick_stage_seconds", stage="funding"):
+                    apply_funding_rates()
+
+                # 尝试触发随机事件
+                with timer("bi_tick_stage_seconds", stage="random_event"):
+                    try_trigger_random_event()
 
-            # 检查并执行挂单
-            check_and_execute_pending_orders()
+                # 空闲时补充预生成的事件文案
+                with timer("bi_tick_stage_seconds", stage="event_pool"):
+                    _maybe_refill_event_pool()
 
-            # 检查爆仓
-            check_and_execute_liquidations()
+                # 价格历史降采样与清理（增量执行，有时间预算）
+                with timer("bi_tick_stage_seconds", stage="retention"):
+                    _price_retention.maybe_run(DB_FILE, RETENTION_TIME_BUDGET, _clock.time())
 
-            # 应用资金费率
-            apply_funding_rates()
+            # 输出热路径日志的汇总
+            log_summaries()
 
-            # 尝试触发随机事件
-            try_trigger_random_event()
+            # 写入指标快照
+            if METRICS_FILE is not None:
+                write_prometheus(METRICS_FILE)
 
         except Exception as e:
             logger.error(f"[Market] 自动更新出错: {e}")
@@ -765,9 +1199,22 @@ def update_group_activity(group_umo: str):
     Args:
         group_umo: 群聊UMO标识
     """
-    global group_last_activity
-    group_last_activity[group_umo] = time.time()
-    logger.debug(f"[Activity] 更新群聊活跃度: {group_umo}")
+    _group_activity.touch(group_umo)
+
+
+def record_group_message(group_umo: str) -> bool:
+    """记录一条群聊消息（on_message 热路径）
+
+    只做一次集合查找和一次活跃度索引更新，不解析UMO、不写日志。
+
+    Returns:
+        是否为白名单群聊
+    """
+    if group_umo not in _whitelist_umos:
+        return False
+    _group_activity.touch(group_umo)
+    hot_count("activity")
+    return True
 
 
 def _has_active_groups() -> bool:
@@ -777,35 +1224,12 @@ def _has_active_groups() -> bool:
         True: 至少有一个群聊在1小时内有发言
         False: 所有群聊都超过1小时无发言
     """
-    global WHITELIST_SESSIONS, group_last_activity, INACTIVITY_THRESHOLD
-
     if not WHITELIST_SESSIONS:
         return False
 
-    current_time = time.time()
-    active_groups = []
-    inactive_groups = []
-
-    for platform_id, message_type, session_id in WHITELIST_SESSIONS:
-        umo: MessageSession = MessageSession(
-            platform_id, MessageType(message_type), session_id
-        )
-        last_activity = group_last_activity.get(str(umo), 0)
-        time_since_last = current_time - last_activity
-
-        if time_since_last < INACTIVITY_THRESHOLD:
-            active_groups.append(str(umo))
-            logger.debug(
-                f"[Activity] 群聊活跃: {umo}, 上次发言: {time_since_last:.0f}秒前"
-            )
-        else:
-            inactive_groups.append(str(umo))
-            logger.debug(
-                f"[Activity] 群聊不活跃: {umo}, 上次发言: {time_since_last:.0f}秒前"
-            )
-
-    if active_groups:
-        logger.info(f"[Event] 发现 {len(active_groups)} 个活跃群聊，可以触发事件")
+    active_count = len(_get_active_groups())
+    if active_count:
+        logger.info(f"[Event] 发现 {active_count} 个活跃群聊，可以触发事件")
         return True
     else:
         logger.info("[Event] 所有白名单群聊都超过1小时无发言，跳过触发")
@@ -816,18 +1240,22 @@ def try_trigger_random_event():
     """尝试触发随机事件"""
     global last_event_time
 
-    current_time = time.time()
+    current_time = _clock.time()
 
     # 检查冷却时间
     if current_time - last_event_time < EVENT_COOLDOWN:
         return
 
+    # 上一个事件还在生成中，不再叠加新的事件线程
+    if _event_in_progress:
+        return
+
     # 检查是否有活跃群聊
     if not _has_active_groups():
         return
 
     # 15%概率触发
-    if random.random() >= EVENT_TRIGGER_PROBABILITY:
+    if _rng.random() >= EVENT_TRIGGER_PROBABILITY:
         logger.info("[Event] 本次未触发随机事件")
         return
 
@@ -840,19 +1268,74 @@ def try_trigger_random_event():
     logger.info("[Event] 触发随机事件，正在生成...")
 
 
+def _maybe_refill_event_pool():
+    """空闲时（没有正在生成的事件）在后台线程中补充一档事件文案"""
+    global _last_event_pool_refill, _event_pool_refilling
+
+    if not _plugin_context or not WHITELIST_SESSIONS:
+        return
+    if _event_pool_refilling or _event_in_progress:
+        return
+    now = _clock.time()
+    # 时钟被调回（切换回真实时钟）时不等待
+    if 0 <= now - _last_event_pool_refill < EVENT_POOL_REFILL_INTERVAL:
+        return
+    key = _event_pool.next_refill()
+    if key is None:
+        return
+
+    _last_event_pool_refill = now
+    _event_pool_refilling = True
+    threading.Thread(target=_refill_event_pool, args=(key,), daemon=True).start()
+
+
+def _refill_event_pool(key: tuple[str, str, str]):
+    """请求LLM批量生成一档事件文案（在独立线程中运行）"""
+    global _event_pool_refilling
+
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        prompt = build_batch_prompt(key, _event_pool.batch_size)
+        response = loop.run_until_complete(
+            _call_llm_simple(
+                prompt,
+                f"请生成{_event_pool.batch_size}条：",
+                timeout=EVENT_POOL_LLM_TIMEOUT,
+            )
+        )
+        loop.close()
+        if response:
+            added = _event_pool.add(key, response)
+            logger.info(
+                f"[Event] 预生成事件文案 {key}: 新增 {added} 条，池中共 {_event_pool.size()} 条"
+            )
+    except Exception as e:
+        logger.error(f"[Event] 预生成事件文案出错: {e}")
+    finally:
+        _event_pool_refilling = False
+
+
+def _roll_event() -> tuple[str, float]:
+    """随机选择事件的币种和涨跌幅（5%-20%）"""
+    target_coin = _rng.choice(COINS)
+    is_positive = _rng.choice([True, False])  # True=利好, False=利空
+    change_percent = _rng.uniform(0.05, 0.20) * (1 if is_positive else -1)
+    return target_coin, change_percent
+
+
 def _generate_and_apply_event():
     """生成并应用随机事件（在独立线程中运行）"""
+    global _event_in_progress
+
+    _event_in_progress = True
     try:
         # 创建新的事件循环
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
 
-        # 随机选择币种和事件类型
-        target_coin = random.choice(COINS)
-        is_positive = random.choice([True, False])  # True=利好, False=利空
-
-        # 执行价格变动（5%-20%涨跌幅）
-        change_percent = random.uniform(0.05, 0.20) * (1 if is_positive else -1)
+        # 随机选择币种和涨跌幅
+        target_coin, change_percent = _roll_event()
 
         # 运行异步事件生成
         event_message = loop.run_until_complete(
@@ -867,24 +1350,28 @@ def _generate_and_apply_event():
         loop.close()
     except Exception as e:
         logger.error(f"[Event] 生成随机事件出错: {e}")
+    finally:
+        _event_in_progress = False
 
 
 async def _generate_event_with_llm(coin: str, change_percent: float) -> str:
     """使用LLM生成随机事件并应用积分变动"""
     global _plugin_context
 
-    if not _plugin_context:
+    # 优先使用预生成的文案，无需等待LLM
+    pooled_text = _event_pool.take(coin, change_percent)
+
+    if not _plugin_context and not pooled_text:
         logger.warning("[Event] 插件Context未设置，无法调用LLM")
         return _apply_event_fallback(coin, change_percent)
 
     try:
         # 判断是增加还是减少
         is_positive = change_percent > 0
-        change_str = (
-            f"+{change_percent * 100:.1f}%"
-            if is_positive
-            else f"{change_percent * 100:.1f}%"
-        )
+
+        if pooled_text:
+            logger.info("[Event] 使用预生成的事件文案")
+            return _format_llm_event(coin, change_percent, pooled_text)
 
         # 构建提示词
         system_prompt = f"""你是一个游戏事件生成器。请为{coin}收集品生成一条趣味事件，解释为什么它的积分刚刚{"大幅提升" if is_positive else "大幅下降"}了{abs(change_percent) * 100:.1f}%。
@@ -906,14 +1393,7 @@ async def _generate_event_with_llm(coin: str, change_percent: float) -> str:
         llm_response = await _call_llm_simple(system_prompt, user_prompt)
 
         if llm_response:
-            # 应用积分变动
-            _apply_price_change(coin, change_percent)
-
-            # 添加积分变动信息
-            arrow = "📈" if is_positive else "📉"
-            old_price = market_prices[coin] / (1 + change_percent)
-            new_price = market_prices[coin]
-            return f"📰 【收集品快讯】{arrow}\n{llm_response.strip()}\n\n{coin}: {old_price:.2f} → {new_price:.2f} ({change_str})"
+            return _format_llm_event(coin, change_percent, llm_response)
         else:
             return _apply_event_fallback(coin, change_percent)
 
@@ -922,36 +1402,32 @@ async def _generate_event_with_llm(coin: str, change_percent: float) -> str:
         return _apply_event_fallback(coin, change_percent)
 
 
-async def _call_llm_simple(system_prompt: str, user_prompt: str) -> str:
-    """简单调用LLM"""
-    global _plugin_context
-
-    try:
-        if not _plugin_context:
-            logger.warning("[Event] 插件Context未设置")
-            return ""
-
-        # 使用默认UMO获取provider
-        umo = "_default_"
-        provider_id = await _plugin_context.get_current_chat_provider_id(umo=umo)
+def _format_llm_event(coin: str, change_percent: float, text: str) -> str:
+    """应用积分变动并生成事件播报"""
+    is_positive = change_percent > 0
+    change_str = (
+        f"+{change_percent * 100:.1f}%"
+        if is_positive
+        else f"{change_percent * 100:.1f}%"
+    )
 
-        if not provider_id:
-            logger.warning("[Event] 未找到可用的LLM provider")
-            return ""
+    # 应用积分变动
+    _apply_price_change(coin, change_percent)
 
-        # 调用LLM
-        llm_resp = await _plugin_context.llm_generate(
-            chat_provider_id=provider_id,
-            prompt=f"{system_prompt}\n\n{user_prompt}",
-        )
+    # 添加积分变动信息
+    arrow = "📈" if is_positive else "📉"
+    old_price = market_prices[coin] / (1 + change_percent)
+    new_price = market_prices[coin]
+    return f"📰 【收集品快讯】{arrow}\n{text.strip()}\n\n{coin}: {old_price:.2f} → {new_price:.2f} ({change_str})"
 
-        if llm_resp and llm_resp.completion_text:
-            return llm_resp.completion_text
-        return ""
 
-    except Exception as e:
-        logger.error(f"[Event] LLM调用异常: {e}")
-        return ""
+async def _call_llm_simple(
+    system_prompt: str, user_prompt: str, timeout: float | None = None
+) -> str:
+    """简单调用LLM，超时、出错或超出调用预算时返回空字符串"""
+    return await _llm_gateway.generate(
+        f"{system_prompt}\n\n{user_prompt}", timeout=timeout
+    )
 
 
 def _apply_price_change(coin: str, change_percent: float):
@@ -1007,9 +1483,9 @@ def _apply_event_fallback(coin: str, change_percent: float) -> str:
 
     # 根据涨跌选择事件模板
     if is_positive:
-        event_text = random.choice(positive_events).format(coin=coin)
+        event_text = _rng.choice(positive_events).format(coin=coin)
     else:
-        event_text = random.choice(negative_events).format(coin=coin)
+        event_text = _rng.choice(negative_events).format(coin=coin)
 
     old_price = market_prices[coin] / (1 + change_percent)
     new_price = market_prices[coin]
@@ -1020,23 +1496,16 @@ def _get_active_groups() -> list[str]:
     """获取当前活跃的群聊列表
 
     Returns:
-        1小时内有发言的群聊UMO列表
+        1小时内有发言的白名单群聊UMO列表，按最后发言时间从新到旧
     """
-    global WHITELIST_SESSIONS, group_last_activity, INACTIVITY_THRESHOLD
-
-    current_time = time.time()
-    active_groups = []
-
-    for platform_id, message_type, session_id in WHITELIST_SESSIONS:
-        umo: MessageSession = MessageSession(
-            platform_id, MessageType(message_type), session_id
-        )
+    return [umo for umo in _group_activity.active() if umo in _whitelist_umos]
 
-        last_activity = group_last_activity.get(str(umo), 0)
-        if current_time - last_activity < INACTIVITY_THRESHOLD:
-            active_groups.append(str(umo))
 
-    return active_groups
+def get_group_message_rates(groups: list[str] | None = None) -> dict[str, float]:
+    """群聊最近的消息速率（条/分钟），默认为所有活跃群聊"""
+    if groups is None:
+        groups = _get_active_groups()
+    return _group_activity.rates(groups)
 
 
 async def _send_event_to_groups(message: str):
@@ -1051,11 +1520,13 @@ async def _send_event_to_groups(message: str):
         logger.info("[Event] 白名单群聊为空，跳过发送")
         return
 
-    # 获取活跃群聊
+    # 获取活跃群聊，消息速率高的群聊优先发送（限速排队时先到达最热闹的群）
     active_groups = _get_active_groups()
     if not active_groups:
         logger.info("[Event] 没有活跃群聊，跳过发送")
         return
+    rates = get_group_message_rates(active_groups)
+    active_groups.sort(key=rates.__getitem__, reverse=True)
 
     try:
         from astrbot.api.event import MessageChain
@@ -1063,13 +1534,14 @@ async def _send_event_to_groups(message: str):
         # 构建消息链
         message_chain = MessageChain().message(message)
 
-        # 发送到每个活跃群聊
-        for group_umo in active_groups:
-            try:
-                await _plugin_context.send_message(group_umo, message_chain)
-                logger.info(f"[Event] 事件已发送到活跃群聊: {group_umo}")
-            except Exception as e:
-                logger.warning(f"[Event] 发送事件到群聊 {group_umo} 失败: {e}")
+        # 并发发送到所有活跃群聊
+        context = _plugin_context
+        result = await _broadcaster.broadcast(
+            active_groups,
+            lambda group_umo: context.send_message(group_umo, message_chain),
+        )
+        # 发送结果和失败的群聊已由 _broadcaster 记录
+        logger.debug(f"[Event] 事件已发送到 {result.sent}/{result.targets} 个活跃群聊")
 
     except Exception as e:
         logger.error(f"[Event] 发送事件消息失败: {e}")
@@ -1081,8 +1553,13 @@ def set_whitelist_groups(sessions: list[tuple[str, str, str]]):
     Args:
         sessions: 群聊UMO列表，格式: [(platform_id, message_type, session_id), ...]
     """
-    global WHITELIST_SESSIONS
+    global WHITELIST_SESSIONS, _whitelist_umos
     WHITELIST_SESSIONS = sessions
+    _whitelist_umos = frozenset(
+        str(MessageSession(platform_id, MessageType(message_type), session_id))
+        for platform_id, message_type, session_id in sessions
+    )
+    _group_activity.retain(_whitelist_umos)
     logger.info(f"[Event] 白名单群聊已设置: {WHITELIST_SESSIONS=}")
 
 
@@ -1100,6 +1577,7 @@ def set_plugin_context(context: Context):
     """设置插件上下文"""
     global _plugin_context
     _plugin_context = context
+    _llm_gateway.context = context
     logger.info("[Event] 插件上下文已设置")
 
 
@@ -1135,13 +1613,29 @@ def init_user(user_id: str):
             coin: {"amount": 0.0, "total_cost": 0.0} for coin in COINS
         }
     if user_id not in user_balance:
-        user_balance[user_id] = 10000.0  # 初始资金10000
+        user_balance[user_id] = INITIAL_BALANCE  # 初始资金10000
     if user_id not in pending_orders:
         pending_orders[user_id] = []
     if user_id not in user_contracts:
         user_contracts[user_id] = {"positions": [], "funding_payments": []}
 
 
+def _pin_sender_account(func):
+    """命令执行期间固定发送者的账户在缓存中
+
+    命令先取得账户中嵌套结构的引用、修改后再 mark_dirty()，期间市场线程加载其他账户
+    可能把该账户淘汰，修改会落在已移出缓存的对象上而丢失。
+    """
+
+    @functools.wraps(func)
+    async def wrapper(event: AstrMessageEvent, *args, **kwargs):
+        with _account_store.pinned(str(event.get_sender_id())):
+            async for item in func(event, *args, **kwargs):
+                yield item
+
+    return wrapper
+
+
 def init_pending_orders(user_id: str):
     """初始化用户挂单列表"""
     if user_id not in pending_orders:
@@ -1155,16 +1649,21 @@ def create_order_id() -> str:
     return uuid.uuid4().hex[:12].upper()
 
 
+@timed("bi_db_seconds")
 def save_bi_data():
-    """保存所有数据到JSON文件（价格历史和合约数据已移至数据库）"""
+    """保存市场数据到JSON文件，并写回缓存中的用户账户（用户、价格历史和合约数据均在数据库中）"""
     global \
         market_prices, \
-        user_assets, \
-        user_balance, \
-        pending_orders, \
         current_volatility, \
         liquidity_pressure
 
+    # 写回缓存中修改过的用户账户，并释放账户缓存的数据库连接（下次访问时重新打开）
+    _account_store.flush()
+    _account_store.close()
+
+    # 写入预生成事件文案池尚未保存的变化
+    _event_pool.flush()
+
     if DATA_FILE is None:
         logger.warning("[Data] 数据文件路径未设置，跳过保存")
         return
@@ -1173,25 +1672,13 @@ def save_bi_data():
         # 确保数据目录存在
         DATA_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-        # 转换datetime对象为字符串
-        serializable_pending_orders = {}
-        for user_id, orders in pending_orders.items():
-            serializable_pending_orders[user_id] = []
-            for order in orders:
-                order_copy = order.copy()
-                order_copy["created_at"] = order_copy["created_at"].isoformat()
-                order_copy["expires_at"] = order_copy["expires_at"].isoformat()
-                serializable_pending_orders[user_id].append(order_copy)
-
-        # 合约数据已存储在数据库中，不再保存到JSON
+        # 用户资产、余额、挂单已存储在数据库中，不再保存到JSON
 
         data = {
             "market_prices": market_prices,
-            "user_assets": user_assets,
-            "user_balance": user_balance,
-            "pending_orders": serializable_pending_orders,
             "current_volatility": current_volatility,
             "liquidity_pressure": liquidity_pressure,
+            "dynamic_means": dynamic_means,
             "saved_at": datetime.now().isoformat(),
         }
 
@@ -1203,13 +1690,11 @@ def save_bi_data():
         logger.error(f"[Data] 保存数据失败: {e}")
 
 
+@timed("bi_db_seconds")
 def load_bi_data():
-    """从JSON文件加载数据（价格历史和合约数据从数据库读取）"""
+    """从JSON文件加载市场数据（用户账户在首次访问时从数据库加载）"""
     global \
         market_prices, \
-        user_assets, \
-        user_balance, \
-        pending_orders, \
         current_volatility, \
         liquidity_pressure
 
@@ -1229,28 +1714,9 @@ def load_bi_data():
         if "market_prices" in data:
             market_prices = data["market_prices"]
 
-        # 加载用户资产（只加载内存中不存在的用户数据）
-        if "user_assets" in data:
-            for user_id, assets in data["user_assets"].items():
-                if user_id not in user_assets:
-                    user_assets[user_id] = assets
-
-        # 加载用户余额（只加载内存中不存在的用户数据）
-        if "user_balance" in data:
-            for user_id, balance in data["user_balance"].items():
-                if user_id not in user_balance:
-                    user_balance[user_id] = balance
-
-        # 加载挂单（转换时间字符串，只加载内存中不存在的用户数据）
-        if "pending_orders" in data:
-            for user_id, orders in data["pending_orders"].items():
-                if user_id in pending_orders:
-                    continue  # 跳过已存在的用户
-                pending_orders[user_id] = []
-                for order in orders:
-                    order["created_at"] = datetime.fromisoformat(order["created_at"])
-                    order["expires_at"] = datetime.fromisoformat(order["expires_at"])
-                    pending_orders[user_id].append(order)
+        # 旧版数据文件中的用户数据，一次性迁移到数据库
+        if "user_assets" in data or "user_balance" in data:
+            _migrate_legacy_user_data(data)
 
         # 加载变化度
         if "current_volatility" in data:
@@ -1260,8 +1726,12 @@ def load_bi_data():
         if "liquidity_pressure" in data:
             liquidity_pressure = data["liquidity_pressure"]
 
-        # 合约数据已从数据库加载，不再从JSON加载
-        # 如果需要加载用户的合约数据，会在调用get_contract_positions时从数据库读取
+        # 加载动态均值（旧版数据文件中没有，沿用初始价格）
+        if "dynamic_means" in data:
+            dynamic_means.update(data["dynamic_means"])
+
+        # 用户账户和合约数据不在启动时加载
+        # 首次访问某个用户时才从数据库读取（见 bi_store.UserAccountStore）
 
         saved_time = data.get("saved_at", "未知")
         logger.info(f"[Data] 数据已从 {DATA_FILE} 加载 (保存时间: {saved_time})")
@@ -1269,96 +1739,202 @@ def load_bi_data():
         logger.error(f"[Data] 加载数据失败: {e}")
 
 
+def _migrate_legacy_user_data(data: dict):
+    """将旧版 bi_data.json 中的用户资产、余额、挂单迁移到数据库"""
+    accounts: dict[str, dict] = {}
+    user_ids = set(data.get("user_assets", {})) | set(data.get("user_balance", {}))
+    for user_id in user_ids:
+        assets = {coin: {"amount": 0.0, "total_cost": 0.0} for coin in COINS}
+        for coin, asset in data.get("user_assets", {}).get(user_id, {}).items():
+            if isinstance(asset, dict):
+                assets[coin] = asset
+        orders = []
+        for order in data.get("pending_orders", {}).get(user_id, []):
+            order["created_at"] = datetime.fromisoformat(order["created_at"])
+            order["expires_at"] = datetime.fromisoformat(order["expires_at"])
+            orders.append(order)
+        accounts[user_id] = {
+            "assets": assets,
+            "balance": data.get("user_balance", {}).get(user_id, INITIAL_BALANCE),
+            "orders": orders,
+        }
+
+    imported = _account_store.import_accounts(accounts)
+    logger.info(f"[Data] 已从旧版数据文件迁移 {imported} 个用户账户到数据库")
+
+
+def set_price_retention_hours(hours: float):
+    """设置原始价格记录保留时长（小时），更早的记录降采样为K线"""
+    _price_retention.raw_retention_ms = int(max(1.0, hours) * HOUR_MS)
+    logger.info(f"[Data] 原始价格记录保留时长: {hours}小时")
+
+
+def set_price_archive_enabled(enabled: bool):
+    """设置降采样前是否把原始记录写入列式归档"""
+    global _price_archive_enabled
+    _price_archive_enabled = enabled
+    if not enabled:
+        _price_retention.archive = None
+    elif _price_retention.archive is None and DB_FILE is not None:
+        _price_retention.archive = PriceArchive(DB_FILE.parent / "price_archive")
+
+
+def set_price_ring_capacity(capacity: int):
+    """设置每个币种在内存中缓存的最近价格条数（每条16字节）"""
+    _price_ring.clear(capacity)
+    if DB_FILE is not None:
+        _warm_price_ring()
+
+
+def set_broadcast_options(
+    concurrency: int | None = None,
+    timeout: float | None = None,
+    platform_rate: float | None = None,
+):
+    """设置事件群发的并发数、单群超时（秒）和每个平台每秒发送条数"""
+    _broadcaster.configure(
+        concurrency=concurrency, timeout=timeout, platform_rate=platform_rate
+    )
+
+
+def set_llm_options(
+    timeout: float | None = None,
+    max_inflight: int | None = None,
+    max_calls_per_hour: int | None = None,
+):
+    """设置LLM调用超时（秒）、同时调用数上限和每小时调用次数上限"""
+    if timeout is not None:
+        _llm_gateway.timeout = timeout
+    if max_inflight is not None:
+        _llm_gateway.max_inflight = max(1, max_inflight)
+    if max_calls_per_hour is not None:
+        _llm_gateway.max_calls_per_hour = max(0, max_calls_per_hour)
+
+
+def set_user_cache_size(size: int):
+    """设置常驻内存的用户账户数量上限"""
+    _account_store.set_capacity(size)
+    logger.info(f"[Data] 用户账户缓存上限: {_account_store.capacity}")
+
+
+def set_market_rng(seed: int | None = None):
+    """设置市场引擎的随机种子（None 表示使用系统随机源），同样的种子和起点得到同样的行情"""
+    global _rng
+    _rng = random.Random(seed)
+
+
+def set_catchup_max_ticks(ticks: int):
+    """设置停机补算最多生成的市场更新次数（0 表示不补算）"""
+    global CATCHUP_MAX_TICKS
+    CATCHUP_MAX_TICKS = max(0, ticks)
+
+
+def set_market_clock(clock: MarketClock | None = None):
+    """设置市场引擎使用的时钟（None 表示真实时间）"""
+    global _clock
+    _clock = clock or MarketClock()
+
+
 def check_and_execute_pending_orders():
     """检查并执行符合条件的挂单"""
     global pending_orders
 
-    current_time = datetime.now()
+    current_time = _clock.now()
 
-    for user_id, orders in list(pending_orders.items()):
-        if not orders:
-            continue
+    # 只加载有过期或已触发挂单的账户（其余账户在数据库中按价格筛掉，不进入缓存）
+    for user_id in _account_store.users_with_due_orders(market_prices, current_time):
+        with _account_store.pinned(user_id):
+            _process_due_orders(user_id, current_time)
 
-        # 清理过期订单
-        expired_orders = [o for o in orders if o["expires_at"] < current_time]
-        for order in expired_orders:
-            orders.remove(order)
-            logger.info(
-                f"[Order] 订单过期: {order['order_id']} ({order['type']} {order['coin']})"
-            )
 
-        # 检查可成交订单
-        remaining_orders = []
-        for order in orders:
-            coin = order["coin"]
-            current_price = get_coin_price(coin)
+def _process_due_orders(user_id: str, current_time: datetime):
+    """清理一个账户的过期挂单并成交已触发的挂单（调用方需固定该账户）"""
+    orders = pending_orders.get(user_id)
+    if not orders:
+        return
 
-            if order["type"] == "buy":
-                # 买入挂单: 市场价 <= 挂单价格时成交
-                if current_price <= order["price"]:
-                    # 检查资金是否足够
-                    total_cost = order["amount"] * order["price"]
-                    fee = total_cost * BUY_FEE
-                    total_with_fee = total_cost + fee
-
-                    if user_balance.get(user_id, 0) >= total_with_fee:
-                        # 执行买入
-                        user_balance[user_id] -= total_with_fee
-                        # 更新总成本
-                        current_amount = user_assets[user_id][coin]["amount"]
-                        current_total_cost = user_assets[user_id][coin]["total_cost"]
-                        new_amount = current_amount + order["amount"]
-                        new_total_cost = (
-                            current_total_cost + order["amount"] * order["price"]
-                        )
-                        user_assets[user_id][coin]["amount"] = new_amount
-                        user_assets[user_id][coin]["total_cost"] = new_total_cost
-                        logger.info(
-                            f"[Order] 买入挂单成交: {order['order_id']} {order['coin']} x{order['amount']} @ {order['price']}"
-                        )
-                    else:
-                        # 资金不足，销毁订单
-                        logger.warning(
-                            f"[Order] 买入挂单资金不足，销毁: {order['order_id']}"
-                        )
-                else:
-                    remaining_orders.append(order)
-            else:  # sell
-                # 卖出挂单: 市场价 >= 挂单价格时成交
-                if current_price >= order["price"]:
-                    # 检查币种是否足够
-                    if (
-                        user_assets[user_id].get(coin, {"amount": 0})["amount"]
-                        >= order["amount"]
-                    ):
-                        # 执行卖出
-                        total_income = order["amount"] * order["price"]
-                        fee = total_income * SELL_FEE
-                        net_income = total_income - fee
-
-                        # 按比例更新总成本
-                        current_amount = user_assets[user_id][coin]["amount"]
-                        current_total_cost = user_assets[user_id][coin]["total_cost"]
-                        if current_amount > 0:
-                            sell_ratio = order["amount"] / current_amount
-                            new_total_cost = current_total_cost * (1 - sell_ratio)
-                        else:
-                            new_total_cost = 0.0
-                        user_assets[user_id][coin]["amount"] -= order["amount"]
-                        user_assets[user_id][coin]["total_cost"] = new_total_cost
-                        user_balance[user_id] += net_income
-                        logger.info(
-                            f"[Order] 卖出挂单成交: {order['order_id']} {order['coin']} x{order['amount']} @ {order['price']}"
-                        )
-                    else:
-                        # 币种不足，销毁订单
-                        logger.warning(
-                            f"[Order] 卖出挂单币种不足，销毁: {order['order_id']}"
-                        )
-                else:
-                    remaining_orders.append(order)
+    # 清理过期订单
+    expired_orders = [o for o in orders if o["expires_at"] < current_time]
+    for order in expired_orders:
+        orders.remove(order)
+        logger.info(
+            f"[Order] 订单过期: {order['order_id']} ({order['type']} {order['coin']})"
+        )
+
+    # 检查可成交订单
+    remaining_orders = []
+    for order in orders:
+        current_price = get_coin_price(order["coin"])
+
+        # 买入挂单: 市场价 <= 挂单价格时成交；卖出挂单: 市场价 >= 挂单价格时成交
+        if order["type"] == "buy":
+            triggered = current_price <= order["price"]
+        else:
+            triggered = current_price >= order["price"]
+
+        if triggered:
+            _fill_pending_order(user_id, order)
+        else:
+            remaining_orders.append(order)
+
+    # 原地更新（账户已固定在缓存中，列表即缓存中的对象）
+    orders[:] = remaining_orders
+    _account_store.mark_dirty(user_id)
+
+
+def _fill_pending_order(user_id: str, order: dict):
+    """按挂单价格成交一个已触发的挂单，资金或币种不足时销毁"""
+    coin = order["coin"]
+
+    if order["type"] == "buy":
+        # 检查资金是否足够
+        total_cost = order["amount"] * order["price"]
+        fee = total_cost * BUY_FEE
+        total_with_fee = total_cost + fee
 
-        pending_orders[user_id] = remaining_orders
+        if user_balance.get(user_id, 0) >= total_with_fee:
+            # 执行买入
+            user_balance[user_id] -= total_with_fee
+            # 更新总成本
+            current_amount = user_assets[user_id][coin]["amount"]
+            current_total_cost = user_assets[user_id][coin]["total_cost"]
+            new_amount = current_amount + order["amount"]
+            new_total_cost = current_total_cost + order["amount"] * order["price"]
+            user_assets[user_id][coin]["amount"] = new_amount
+            user_assets[user_id][coin]["total_cost"] = new_total_cost
+            _account_store.mark_dirty(user_id)
+            logger.info(
+                f"[Order] 买入挂单成交: {order['order_id']} {order['coin']} x{order['amount']} @ {order['price']}"
+            )
+        else:
+            # 资金不足，销毁订单
+            logger.warning(f"[Order] 买入挂单资金不足，销毁: {order['order_id']}")
+    else:  # sell
+        # 检查币种是否足够
+        if user_assets[user_id].get(coin, {"amount": 0})["amount"] >= order["amount"]:
+            # 执行卖出
+            total_income = order["amount"] * order["price"]
+            fee = total_income * SELL_FEE
+            net_income = total_income - fee
+
+            # 按比例更新总成本
+            current_amount = user_assets[user_id][coin]["amount"]
+            current_total_cost = user_assets[user_id][coin]["total_cost"]
+            if current_amount > 0:
+                sell_ratio = order["amount"] / current_amount
+                new_total_cost = current_total_cost * (1 - sell_ratio)
+            else:
+                new_total_cost = 0.0
+            user_assets[user_id][coin]["amount"] -= order["amount"]
+            user_assets[user_id][coin]["total_cost"] = new_total_cost
+            user_balance[user_id] += net_income
+            _account_store.mark_dirty(user_id)
+            logger.info(
+                f"[Order] 卖出挂单成交: {order['order_id']} {order['coin']} x{order['amount']} @ {order['price']}"
+            )
+        else:
+            # 币种不足，销毁订单
+            logger.warning(f"[Order] 卖出挂单币种不足，销毁: {order['order_id']}")
 
 
 def update_volatility():
@@ -1369,7 +1945,7 @@ def update_volatility():
         base_volatility = VOLATILITY_BASE.get(coin, 0.02)
 
         # 在基础变化度上添加小幅度随机变化
-        random_change = random.uniform(
+        random_change = _rng.uniform(
             -VOLATILITY_RANDOM_RANGE, VOLATILITY_RANDOM_RANGE
         )
         new_volatility = current_volatility[coin] + random_change
@@ -1409,8 +1985,13 @@ def apply_liquidity_impact(coin: str, amount: float, is_buy: bool):
     # 限制压力范围
     liquidity_pressure[coin] = max(-0.5, min(0.5, liquidity_pressure[coin]))
 
-    logger.info(
-        f"[Liquidity] {coin} {'买入' if is_buy else '卖出'} {amount:.2f}，流动性压力: {liquidity_pressure[coin]:+.4f}"
+    hot_log(
+        "liquidity",
+        "[Liquidity] {} {} {:.2f}，流动性压力: {:+.4f}",
+        coin,
+        "买入" if is_buy else "卖出",
+        amount,
+        liquidity_pressure[coin],
     )
 
 
@@ -1452,7 +2033,7 @@ def update_market_prices():
         current_mean = dynamic_means[coin]
 
         # 2. 随机波动（无漂移）
-        random_change = random.uniform(-coin_volatility, coin_volatility)
+        random_change = _rng.uniform(-coin_volatility, coin_volatility)
 
         # 3. 均值回归：当价格偏离当前均值时，产生回归倾向
         # 计算偏离程度（正数表示高于均值，负数表示低于均值）
@@ -1473,7 +2054,7 @@ def update_market_prices():
         # 记录积分历史到数据库
         add_price_record(coin, market_prices[coin])
 
-    last_update_time = time.time()
+    last_update_time = _clock.time()
 
 
 def get_coin_price(coin: str) -> float:
@@ -1491,6 +2072,8 @@ def get_user_total_assets(user_id: str) -> float:
     return total
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_price(event: AstrMessageEvent, coin: str = ""):
     """查看积分价格"""
     # 不再主动更新价格，由后台线程负责
@@ -1517,6 +2100,9 @@ async def bi_price(event: AstrMessageEvent, coin: str = ""):
         yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
+@_pin_sender_account
 async def bi_buy(event: AstrMessageEvent, coin: str, amount: float, price: float = 0.0):
     """兑换积分
     price=0: 立即兑换
@@ -1555,6 +2141,7 @@ async def bi_buy(event: AstrMessageEvent, coin: str, amount: float, price: float
         new_total_cost = current_total_cost + amount * price
         user_assets[user_id][coin]["amount"] = new_amount
         user_assets[user_id][coin]["total_cost"] = new_total_cost
+        _account_store.mark_dirty(user_id)
 
         # 应用流动性影响
         apply_liquidity_impact(coin, amount, True)
@@ -1585,10 +2172,11 @@ async def bi_buy(event: AstrMessageEvent, coin: str, amount: float, price: float
             "coin": coin,
             "amount": amount,
             "price": price,
-            "created_at": datetime.now(),
-            "expires_at": datetime.now() + timedelta(hours=ORDER_EXPIRY_HOURS),
+            "created_at": _clock.now(),
+            "expires_at": _clock.now() + timedelta(hours=ORDER_EXPIRY_HOURS),
         }
         pending_orders[user_id].append(order)
+        _account_store.mark_dirty(user_id)
 
         result = "📋 预约单创建成功！\n"
         result += "━━━━━━━━━━━━━━\n"
@@ -1604,6 +2192,9 @@ async def bi_buy(event: AstrMessageEvent, coin: str, amount: float, price: float
         yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
+@_pin_sender_account
 async def bi_sell(
     event: AstrMessageEvent, coin: str, amount: float, price: float = 0.0
 ):
@@ -1647,6 +2238,7 @@ async def bi_sell(
         user_assets[user_id][coin]["amount"] -= amount
         user_assets[user_id][coin]["total_cost"] = new_total_cost
         user_balance[user_id] += net_income
+        _account_store.mark_dirty(user_id)
 
         # 应用流动性影响
         apply_liquidity_impact(coin, amount, False)
@@ -1677,10 +2269,11 @@ async def bi_sell(
             "coin": coin,
             "amount": amount,
             "price": price,
-            "created_at": datetime.now(),
-            "expires_at": datetime.now() + timedelta(hours=ORDER_EXPIRY_HOURS),
+            "created_at": _clock.now(),
+            "expires_at": _clock.now() + timedelta(hours=ORDER_EXPIRY_HOURS),
         }
         pending_orders[user_id].append(order)
+        _account_store.mark_dirty(user_id)
 
         result = "📋 回收预约单创建成功！\n"
         result += "━━━━━━━━━━━━━━\n"
@@ -1696,6 +2289,8 @@ async def bi_sell(
         yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_assets(event: AstrMessageEvent):
     """查看用户背包和预约"""
     user_id = str(event.get_sender_id())
@@ -1740,12 +2335,12 @@ async def bi_assets(event: AstrMessageEvent):
     # 显示预约单
     result += "\n📋 当前预约:\n"
     orders = pending_orders.get(user_id, [])
-    active_orders = [o for o in orders if o["expires_at"] > datetime.now()]
+    active_orders = [o for o in orders if o["expires_at"] > _clock.now()]
 
     if active_orders:
         for order in active_orders:
             current_price = get_coin_price(order["coin"])
-            time_left = order["expires_at"] - datetime.now()
+            time_left = order["expires_at"] - _clock.now()
             minutes_left = int(time_left.total_seconds() / 60)
 
             order_type = "兑换" if order["type"] == "buy" else "回收"
@@ -1777,6 +2372,8 @@ async def bi_assets(event: AstrMessageEvent):
     yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_coins(event: AstrMessageEvent):
     """查看支持收集品"""
     result = "🎁 可收集收集品\n"
@@ -1788,6 +2385,8 @@ async def bi_coins(event: AstrMessageEvent):
     yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_history(self, event: AstrMessageEvent, coin: str, timeframe: int = 10):
     """查询指定收集品历史积分（趋势图表图片）
 
@@ -1813,16 +2412,14 @@ async def bi_history(self, event: AstrMessageEvent, coin: str, timeframe: int =
     end_time = datetime.now().replace(second=0, microsecond=0)
     start_time = end_time - timedelta(minutes=total_minutes_needed)
 
-    # 从数据库获取历史数据
-    filtered_history = get_price_history(coin, start_time=start_time, end_time=end_time)
-    if not filtered_history:
+    # 从数据库获取历史数据（毫秒时间戳和价格数组，已按时间排序）
+    timestamps, prices = get_price_series(
+        coin, start_ms=_to_epoch_ms(start_time), end_ms=_to_epoch_ms(end_time)
+    )
+    if not timestamps:
         yield event.plain_result(f"❌ {coin} 暂无历史积分数据")
         return
 
-    if not filtered_history:
-        yield event.plain_result(f"❌ {coin} 在指定时间范围内暂无数据")
-        return
-
     current_price = get_coin_price(coin)
 
     # 按时间周期聚合数据，生成K线
@@ -1833,22 +2430,18 @@ async def bi_history(self, event: AstrMessageEvent, coin: str, timeframe: int =
         interval_end = end_time - timedelta(minutes=i * minutes_per_kline)
         interval_start = interval_end - timedelta(minutes=minutes_per_kline)
 
-        # 获取该时间区间内的所有价格记录
-        interval_records = [
-            record
-            for record in filtered_history
-            if interval_start <= record["timestamp"] < interval_end
-        ]
+        # 二分查找该时间区间 [start, end) 内的价格记录
+        lo = bisect_left(timestamps, _to_epoch_ms(interval_start))
+        hi = bisect_left(timestamps, _to_epoch_ms(interval_end))
 
-        if interval_records:
-            # 按时间排序
-            interval_records.sort(key=lambda x: x["timestamp"])
+        if lo < hi:
+            interval_prices = prices[lo:hi]
 
             # 计算OHLC
-            open_price = interval_records[0]["price"]  # 第一个价格作为开盘价
-            close_price = interval_records[-1]["price"]  # 最后一个价格作为收盘价
-            high_price = max(r["price"] for r in interval_records)  # 最高价
-            low_price = min(r["price"] for r in interval_records)  # 最低价
+            open_price = interval_prices[0]  # 第一个价格作为开盘价
+            close_price = interval_prices[-1]  # 最后一个价格作为收盘价
+            high_price = max(interval_prices)  # 最高价
+            low_price = min(interval_prices)  # 最低价
 
             klines.append(
                 {
@@ -2024,6 +2617,8 @@ async def bi_history(self, event: AstrMessageEvent, coin: str, timeframe: int =
         yield event.plain_result("❌ 趋势图表生成失败，请稍后重试")
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_volatility(event: AstrMessageEvent):
     """查看收集品变化度信息（动态变化度）"""
     # 不再主动更新变化度，由后台线程负责
@@ -2065,6 +2660,101 @@ async def bi_volatility(event: AstrMessageEvent):
     yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
+async def bi_stats(event: AstrMessageEvent):
+    """查看插件运行指标（市场更新各阶段、命令、数据库、渲染和 MikuChat 接口的耗时）"""
+    result = "📈 插件运行指标\n"
+    result += "━━━━━━━━━━━━━━\n"
+    sections = [
+        ("⏱️ 市场更新", ("bi_tick_seconds", "bi_tick_stage_seconds")),
+        ("💬 命令", ("bi_command_seconds",)),
+        ("🗄️ 数据库", ("bi_db_seconds",)),
+        ("🖼️ 渲染", ("render_seconds",)),
+        ("🌐 MikuChat 接口", ("mikuchat_request_seconds",)),
+    ]
+    for title, prefixes in sections:
+        lines = format_stats(prefixes)
+        if lines:
+            result += f"\n{title}\n" + "\n".join(f"• {line}" for line in lines) + "\n"
+
+    llm = _llm_gateway.snapshot()
+    result += "\n🤖 LLM\n"
+    result += (
+        f"• 调用 {llm['calls']} 次，成功 {llm['successes']}，超时 {llm['timeouts']}，"
+        f"出错 {llm['errors']}，超出预算 {llm['rejected']}\n"
+    )
+    result += "\n📣 群发\n"
+    result += (
+        f"• 广播 {_broadcaster.broadcasts} 次，发送 {_broadcaster.sent} 条，失败 {_broadcaster.failed} 条\n"
+        f"• 活跃群聊 {len(_get_active_groups())} 个，预生成文案 {_event_pool.size()} 条\n"
+    )
+    if METRICS_FILE is not None:
+        result += f"\n完整指标每次市场更新后写入 {METRICS_FILE.name}"
+
+    yield event.plain_result(result)
+
+
+_PROFILE_EXCLUDED = {"bi_start_market_updates", "bi_stop_market_updates", "bi_profile", "bi_memory"}
+
+
+def _profile_targets() -> list[str]:
+    """可剖析的目标：市场更新和所有 bi_* 命令"""
+    commands = [n for n in __all__ if n.startswith("bi_") and n not in _PROFILE_EXCLUDED]
+    return ["tick", *commands]
+
+
+@timed("bi_command_seconds", key="command")
+async def bi_profile(
+    event: AstrMessageEvent, target: str = "status", count: int = 1, mode: str = "cprofile"
+):
+    """预约剖析市场更新或命令（需要管理员权限）
+
+    Args:
+        target: "tick"、bi_* 命令名、"status" 查看预约、"off" 取消全部预约
+        count: 剖析接下来几次执行
+        mode: "cprofile" 或 "sample"（调用栈采样）
+    """
+    target = target.lower()
+    if target == "status":
+        entries = armed()
+        if not entries:
+            yield event.plain_result("🔍 当前没有预约的剖析")
+            return
+        result = "🔍 已预约的剖析:\n"
+        for name, (profile_mode, remaining) in entries.items():
+            result += f"• {name}: 剩余 {remaining} 次（{profile_mode}）\n"
+        yield event.plain_result(result.rstrip())
+        return
+    if target == "off":
+        disarm()
+        yield event.plain_result("✅ 已取消全部剖析预约")
+        return
+
+    targets = _profile_targets()
+    if target not in targets:
+        yield event.plain_result(f"❌ 不支持的剖析目标: {target}\n可选: {', '.join(targets)}")
+        return
+    try:
+        message = arm(target, count, mode.lower())
+    except ValueError as e:
+        yield event.plain_result(f"❌ {e}")
+        return
+    yield event.plain_result(f"✅ {message}\n结果保存在插件数据目录的 profiles 下")
+
+
+@timed("bi_command_seconds", key="command")
+async def bi_memory(event: AstrMessageEvent, action: str = ""):
+    """记录内存快照（需要管理员权限），action 为 "stop" 时停止追踪"""
+    if action.lower() == "stop":
+        stop_memory_tracing()
+        yield event.plain_result("✅ 已停止追踪内存分配")
+        return
+    yield event.plain_result(f"🧠 内存快照\n{memory_snapshot()}")
+
+
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_help(event: AstrMessageEvent):
     """查看所有命令帮助"""
     result = "📈 积分收集系统帮助\n"
@@ -2097,6 +2787,9 @@ async def bi_help(event: AstrMessageEvent):
 
     result += "\n❓ 帮助命令:\n"
     result += "• bi_help - 查看此帮助信息\n"
+    result += "• bi_stats - 查看插件运行指标（需要管理员权限）\n"
+    result += "• bi_profile [目标] [次数] [cprofile/sample] - 剖析市场更新或命令（需要管理员权限）\n"
+    result += "• bi_memory [stop] - 记录内存快照（需要管理员权限）\n"
 
     result += "\n📊 系统特性:\n"
     result += "• 积分每60秒自动变化一次\n"
@@ -2111,6 +2804,8 @@ async def bi_help(event: AstrMessageEvent):
     yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_reset(event: AstrMessageEvent):
     """重置用户背包（需要管理员权限）"""
     user_id = str(event.get_sender_id())
@@ -2124,9 +2819,11 @@ async def bi_reset(event: AstrMessageEvent):
 
     # 重置用户数据
     if user_id in user_assets:
-        user_assets[user_id] = dict.fromkeys(COINS, 0.0)
+        user_assets[user_id] = {
+            coin: {"amount": 0.0, "total_cost": 0.0} for coin in COINS
+        }
     if user_id in user_balance:
-        user_balance[user_id] = 10000.0
+        user_balance[user_id] = INITIAL_BALANCE
     if user_id in pending_orders:
         pending_orders[user_id] = []
     if user_id in user_contracts:
@@ -2249,6 +2946,11 @@ def calculate_funding_rate(coin: str) -> float:
             else:
                 total_short_value += position_value
 
+    return _funding_rate_for(total_long_value, total_short_value)
+
+
+def _funding_rate_for(total_long_value: float, total_short_value: float) -> float:
+    """按多空持仓价值计算资金费率"""
     # 如果没有持仓，返回0
     if total_long_value == 0 and total_short_value == 0:
         return 0.0
@@ -2272,7 +2974,7 @@ def apply_funding_rates():
     """应用资金费率到所有仓位"""
     global user_balance, last_funding_rate_time
 
-    current_time = time.time()
+    current_time = _clock.time()
     if current_time - last_funding_rate_time < CONTRACT_FUNDING_RATE_INTERVAL:
         return
 
@@ -2314,11 +3016,442 @@ def apply_funding_rates():
                 position_id, user_id, coin, funding_fee, funding_rate, payment_type
             )
 
-            logger.info(
-                f"[Funding] 用户 {user_id} {payment_type}资金费 {funding_fee:.2f} ({funding_rate * 100:+.4f}%)"
+            hot_log(
+                "funding",
+                "[Funding] 用户 {} {}资金费 {:.2f} ({:+.4f}%)",
+                user_id,
+                payment_type,
+                funding_fee,
+                funding_rate * 100,
+            )
+
+
+# ==================== 离线快进 ====================
+
+
+def _simulate_random_event():
+    """快进时的随机事件：与 try_trigger_random_event 相同的冷却和概率，只应用价格变动（不生成文案、不群发）"""
+    global last_event_time
+
+    current_time = _clock.time()
+    if current_time - last_event_time < EVENT_COOLDOWN:
+        return
+    if _rng.random() >= EVENT_TRIGGER_PROBABILITY:
+        return
+    last_event_time = current_time
+    _apply_price_change(*_roll_event())
+
+
+def fast_forward(
+    ticks: int,
+    step: float | None = None,
+    seed: int | None = None,
+    start: float | None = None,
+    settle: bool = False,
+    events: bool = False,
+) -> dict:
+    """在模拟时钟上连续执行 ticks 次市场更新，不等待，价格记录批量写入数据库
+
+    用于可复现的基准、调整均值回归/流动性参数，以及生成历史数据集。
+    市场更新线程运行时不能快进；资金费和随机事件的计时在快进期间以模拟起点为准，结束后恢复。
+
+    Args:
+        ticks: 市场更新次数
+        step: 相邻两次更新之间的模拟时间（秒），默认 UPDATE_INTERVAL
+        seed: 随机种子，指定时本次快进使用独立的 random.Random(seed)，结束后恢复原来的随机数生成器
+        start: 模拟起点（秒级时间戳），默认使最后一次更新落在当前时间
+        settle: 每次更新后检查挂单、爆仓和资金费（要访问数据库，慢很多）
+        events: 按冷却时间和触发概率模拟随机事件的价格变动
+
+    Returns:
+        {"ticks", "start", "end", "elapsed", "ticks_per_second"}
+    """
+    global _rng, last_funding_rate_time, last_event_time
+
+    if market_update_running:
+        raise RuntimeError("市场更新线程运行中，不能快进")
+
+    step = UPDATE_INTERVAL if step is None else step
+    now = _clock.time()
+    if start is None:
+        start = now - ticks * step
+    clock = SimulatedClock(start)
+    previous_clock, previous_rng = _clock, _rng
+    previous_timers = (last_funding_rate_time, last_event_time)
+    set_market_clock(clock)
+    if seed is not None:
+        set_market_rng(seed)
+    # 资金费和事件冷却的计时平移到模拟起点（保持距上次结算/事件的间隔），结束后恢复
+    last_funding_rate_time = start - (now - last_funding_rate_time)
+    last_event_time = start - (now - last_event_time)
+
+    started = time.perf_counter()
+    try:
+        with batched_price_records():
+            for _ in range(ticks):
+                clock.advance(step)
+                with market_update_lock:
+                    update_volatility()
+                    update_market_prices()
+                if settle:
+                    check_and_execute_pending_orders()
+                    check_and_execute_liquidations()
+                    apply_funding_rates()
+                if events:
+                    _simulate_random_event()
+    finally:
+        set_market_clock(previous_clock)
+        if seed is not None:
+            _rng = previous_rng
+        last_funding_rate_time, last_event_time = previous_timers
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "ticks": ticks,
+        "start": start,
+        "end": clock.time(),
+        "elapsed": elapsed,
+        "ticks_per_second": ticks / elapsed if elapsed > 0 else 0.0,
+    }
+    logger.info(
+        f"[Market] 快进 {ticks} 次更新（模拟 {ticks * step / 3600:.1f} 小时），"
+        f"耗时 {elapsed:.2f}秒，{result['ticks_per_second']:.0f} 次/秒"
+    )
+    return result
+
+
+# ==================== 停机补算 ====================
+
+CATCHUP_MAX_TICKS = 10080  # 停机补算最多生成的市场更新次数（每分钟一次约7天）
+
+
+class _GapPath:
+    """停机期间一个币种的价格路径，按需构建前缀最低/最高价，用二分查找首次触及某个价格的更新"""
+
+    __slots__ = ("prices", "_lows", "_highs")
+
+    def __init__(self, prices: list[float]):
+        self.prices = prices
+        self._lows: list[float] | None = None
+        self._highs: list[float] | None = None
+
+    def first_at_or_below(self, price: float) -> int | None:
+        if self._lows is None:
+            # 前缀最低价单调不增，取负后可以二分
+            self._lows = [-p for p in accumulate(self.prices, min)]
+        index = bisect_left(self._lows, -price)
+        return index if index < len(self.prices) else None
+
+    def first_at_or_above(self, price: float) -> int | None:
+        if self._highs is None:
+            self._highs = list(accumulate(self.prices, max))
+        index = bisect_left(self._highs, price)
+        return index if index < len(self.prices) else None
+
+
+def _last_price_record_ms() -> int | None:
+    """数据库中最近一条价格记录的时间戳（毫秒），没有记录时返回 None"""
+    try:
+        conn = sqlite3.connect(str(DB_FILE))
+        cursor = conn.cursor()
+        latest = None
+        for coin in COINS:
+            coin_id = _coin_ids.get(coin)
+            if coin_id is None:
+                continue
+            # 按 (coin_id, ts) 主键查找，不扫描全表
+            cursor.execute("SELECT MAX(ts) FROM price_history WHERE coin_id = ?", (coin_id,))
+            ts = cursor.fetchone()[0]
+            if ts is not None and (latest is None or ts > latest):
+                latest = ts
+        conn.close()
+        return latest
+    except Exception as e:
+        logger.error(f"[Database] 读取最近价格记录失败: {e}")
+        return None
+
+
+def _simulate_gap_prices(ticks: int) -> tuple[dict[str, _GapPath], dict[str, tuple]]:
+    """逐币种一次生成 ticks 次市场更新的价格路径
+
+    模型与 update_volatility + update_market_prices 相同，但每个币种在一个局部变量循环中算完，
+    不写数据库、不修改全局状态。
+
+    Returns:
+        ({币种: 价格路径}, {币种: (变化度, 动态均值, 流动性压力)} 补算结束时的状态)
+    """
+    keep = 1 - LIQUIDITY_DECAY_RATE  # 流动性压力每次更新向0衰减
+    uniform = _rng.uniform
+    paths, states = {}, {}
+    for coin in COINS:
+        base_volatility = VOLATILITY_BASE.get(coin, 0.02)
+        min_volatility = base_volatility * VOLATILITY_MIN_RATIO
+        max_volatility = base_volatility * VOLATILITY_MAX_RATIO
+        growth = INITIAL_PRICES[coin] * MEAN_GROWTH_RATE
+        volatility = current_volatility[coin]
+        mean = dynamic_means[coin]
+        pressure = liquidity_pressure.get(coin, 0.0)
+        price = market_prices[coin]
+        prices = []
+        for _ in range(ticks):
+            volatility = max(
+                min_volatility,
+                min(
+                    volatility + uniform(-VOLATILITY_RANDOM_RANGE, VOLATILITY_RANDOM_RANGE),
+                    max_volatility,
+                ),
+            )
+            pressure *= keep
+            mean += growth
+            change = (
+                uniform(-volatility, volatility)
+                - (price - mean) / mean * MEAN_REVERSION_STRENGTH
+                + pressure
+            )
+            price = max(0.01, price * (1 + change))
+            prices.append(price)
+        paths[coin] = _GapPath(prices)
+        states[coin] = (volatility, mean, pressure)
+    return paths, states
+
+
+def _plan_gap_orders(
+    paths: dict[str, _GapPath], tick_ms: list[int], end: datetime
+) -> tuple[list[tuple[str, list[dict], list[dict]]], int]:
+    """按价格路径找出停机期间会成交的挂单（在过期之前首次触价）和已过期的挂单
+
+    Returns:
+        ([(用户ID, 按触价顺序排列的成交挂单, 保留的挂单)], 过期挂单数)
+    """
+    plans = []
+    expired = 0
+    for user_id, orders in list(pending_orders.items()):
+        if not orders:
+            continue
+        fills, remaining = [], []
+        for order in orders:
+            path = paths.get(order["coin"])
+            index = None
+            if path is not None:
+                if order["type"] == "buy":
+                    index = path.first_at_or_below(order["price"])
+                else:
+                    index = path.first_at_or_above(order["price"])
+            if index is not None and tick_ms[index] <= _to_epoch_ms(order["expires_at"]):
+                fills.append((index, order))
+            elif order["expires_at"] >= end:
+                remaining.append(order)
+            else:
+                expired += 1
+                logger.info(
+                    f"[Order] 订单过期: {order['order_id']} ({order['type']} {order['coin']})"
+                )
+        fills.sort(key=lambda item: item[0])
+        plans.append((user_id, [order for _, order in fills], remaining))
+    return plans, expired
+
+
+def _plan_gap_positions(
+    paths: dict[str, _GapPath], tick_ms: list[int], last_s: float, step: float, end_s: float
+) -> tuple[list[tuple[dict, int]], list[tuple], dict[str, float], float | None]:
+    """按价格路径结算停机期间的爆仓和资金费
+
+    爆仓发生在首次触及爆仓价的那次更新；资金费从最后一条价格记录起每
+    CONTRACT_FUNDING_RATE_INTERVAL 秒结算一次，只计入当时未爆仓的仓位，按当时的价格计算。
+
+    Returns:
+        ([(仓位, 爆仓的更新序号)], [资金费记录行], {用户ID: 余额变动}, 最后一次资金费结算时间)
+    """
+    positions = [p for p in get_all_open_positions() if p["coin"] in paths]
+    ticks = len(tick_ms)
+
+    liquidations = []
+    liquidated_at: dict[str, int] = {}
+    for position in positions:
+        path = paths[position["coin"]]
+        if position["direction"] == "long":
+            index = path.first_at_or_below(position["liquidation_price"])
+        else:
+            index = path.first_at_or_above(position["liquidation_price"])
+        if index is not None:
+            liquidations.append((position, index))
+            liquidated_at[position["position_id"]] = index
+
+    by_coin: dict[str, list[dict]] = {}
+    for position in positions:
+        by_coin.setdefault(position["coin"], []).append(position)
+
+    funding_rows = []
+    balance_changes: dict[str, float] = {}
+    periods = int((end_s - last_s) // CONTRACT_FUNDING_RATE_INTERVAL)
+    for period in range(1, periods + 1):
+        paid_s = last_s + period * CONTRACT_FUNDING_RATE_INTERVAL
+        index = min(ticks - 1, max(0, int((paid_s - last_s) / step) - 1))
+        paid_at = datetime.fromtimestamp(paid_s).isoformat()
+        for coin, coin_positions in by_coin.items():
+            open_positions = [
+                p for p in coin_positions if liquidated_at.get(p["position_id"], ticks) > index
+            ]
+            price = paths[coin].prices[index]
+            total_long_value = sum(
+                p["amount"] * price for p in open_positions if p["direction"] == "long"
+            )
+            total_short_value = sum(
+                p["amount"] * price for p in open_positions if p["direction"] != "long"
+            )
+            funding_rate = _funding_rate_for(total_long_value, total_short_value)
+            if funding_rate == 0:
+                continue
+            for position in open_positions:
+                funding_fee = position["amount"] * price * funding_rate
+                if position["direction"] == "long":
+                    delta, payment_type = -funding_fee, "支付"
+                else:
+                    delta, payment_type = funding_fee, "接收"
+                user_id = position["user_id"]
+                balance_changes[user_id] = balance_changes.get(user_id, 0.0) + delta
+                funding_rows.append(
+                    (position["position_id"], user_id, coin, funding_fee, funding_rate, payment_type, paid_at)
+                )
+
+    last_funding = last_s + periods * CONTRACT_FUNDING_RATE_INTERVAL if periods else None
+    return liquidations, funding_rows, balance_changes, last_funding
+
+
+def catch_up_market(max_ticks: int | None = None) -> dict | None:
+    """补算停机期间缺失的市场更新（启动时在 load_bi_data 之后调用）
+
+    从数据库中最近一条价格记录到现在，每 UPDATE_INTERVAL 秒一次更新，最多 max_ticks 次，
+    超过时把这些更新均匀分布到整个停机时段。价格路径逐币种一次生成，
+    挂单成交/过期、爆仓和资金费按路径一次结算，不触发随机事件。
+    价格记录、爆仓和资金费记录在同一个事务中写入数据库，写入成功后才更新内存中的行情和账户
+    （余额和挂单随账户存储写回）。
+
+    Returns:
+        补算摘要，没有缺口或补算失败时返回 None
+    """
+    global last_update_time, last_funding_rate_time
+
+    max_ticks = CATCHUP_MAX_TICKS if max_ticks is None else max_ticks
+    if DB_FILE is None or max_ticks <= 0:
+        return None
+    last_ms = _last_price_record_ms()
+    if last_ms is None:
+        return None
+
+    last_s = last_ms / 1000
+    end_s = _clock.time()
+    missed = int((end_s - last_s) // UPDATE_INTERVAL)
+    if missed < 1:
+        return None
+    ticks = min(missed, max_ticks)
+    step = UPDATE_INTERVAL if ticks == missed else (end_s - last_s) / ticks
+    tick_ms = [int((last_s + (i + 1) * step) * 1000) for i in range(ticks)]
+    started = time.perf_counter()
+
+    with market_update_lock:
+        paths, states = _simulate_gap_prices(ticks)
+        order_plans, expired = _plan_gap_orders(paths, tick_ms, datetime.fromtimestamp(end_s))
+        liquidations, funding_rows, balance_changes, last_funding = _plan_gap_positions(
+            paths, tick_ms, last_s, step, end_s
+        )
+
+        try:
+            conn = sqlite3.connect(str(DB_FILE))
+            cursor = conn.cursor()
+            for coin, path in paths.items():
+                coin_id = _get_coin_id(cursor, coin)
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO price_history (coin_id, ts, price) VALUES (?, ?, ?)",
+                    [(coin_id, ts, price) for ts, price in zip(tick_ms, path.prices)],
+                )
+            cursor.executemany(
+                """
+                INSERT INTO contract_liquidations
+                (position_id, user_id, coin, direction, amount, entry_price, liquidation_price, margin_lost, liquidated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [
+                    (
+                        position["position_id"],
+                        position["user_id"],
+                        position["coin"],
+                        position["direction"],
+                        position["amount"],
+                        position["entry_price"],
+                        paths[position["coin"]].prices[index],
+                        position["margin"],
+                        datetime.fromtimestamp(tick_ms[index] / 1000).isoformat(),
+                    )
+                    for position, index in liquidations
+                ],
+            )
+            cursor.executemany(
+                "UPDATE contract_positions SET status = 'liquidated' WHERE position_id = ?",
+                [(position["position_id"],) for position, _ in liquidations],
             )
+            cursor.executemany(
+                """
+                INSERT INTO contract_funding
+                (position_id, user_id, coin, amount, rate, payment_type, paid_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+                funding_rows,
+            )
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"[Market] 停机补算写入数据库失败，跳过补算: {e}")
+            return None
+
+        for coin, path in paths.items():
+            volatility, mean, pressure = states[coin]
+            current_volatility[coin] = volatility
+            dynamic_means[coin] = mean
+            liquidity_pressure[coin] = pressure
+            market_prices[coin] = path.prices[-1]
+            _price_ring.extend(coin, tick_ms, path.prices)
+        last_update_time = tick_ms[-1] / 1000
+        if last_funding is not None:
+            last_funding_rate_time = last_funding
+
+    filled = 0
+    for user_id, fills, remaining in order_plans:
+        with _account_store.pinned(user_id):
+            for order in fills:
+                _fill_pending_order(user_id, order)
+            pending_orders[user_id] = remaining
+        filled += len(fills)
+    for position, _ in liquidations:
+        logger.info(
+            f"[Contract] 用户 {position['user_id']} 的 {position['position_id']} 仓位爆仓，损失保证金 {position['margin']:.2f}"
+        )
+    for user_id, delta in balance_changes.items():
+        init_user(user_id)
+        user_balance[user_id] += delta
+    _account_store.flush()
+
+    summary = {
+        "gap_seconds": end_s - last_s,
+        "ticks": ticks,
+        "step": step,
+        "orders_filled": filled,
+        "orders_expired": expired,
+        "liquidations": len(liquidations),
+        "funding_payments": len(funding_rows),
+        "elapsed": time.perf_counter() - started,
+    }
+    logger.info(
+        f"[Market] 停机补算: 缺口 {summary['gap_seconds'] / 3600:.1f} 小时，生成 {ticks} 次更新"
+        f"（间隔 {step:.0f}秒），成交挂单 {filled} 个，过期 {expired} 个，爆仓 {len(liquidations)} 个，"
+        f"资金费 {len(funding_rows)} 笔，耗时 {summary['elapsed']:.2f}秒"
+    )
+    return summary
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
+@_pin_sender_account
 async def bi_contract_open(
     event: AstrMessageEvent, coin: str, direction: str, amount: float, leverage: int = 0
 ):
@@ -2416,6 +3549,9 @@ async def bi_contract_open(
     yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
+@_pin_sender_account
 async def bi_contract_close(event: AstrMessageEvent, position_id: str):
     """平仓合约
 
@@ -2473,6 +3609,8 @@ async def bi_contract_close(event: AstrMessageEvent, position_id: str):
     yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_contract_positions(event: AstrMessageEvent):
     """查看当前合约持仓"""
     user_id = str(event.get_sender_id())
@@ -2548,6 +3686,8 @@ async def bi_contract_positions(event: AstrMessageEvent):
     yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_contract_history(event: AstrMessageEvent, limit: int = 5):
     """查看合约历史记录
 
@@ -2614,12 +3754,16 @@ async def bi_contract_history(event: AstrMessageEvent, limit: int = 5):
     yield event.plain_result(result)
 
 
+@timed("bi_command_seconds", key="command")
+@profiled
 async def bi_contract_funding(event: AstrMessageEvent):
     """查看资金费率信息"""
     result = "💰 资金费率信息\n"
     result += "━━━━━━━━━━━━━━\n"
     result += f"资金费率结算间隔: {CONTRACT_FUNDING_RATE_INTERVAL // 3600}小时\n\n"
 
+    all_positions = get_all_open_positions()
+
     for coin in COINS:
         rate = calculate_funding_rate(coin)
         rate_str = f"{rate * 100:+.4f}%"
@@ -2629,14 +3773,14 @@ async def bi_contract_funding(event: AstrMessageEvent):
         total_short = 0.0
         current_price = get_coin_price(coin)
 
-        for user_id, contract_data in user_contracts.items():
-            for position in contract_data.get("positions", []):
-                if position["coin"] == coin:
-                    value = position["amount"] * current_price
-                    if position["direction"] == "long":
-                        total_long += value
-                    else:
-                        total_short += value
+        # 用户账户按需加载，持仓统计以数据库为准
+        for position in all_positions:
+            if position["coin"] == coin:
+                value = position["amount"] * current_price
+                if position["direction"] == "long":
+                    total_long += value
+                else:
+                    total_short += value
 
         result += f"{coin}:\n"
         result += f"  资金费率: {rate_str}\n"
@@ -2661,6 +3805,9 @@ __all__ = [
     "bi_help",
     "bi_volatility",
     "bi_history",
+    "bi_stats",
+    "bi_profile",
+    "bi_memory",
     "bi_start_market_updates",
     "bi_stop_market_updates",
     # 合约系统命令
@@ -0,0 +1,480 @@
+"""
+用户账户存储
+
+用户的积分、收集品、预约单保存在 SQLite 中（表结构见 bi.init_database），
+首次访问时按需加载到内存，内存中只保留最近使用的 capacity 个账户。
+账户被淘汰或调用 flush() 时写回数据库，只写回修改过的账户：
+通过视图整体赋值（user_balance[user_id] = ...）时自动标记，
+原地修改嵌套结构（user_assets[user_id][coin]["amount"] = ...）后需调用 mark_dirty()。
+先取得引用、稍后再修改的代码需在 pinned() 中执行，保证期间账户不被淘汰，
+否则修改落在已移出缓存的对象上，mark_dirty() 找不到账户，修改丢失。
+所有数据库读写复用同一个连接（由缓存的锁保护）。
+
+bi.py 中的 user_assets / user_balance / pending_orders / user_contracts
+是同一个账户缓存的四个字典视图，保持原有的 dict 用法不变。
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, MutableMapping
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from astrbot.api import logger
+
+DEFAULT_CACHE_CAPACITY = 1024  # 默认常驻内存的账户数量
+
+
+class UserAccountStore:
+    """带 LRU 淘汰与写回的用户账户缓存
+
+    每个账户在内存中的结构:
+        {
+            "assets": {coin: {"amount": float, "total_cost": float}},
+            "balance": float,
+            "orders": [order, ...],
+            "contracts": {"positions": [...], "funding_payments": []},
+        }
+    """
+
+    def __init__(
+        self,
+        coins: list[str],
+        initial_balance: float,
+        capacity: int = DEFAULT_CACHE_CAPACITY,
+        positions_loader: Callable[[sqlite3.Cursor, str], list[dict]] | None = None,
+    ):
+        self._coins = coins
+        self._initial_balance = initial_balance
+        self._capacity = max(1, capacity)
+        self._positions_loader = positions_loader
+        self._db_file: Path | None = None
+        self._conn: sqlite3.Connection | None = None
+
+        self._accounts: OrderedDict[str, dict] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._pins: dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    # ==================== 配置 ====================
+
+    def set_db_file(self, db_file: Path | None):
+        """设置数据库路径（切换路径时先写回当前缓存）"""
+        with self._lock:
+            if self._db_file is not None and db_file != self._db_file:
+                self.flush()
+                self._accounts.clear()
+                self.close()
+            self._db_file = db_file
+
+    def set_capacity(self, capacity: int):
+        """设置常驻内存的账户数量上限"""
+        with self._lock:
+            self._capacity = max(1, capacity)
+            self._evict()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def resident_count(self) -> int:
+        return len(self._accounts)
+
+    # ==================== 账户访问 ====================
+
+    def _default_account(self) -> dict:
+        return {
+            "assets": {
+                coin: {"amount": 0.0, "total_cost": 0.0} for coin in self._coins
+            },
+            "balance": self._initial_balance,
+            "orders": [],
+            "contracts": {"positions": [], "funding_payments": []},
+        }
+
+    def exists(self, user_id: str) -> bool:
+        """账户是否存在（内存或数据库中）"""
+        with self._lock:
+            if user_id in self._accounts:
+                return True
+            return self._db_has_account(user_id)
+
+    def get(self, user_id: str) -> dict | None:
+        """获取账户，不在内存中时从数据库加载；不存在返回 None"""
+        with self._lock:
+            account = self._accounts.get(user_id)
+            if account is not None:
+                self._accounts.move_to_end(user_id)
+                return account
+
+            account = self._load_account(user_id)
+            if account is None:
+                return None
+            self._insert(user_id, account, dirty=False)
+            return account
+
+    def get_or_create(self, user_id: str) -> dict:
+        """获取账户，不存在时创建默认账户"""
+        with self._lock:
+            account = self.get(user_id)
+            if account is None:
+                account = self._default_account()
+                self._insert(user_id, account, dirty=True)
+            return account
+
+    @contextmanager
+    def pinned(self, user_id: str):
+        """代码块执行期间账户不会被淘汰（可嵌套，账户尚未加载时同样生效）"""
+        with self._lock:
+            self._pins[user_id] = self._pins.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._pins[user_id] > 1:
+                    self._pins[user_id] -= 1
+                else:
+                    del self._pins[user_id]
+                self._evict()
+
+    def mark_dirty(self, user_id: str):
+        """标记常驻账户已修改（淘汰或 flush 时写回）"""
+        with self._lock:
+            if user_id in self._accounts:
+                self._dirty.add(user_id)
+
+    def delete(self, user_id: str):
+        """删除账户（内存与数据库）"""
+        with self._lock:
+            self._accounts.pop(user_id, None)
+            self._dirty.discard(user_id)
+            if self._db_file is None:
+                return
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.execute("DELETE FROM user_accounts WHERE user_id = ?", (user_id,))
+                    conn.execute("DELETE FROM user_holdings WHERE user_id = ?", (user_id,))
+                    conn.execute("DELETE FROM pending_orders WHERE user_id = ?", (user_id,))
+            except Exception as e:
+                logger.error(f"[Account] 删除账户 {user_id} 失败: {e}")
+
+    def user_ids(self) -> list[str]:
+        """所有账户ID（内存 + 数据库）"""
+        with self._lock:
+            ids = dict.fromkeys(self._accounts)
+            for user_id in self._db_select_column("SELECT user_id FROM user_accounts"):
+                ids.setdefault(user_id)
+            return list(ids)
+
+    def users_with_orders(self) -> list[str]:
+        """有预约单的账户ID
+
+        常驻内存的账户以内存中的预约单为准，其余账户查询 pending_orders 表。
+        """
+        with self._lock:
+            ids = [uid for uid, acc in self._accounts.items() if acc["orders"]]
+            for user_id in self._db_select_column(
+                "SELECT DISTINCT user_id FROM pending_orders"
+            ):
+                if user_id not in self._accounts:
+                    ids.append(user_id)
+            return ids
+
+    def users_with_due_orders(self, prices: dict[str, float], now: datetime) -> list[str]:
+        """有需要处理的预约单（已过期，或按当前价格已触发）的账户ID，不加载账户
+
+        常驻内存的账户检查内存中的预约单，其余账户在 pending_orders 表中查询。
+        """
+        with self._lock:
+            ids = [
+                uid
+                for uid, acc in self._accounts.items()
+                if any(_order_due(order, prices, now) for order in acc["orders"])
+            ]
+            clauses = ["expires_at < ?"]
+            params: list[Any] = [now.isoformat()]
+            for coin, price in prices.items():
+                clauses.append(
+                    "(coin = ? AND ((type = 'buy' AND price >= ?) OR (type = 'sell' AND price <= ?)))"
+                )
+                params.extend((coin, price, price))
+            for user_id in self._db_select_column(
+                f"SELECT DISTINCT user_id FROM pending_orders WHERE {' OR '.join(clauses)}",
+                params,
+            ):
+                if user_id not in self._accounts:
+                    ids.append(user_id)
+            return ids
+
+    def resident_items(self, part: str) -> list[tuple[str, Any]]:
+        """常驻内存账户的某一部分（不触发加载）"""
+        with self._lock:
+            return [(uid, acc[part]) for uid, acc in self._accounts.items()]
+
+    def _insert(self, user_id: str, account: dict, dirty: bool):
+        self._accounts[user_id] = account
+        self._accounts.move_to_end(user_id)
+        if dirty:
+            self._dirty.add(user_id)
+        self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用且未被固定的账户，淘汰前写回"""
+        while len(self._accounts) > self._capacity:
+            user_id = next((uid for uid in self._accounts if uid not in self._pins), None)
+            if user_id is None:
+                # 全部被固定，暂时超出上限，解除固定时再淘汰
+                return
+            account = self._accounts.pop(user_id)
+            if user_id in self._dirty:
+                self._dirty.discard(user_id)
+                self._write_accounts([(user_id, account)])
+            logger.debug(f"[Account] 账户移出缓存: {user_id}")
+
+    # ==================== 持久化 ====================
+
+    def _connection(self) -> sqlite3.Connection:
+        """复用的数据库连接，只在持有 self._lock 时使用"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(str(self._db_file), check_same_thread=False)
+        return self._conn
+
+    def close(self):
+        """关闭数据库连接（下次访问时重新打开）"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def flush(self):
+        """将所有修改过的常驻账户写回数据库"""
+        with self._lock:
+            if not self._dirty:
+                return
+            accounts = [
+                (uid, self._accounts[uid]) for uid in self._dirty if uid in self._accounts
+            ]
+            if self._write_accounts(accounts):
+                self._dirty.clear()
+
+    def import_accounts(self, accounts: dict[str, dict]) -> int:
+        """批量导入账户（用于从旧版 bi_data.json 迁移），跳过已存在的账户
+
+        Returns:
+            实际导入的账户数量
+        """
+        with self._lock:
+            existing = set(self._db_select_column("SELECT user_id FROM user_accounts"))
+            new_accounts = [
+                (uid, acc)
+                for uid, acc in accounts.items()
+                if uid not in existing and uid not in self._accounts
+            ]
+            if new_accounts and self._write_accounts(new_accounts):
+                return len(new_accounts)
+            return 0
+
+    def _write_accounts(self, accounts: list[tuple[str, dict]]) -> bool:
+        if self._db_file is None or not accounts:
+            return False
+        try:
+            conn = self._connection()
+            with conn:
+                self._write_rows(conn.cursor(), accounts)
+            return True
+        except Exception as e:
+            logger.error(f"[Account] 写回账户数据失败: {e}")
+            return False
+
+    @staticmethod
+    def _write_rows(cursor: sqlite3.Cursor, accounts: list[tuple[str, dict]]):
+        for user_id, account in accounts:
+            cursor.execute(
+                "INSERT OR REPLACE INTO user_accounts (user_id, balance) VALUES (?, ?)",
+                (user_id, account["balance"]),
+            )
+            cursor.execute("DELETE FROM user_holdings WHERE user_id = ?", (user_id,))
+            cursor.executemany(
+                """
+                INSERT INTO user_holdings (user_id, coin, amount, total_cost)
+                VALUES (?, ?, ?, ?)
+            """,
+                [
+                    (user_id, coin, asset["amount"], asset["total_cost"])
+                    for coin, asset in account["assets"].items()
+                    if asset["amount"] or asset["total_cost"]
+                ],
+            )
+            cursor.execute("DELETE FROM pending_orders WHERE user_id = ?", (user_id,))
+            cursor.executemany(
+                """
+                INSERT OR REPLACE INTO pending_orders
+                (order_id, user_id, type, coin, amount, price, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [
+                    (
+                        order["order_id"],
+                        user_id,
+                        order["type"],
+                        order["coin"],
+                        order["amount"],
+                        order["price"],
+                        _to_iso(order["created_at"]),
+                        _to_iso(order["expires_at"]),
+                    )
+                    for order in account["orders"]
+                ],
+            )
+
+    def _load_account(self, user_id: str) -> dict | None:
+        if self._db_file is None:
+            return None
+        try:
+            cursor = self._connection().cursor()
+            cursor.execute(
+                "SELECT balance FROM user_accounts WHERE user_id = ?", (user_id,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+
+            account = self._default_account()
+            account["balance"] = row[0]
+
+            cursor.execute(
+                "SELECT coin, amount, total_cost FROM user_holdings WHERE user_id = ?",
+                (user_id,),
+            )
+            for coin, amount, total_cost in cursor.fetchall():
+                account["assets"][coin] = {"amount": amount, "total_cost": total_cost}
+
+            cursor.execute(
+                """
+                SELECT order_id, type, coin, amount, price, created_at, expires_at
+                FROM pending_orders
+                WHERE user_id = ?
+                ORDER BY created_at
+            """,
+                (user_id,),
+            )
+            for row in cursor.fetchall():
+                account["orders"].append(
+                    {
+                        "order_id": row[0],
+                        "type": row[1],
+                        "coin": row[2],
+                        "amount": row[3],
+                        "price": row[4],
+                        "created_at": datetime.fromisoformat(row[5]),
+                        "expires_at": datetime.fromisoformat(row[6]),
+                    }
+                )
+
+            # 合约持仓以数据库为准
+            if self._positions_loader is not None:
+                account["contracts"]["positions"] = self._positions_loader(cursor, user_id)
+        except Exception as e:
+            logger.error(f"[Account] 加载账户 {user_id} 失败: {e}")
+            return None
+        return account
+
+    def _db_has_account(self, user_id: str) -> bool:
+        if self._db_file is None:
+            return False
+        try:
+            cursor = self._connection().execute(
+                "SELECT 1 FROM user_accounts WHERE user_id = ? LIMIT 1", (user_id,)
+            )
+            return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"[Account] 查询账户 {user_id} 失败: {e}")
+            return False
+
+    def _db_select_column(self, query: str, params: list | tuple = ()) -> list:
+        if self._db_file is None:
+            return []
+        try:
+            cursor = self._connection().execute(query, params)
+            return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"[Account] 查询账户列表失败: {e}")
+            return []
+
+
+class AccountView(MutableMapping):
+    """账户缓存中某一部分的字典视图，如 user_balance[user_id]"""
+
+    def __init__(self, store: UserAccountStore, part: str):
+        self._store = store
+        self._part = part
+
+    def __getitem__(self, user_id: str):
+        account = self._store.get(user_id)
+        if account is None:
+            raise KeyError(user_id)
+        return account[self._part]
+
+    def __setitem__(self, user_id: str, value):
+        self._store.get_or_create(user_id)[self._part] = value
+        self._store.mark_dirty(user_id)
+
+    def __delitem__(self, user_id: str):
+        if not self._store.exists(user_id):
+            raise KeyError(user_id)
+        self._store.delete(user_id)
+
+    def __contains__(self, user_id: object) -> bool:
+        return isinstance(user_id, str) and self._store.exists(user_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.user_ids())
+
+    def __len__(self) -> int:
+        return len(self._store.user_ids())
+
+    def resident_items(self) -> list[tuple[str, Any]]:
+        """只遍历常驻内存的账户，不触发加载"""
+        return self._store.resident_items(self._part)
+
+
+class PendingOrdersView(AccountView):
+    """预约单视图，遍历时只包含有预约单的账户"""
+
+    def __init__(self, store: UserAccountStore):
+        super().__init__(store, "orders")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.users_with_orders())
+
+    def __len__(self) -> int:
+        return len(self._store.users_with_orders())
+
+
+def _order_due(order: dict, prices: dict[str, float], now: datetime) -> bool:
+    """预约单是否已过期或按当前价格已触发"""
+    if order["expires_at"] < now:
+        return True
+    price = prices.get(order["coin"])
+    if price is None:
+        return False
+    if order["type"] == "buy":
+        return price <= order["price"]
+    return price >= order["price"]
+
+
+def _to_iso(value: datetime | str) -> str:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+__all__ = [
+    "UserAccountStore",
+    "AccountView",
+    "PendingOrdersView",
+    "DEFAULT_CACHE_CAPACITY",
+]
@@ -0,0 +1,176 @@
+"""
+群发消息调度
+
+把同一条消息并发发送到多个会话（UMO），而不是逐个等待：
+- 同时进行的发送数有上限（concurrency）
+- 每个平台一个令牌桶，限制每秒发送条数，避免触发平台风控
+- 每个目标单独超时，慢的群不会拖住其他群
+广播总耗时接近单次发送耗时，每次广播的成功/失败/超时数和延迟都会记录下来。
+
+令牌桶只用 threading.Lock 计算预约时间，不持有 asyncio 对象，
+可以在不同线程的不同事件循环中共用同一个调度器。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from astrbot.api import logger
+
+DEFAULT_CONCURRENCY = 8  # 同时发送的最大数量
+DEFAULT_TIMEOUT = 10.0  # 单个目标的发送超时（秒）
+DEFAULT_PLATFORM_RATE = 5.0  # 每个平台每秒最多发送条数
+DEFAULT_PLATFORM_BURST = 5  # 每个平台允许的突发条数
+LATENCY_SAMPLES = 1000  # 保留最近多少次发送的延迟
+
+
+class _TokenBucket:
+    """令牌桶：返回本次发送需要等待的时间"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+@dataclass
+class BroadcastResult:
+    """一次广播的结果"""
+
+    targets: int = 0
+    sent: int = 0
+    failed: int = 0
+    timeouts: int = 0
+    elapsed: float = 0.0
+    latencies: dict[str, float] = field(default_factory=dict)  # umo -> 发送耗时（秒）
+
+
+class BroadcastDispatcher:
+    """并发群发调度器"""
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT,
+        platform_rate: float = DEFAULT_PLATFORM_RATE,
+        platform_burst: int = DEFAULT_PLATFORM_BURST,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.platform_rate = platform_rate
+        self.platform_burst = platform_burst
+        self._buckets: dict[str, _TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        # 累计统计
+        self.broadcasts = 0
+        self.sent = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.last_result: BroadcastResult | None = None
+
+    def configure(
+        self,
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        platform_rate: float | None = None,
+        platform_burst: int | None = None,
+    ):
+        """修改调度参数，令牌桶按新参数重建"""
+        if concurrency is not None:
+            self.concurrency = max(1, concurrency)
+        if timeout is not None:
+            self.timeout = timeout
+        if platform_rate is not None:
+            self.platform_rate = platform_rate
+        if platform_burst is not None:
+            self.platform_burst = platform_burst
+        with self._buckets_lock:
+            self._buckets.clear()
+
+    def _bucket(self, umo: str) -> _TokenBucket:
+        platform = umo.split(":", 1)[0]
+        with self._buckets_lock:
+            bucket = self._buckets.get(platform)
+            if bucket is None:
+                bucket = self._buckets[platform] = _TokenBucket(
+                    self.platform_rate, self.platform_burst
+                )
+            return bucket
+
+    async def broadcast(
+        self, targets: list[str], send: Callable[[str], Awaitable[object]]
+    ) -> BroadcastResult:
+        """并发调用 send(umo) 发送到所有目标
+
+        Args:
+            targets: 目标会话 UMO 列表
+            send: 发送函数，抛出异常视为发送失败
+
+        Returns:
+            本次广播的结果
+        """
+        result = BroadcastResult(targets=len(targets))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+
+        async def send_one(umo: str):
+            # 先按平台限速排队，等待时不占用并发名额，其他平台不受影响
+            wait = self._bucket(umo).reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with semaphore:
+                send_started = time.monotonic()
+                try:
+                    await asyncio.wait_for(send(umo), self.timeout)
+                except asyncio.TimeoutError:
+                    result.timeouts += 1
+                    result.failed += 1
+                    logger.warning(f"[Broadcast] 发送到 {umo} 超时（{self.timeout}s）")
+                    return
+                except Exception as e:
+                    result.failed += 1
+                    logger.warning(f"[Broadcast] 发送到 {umo} 失败: {e}")
+                    return
+                latency = time.monotonic() - send_started
+                result.sent += 1
+                result.latencies[umo] = latency
+                self.latencies.append(latency)
+
+        await asyncio.gather(*(send_one(umo) for umo in targets))
+        result.elapsed = time.monotonic() - started
+
+        self.broadcasts += 1
+        self.sent += result.sent
+        self.failed += result.failed
+        self.timeouts += result.timeouts
+        self.last_result = result
+        logger.info(
+            f"[Broadcast] 已发送 {result.sent}/{result.targets} 个会话，"
+            f"失败 {result.failed}（超时 {result.timeouts}），耗时 {result.elapsed:.2f}s"
+        )
+        return result
+
+
+__all__ = [
+    "BroadcastDispatcher",
+    "BroadcastResult",
+]
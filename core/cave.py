@@ -2,89 +2,306 @@ from astrbot.api.event import AstrMessageEvent
 from astrbot.api import logger
 from astrbot.api.message_components import Image, Plain
 
-import httpx
 from mikuchat.apis import Cave
 from mikuchat.models import CaveModel
 
+import asyncio
+from pathlib import Path
 
-async def cave_get(event: AstrMessageEvent):
-    async with httpx.AsyncClient() as client:
-        cave = Cave(client=client)
-        await cave.get_cave()
-
-        data: CaveModel | None = cave.model.cave
-        if data is None:
-            logger.error("回声洞解析出错")
-            raise ValueError("回声洞解析出错")
-        
-        logger.info(f"{data.id=}")
-        logger.info(f"{data.type=}")
-        logger.info(f"{data.qq=}")
-        logger.info(f"{data.string=}")
-        logger.info(f"{data.image=}")
-        logger.info(f"{data.time=}")
-        logger.info(f"{data.url=}")
-
-        match data.type:
-            case 0:
-                if data.string is None:
-                    logger.error("文本回声洞解析出错")
-                    raise ValueError("文本回声洞解析出错")
-                yield event.chain_result([
-                    Plain(
-                        f"===== 回声洞 {data.id} =====\n{data.string}"
-                        f"\n{data.string}"
-                    ),
-                ])
-            case 1:
-                if data.string is None:
-                    logger.error("图片回声洞解析出错")
-                    raise ValueError("图片回声洞解析出错")
-                yield event.chain_result([
-                    Plain(f"===== 回声洞 {data.id} =====\n"),
-                    Image(data.string)
-                ])
-            case 2:
-                if data.string is None or data.image is None:
-                    logger.error("图文回声洞解析出错")
-                    raise ValueError("图文回声洞解析出错")
-                yield event.chain_result([
-                    Plain(
-                        f"===== 回声洞 {data.id} ====="
-                        f"\n{data.string}"
-                    ),
-                    Image(data.image)
-                ])
-
-async def cave_select(event: AstrMessageEvent, id_: int):
-    async with httpx.AsyncClient() as client:
-        cave = Cave(client=client)
-        await cave.select_cave(id=id_)
-
-        data: CaveModel | None = cave.model.cave
-        if data is None:
-            logger.error("回声洞解析出错")
-            raise ValueError("回声洞解析出错")
-
-        match data.type:
-            case 0:
-                if data.string is None:
-                    logger.error("文本回声洞解析出错")
-                    raise ValueError("文本回声洞解析出错")
-                yield event.plain_result(data.string)
-            case 1:
-                if data.string is None:
-                    logger.error("图片回声洞解析出错")
-                    raise ValueError("图片回声洞解析出错")
-                yield event.image_result(data.string)
-            case 2:
-                if data.string is None or data.image is None:
-                    logger.error("图文回声洞解析出错")
-                    raise ValueError("图文回声洞解析出错")
-                yield event.chain_result([
-                    Image(data.image),
-                    Plain(data.string)
-                ])
+from .cave_pool import DEFAULT_POOL_CAPACITY, PrefetchPool
+from .hot_log import hot_log
+from .image_cache import get_image_cache, url_key
+from .metrics import register_collector
+from .mikuchat_cache import AsyncTTLCache
+from .mikuchat_client import BATCH_MAX_SIZE, gather_limited, parse_id_list
+from .mikuchat_resilience import call_api, fetch_url
+
+# 回声洞内容不可变，按ID缓存，只按LRU淘汰
+CAVE_CACHE_SIZE = 512
+_cave_cache: AsyncTTLCache[CaveModel] = AsyncTTLCache(maxsize=CAVE_CACHE_SIZE, ttl=None)
+
+
+def set_cave_cache_size(size: int):
+    """设置回声洞缓存条数"""
+    _cave_cache.maxsize = max(1, size)
+
+
+async def _fetch_cave(id_: int) -> CaveModel | None:
+    """按ID获取回声洞（不经过缓存）"""
+    cave = await call_api(Cave, "select_cave", id=id_)
+    return cave.model.cave if cave.model else None
+
+
+def _cave_image_urls(data: CaveModel) -> list[str]:
+    """回声洞中需要发送的图片地址"""
+    match data.type:
+        case 1:
+            return [data.string] if data.string else []
+        case 2:
+            return [data.image] if data.image else []
+    return []
+
+
+async def _load_image(url: str) -> Path | bytes | None:
+    """获取图片，优先读取磁盘缓存
+
+    Returns:
+        缓存文件路径；未启用磁盘缓存时返回图片内容；下载失败返回 None（发送时退回使用 URL）
+    """
+    image_cache = get_image_cache()
+    if image_cache is not None:
+        path = await image_cache.get_async(url_key(url))
+        if path is not None:
+            return path
+    try:
+        content = await fetch_url(url)
+    except Exception as e:
+        logger.warning(f"[Cave] 图片下载失败 {url}: {e}")
+        return None
+    if image_cache is not None:
+        path = await image_cache.put_async(url_key(url), content)
+        if path is not None:
+            return path
+    return content
+
+
+async def _load_images(data: CaveModel) -> dict[str, Path | bytes]:
+    """并发获取回声洞中的全部图片"""
+    urls = _cave_image_urls(data)
+    results = await asyncio.gather(*(_load_image(url) for url in urls))
+    return {url: result for url, result in zip(urls, results) if result}
+
+
+async def _fetch_random_cave() -> tuple[CaveModel, dict[str, Path | bytes]] | None:
+    """获取一条随机回声洞并下载其中的图片"""
+    cave = await call_api(Cave, "get_cave")
+    data: CaveModel | None = cave.model.cave if cave.model else None
+    if data is None:
+        return None
+    if data.id is not None:
+        _cave_cache.set(data.id, data)
+
+    return data, await _load_images(data)
+
+
+# 随机回声洞预取池
+_cave_pool: PrefetchPool[tuple[CaveModel, dict[str, Path | bytes]]] = PrefetchPool(
+    _fetch_random_cave, capacity=DEFAULT_POOL_CAPACITY
+)
+
+
+def _collect_metrics():
+    pool = {"pool": "cave"}
+    return [
+        *_cave_cache.metric_samples("cave"),
+        ("mikuchat_prefetch_hits", pool, _cave_pool.hits),
+        ("mikuchat_prefetch_misses", pool, _cave_pool.misses),
+        ("mikuchat_prefetch_size", pool, len(_cave_pool)),
+    ]
+
+
+register_collector(_collect_metrics)
+
+
+def set_cave_prefetch_size(size: int):
+    """设置随机回声洞预取池容量，0 表示关闭预取"""
+    _cave_pool.set_capacity(size)
+
+
+async def stop_cave_prefetch():
+    """停止随机回声洞预取"""
+    await _cave_pool.stop()
+
+
+def _image(url: str, images: dict[str, Path | bytes]) -> Image:
+    """优先使用已下载的图片"""
+    image = images.get(url)
+    if isinstance(image, Path):
+        return Image.fromFileSystem(str(image))
+    if image:
+        return Image.fromBytes(image)
+    return Image(url)
+
+
+def _cave_components(data: CaveModel, images: dict[str, Path | bytes]) -> list:
+    """带标题的回声洞消息内容"""
+    match data.type:
+        case 0:
+            if data.string is None:
+                logger.error("文本回声洞解析出错")
+                raise ValueError("文本回声洞解析出错")
+            return [
+                Plain(
+                    f"===== 回声洞 {data.id} =====\n{data.string}"
+                    f"\n{data.string}"
+                ),
+            ]
+        case 1:
+            if data.string is None:
+                logger.error("图片回声洞解析出错")
+                raise ValueError("图片回声洞解析出错")
+            return [
+                Plain(f"===== 回声洞 {data.id} =====\n"),
+                _image(data.string, images)
+            ]
+        case 2:
+            if data.string is None or data.image is None:
+                logger.error("图文回声洞解析出错")
+                raise ValueError("图文回声洞解析出错")
+            return [
+                Plain(
+                    f"===== 回声洞 {data.id} ====="
+                    f"\n{data.string}"
+                ),
+                _image(data.image, images)
+            ]
+    return []
+
+
+def _merge_caves(
+    results: list[tuple[CaveModel, dict[str, Path | bytes]] | None | BaseException],
+) -> tuple[list, int]:
+    """把多条回声洞合并为一条消息，返回 (消息内容, 失败条数)"""
+    chain: list = []
+    seen: set[int | None] = set()
+    failed = 0
+    for result in results:
+        if result is None or isinstance(result, BaseException):
+            if isinstance(result, BaseException):
+                logger.warning(f"[Cave] 回声洞获取失败: {result}")
+            failed += 1
+            continue
+        data, images = result
+        if data.id in seen:
+            continue
+        seen.add(data.id)
+        try:
+            components = _cave_components(data, images)
+        except ValueError:
+            failed += 1
+            continue
+        if chain and components:
+            chain.append(Plain("\n"))
+        chain.extend(components)
+    return chain, failed
+
+
+async def _revalidate_images(images: dict[str, Path | bytes]) -> dict[str, Path | bytes]:
+    """预取的图片文件可能在等待期间被磁盘缓存淘汰，取出时重新确认，已不存在的重新获取"""
+    urls = [url for url, image in images.items() if isinstance(image, Path)]
+    if not urls:
+        return images
+    results = await asyncio.gather(*(_load_image(url) for url in urls))
+    images = dict(images)
+    for url, result in zip(urls, results):
+        if result:
+            images[url] = result
+        else:
+            images.pop(url)
+    return images
+
+
+async def _random_cave() -> tuple[CaveModel, dict[str, Path | bytes]] | None:
+    """取一条随机回声洞，优先使用预取池"""
+    prefetched = _cave_pool.pop()
+    if prefetched is not None:
+        data, images = prefetched
+        return data, await _revalidate_images(images)
+    return await _fetch_random_cave()
+
+
+async def _select_cave(id_: int) -> tuple[CaveModel, dict[str, Path | bytes]] | None:
+    """按ID获取回声洞（经过缓存）及其中的图片"""
+    data: CaveModel | None = await _cave_cache.get_or_fetch(
+        id_, lambda: _fetch_cave(id_)
+    )
+    if data is None:
+        return None
+    return data, await _load_images(data)
+
+
+async def cave_get(event: AstrMessageEvent, count: int = 1):
+    if count < 1 or count > BATCH_MAX_SIZE:
+        logger.warning(f"回声洞数量需在 1 到 {BATCH_MAX_SIZE} 之间")
+        raise ValueError(f"回声洞数量需在 1 到 {BATCH_MAX_SIZE} 之间")
+
+    if count > 1:
+        results = await gather_limited(lambda _: _random_cave(), range(count))
+        chain, failed = _merge_caves(results)
+        if not chain:
+            logger.error("回声洞获取失败")
+            raise ValueError("回声洞获取失败")
+        if failed:
+            chain.append(Plain(f"\n（{failed} 条回声洞获取失败）"))
+        yield event.chain_result(chain)
+        return
+
+    result = await _random_cave()
+    if result is None:
+        logger.error("回声洞解析出错")
+        raise ValueError("回声洞解析出错")
+    data, images = result
+
+    hot_log(
+        "cave",
+        "[Cave] id={!r} type={!r} qq={!r} string={!r} image={!r} time={!r} url={!r}",
+        data.id,
+        data.type,
+        data.qq,
+        data.string,
+        data.image,
+        data.time,
+        data.url,
+    )
+
+    components = _cave_components(data, images)
+    if components:
+        yield event.chain_result(components)
+
+async def cave_select(event: AstrMessageEvent, id_: int | str):
+    ids = parse_id_list(id_)
+    if not ids:
+        logger.warning("未指定回声洞ID")
+        raise ValueError("未指定回声洞ID")
+
+    if len(ids) > 1:
+        results = await gather_limited(_select_cave, ids)
+        chain, failed = _merge_caves(results)
+        if not chain:
+            logger.error("回声洞获取失败")
+            raise ValueError("回声洞获取失败")
+        if failed:
+            chain.append(Plain(f"\n（{failed} 条回声洞获取失败）"))
+        yield event.chain_result(chain)
+        return
+
+    result = await _select_cave(ids[0])
+    if result is None:
+        logger.error("回声洞解析出错")
+        raise ValueError("回声洞解析出错")
+    data, images = result
+
+    match data.type:
+        case 0:
+            if data.string is None:
+                logger.error("文本回声洞解析出错")
+                raise ValueError("文本回声洞解析出错")
+            yield event.plain_result(data.string)
+        case 1:
+            if data.string is None:
+                logger.error("图片回声洞解析出错")
+                raise ValueError("图片回声洞解析出错")
+            yield event.chain_result([
+                _image(data.string, images)
+            ])
+        case 2:
+            if data.string is None or data.image is None:
+                logger.error("图文回声洞解析出错")
+                raise ValueError("图文回声洞解析出错")
+            yield event.chain_result([
+                _image(data.image, images),
+                Plain(data.string)
+            ])
 
 __all__ = [
     "cave_get",
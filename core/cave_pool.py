@@ -0,0 +1,118 @@
+"""
+随机回声洞预取池
+
+后台预先获取若干条随机回声洞（连同图片），cave_get 直接从池中取出，不用等待 API 往返。
+池中条数低于水位线时异步补充；目标条数随最近的请求量变化：
+最近 DEMAND_WINDOW 秒内取出多少条，就预备多少条（不低于水位线、不超过容量）。
+没有请求时不会补充，空闲的群不会产生无用的 API 调用。
+"""
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+from astrbot.api import logger
+
+T = TypeVar("T")
+
+DEFAULT_POOL_CAPACITY = 8  # 池中最多保留的条数
+DEFAULT_LOW_WATERMARK = 2  # 低于该条数时开始补充
+DEMAND_WINDOW = 300.0  # 统计请求量的时间窗口（秒）
+PREFETCH_INTERVAL = 0.5  # 两次预取之间的最小间隔（秒）
+
+
+class PrefetchPool(Generic[T]):
+    """有界预取池，按需求量自适应补充"""
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[T | None]],
+        capacity: int = DEFAULT_POOL_CAPACITY,
+        low_watermark: int = DEFAULT_LOW_WATERMARK,
+    ):
+        self.fetch = fetch
+        self.capacity = max(0, capacity)
+        self.low_watermark = min(low_watermark, self.capacity)
+        self._items: deque[T] = deque()
+        self._demand: deque[float] = deque()  # 最近取出的时间
+        self._task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def set_capacity(self, capacity: int):
+        """设置池容量，0 表示关闭预取"""
+        self.capacity = max(0, capacity)
+        self.low_watermark = min(DEFAULT_LOW_WATERMARK, self.capacity)
+        while len(self._items) > self.capacity:
+            self._items.popleft()
+
+    def _target(self, now: float) -> int:
+        """当前的目标条数"""
+        while self._demand and now - self._demand[0] > DEMAND_WINDOW:
+            self._demand.popleft()
+        if not self._demand:
+            return 0
+        return min(self.capacity, max(self.low_watermark, len(self._demand)))
+
+    def pop(self) -> T | None:
+        """取出一条预取的数据，池为空时返回 None；必要时触发后台补充"""
+        if not self.capacity:
+            return None
+        self._demand.append(time.monotonic())
+        item = self._items.popleft() if self._items else None
+        if item is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if len(self._items) < max(1, self.low_watermark) or item is None:
+            self._start_refill()
+        return item
+
+    def _start_refill(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._refill())
+
+    async def _refill(self):
+        """补充到目标条数；请求失败时停止，等下次取出时再重试"""
+        while len(self._items) < self._target(time.monotonic()):
+            try:
+                item = await self.fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[Prefetch] 预取失败: {e}")
+                return
+            if item is None:
+                return
+            self._items.append(item)
+            self.prefetched += 1
+            await asyncio.sleep(PREFETCH_INTERVAL)
+
+    async def stop(self):
+        """停止后台补充并清空池"""
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._items.clear()
+        self._demand.clear()
+
+
+__all__ = [
+    "PrefetchPool",
+    "DEFAULT_POOL_CAPACITY",
+]
@@ -0,0 +1,220 @@
+"""
+随机事件文案预生成池
+
+按 (币种, 涨跌方向, 幅度档位) 预先生成事件文案，触发随机事件时直接取用，不用实时等待 LLM。
+文案中的币种名和涨跌幅使用占位符 {coin} / {percent}，取用时填入实际数值，
+因此同一档位内的任意涨跌幅都可以复用。
+
+补充在空闲时进行：每次为缺口最大的一档请求 LLM 一次性生成多条（批量），
+逐条校验（必须包含两个占位符、没有其他花括号、长度合适）后入池。
+池内容保存到 JSON 文件，重启后不用重新生成。有变化时最多每 SAVE_INTERVAL 秒写一次，
+插件停用时 flush() 写入剩余的变化（异常退出时最近取出的文案可能在重启后再次使用）。
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from astrbot.api import logger
+
+# 幅度档位：(上限, 名称)，按涨跌幅绝对值归档
+MAGNITUDE_BUCKETS = (
+    (0.10, "小幅"),
+    (0.15, "明显"),
+    (float("inf"), "大幅"),
+)
+DEFAULT_TARGET_PER_KEY = 2  # 每档保留的文案条数
+DEFAULT_BATCH_SIZE = 4  # 每次请求 LLM 生成的条数
+MAX_TEXT_LENGTH = 80  # 填入占位符后的最大长度
+SAVE_INTERVAL = 30.0  # 池文件写入间隔（秒）
+
+_PLACEHOLDER_RE = re.compile(r"\{(coin|percent)\}")
+_LIST_PREFIX_RE = re.compile(r"^\s*(?:[-*•·]|\d+[.、)）])\s*")
+
+EventKey = tuple[str, str, str]  # (币种, "up"/"down", 幅度档位)
+
+
+def magnitude_bucket(change_percent: float) -> str:
+    """涨跌幅所属的幅度档位"""
+    magnitude = abs(change_percent)
+    for upper, name in MAGNITUDE_BUCKETS:
+        if magnitude < upper:
+            return name
+    return MAGNITUDE_BUCKETS[-1][1]
+
+
+def event_key(coin: str, change_percent: float) -> EventKey:
+    return coin, "up" if change_percent > 0 else "down", magnitude_bucket(change_percent)
+
+
+def build_batch_prompt(key: EventKey, count: int) -> str:
+    """生成一档文案的批量提示词"""
+    coin, direction, bucket = key
+    trend = "提升" if direction == "up" else "下降"
+    return f"""你是一个游戏事件生成器。请为{coin}收集品生成{count}条不同的趣味事件，解释为什么它的积分刚刚{bucket}{trend}。
+
+要求：
+1. 每条一行，不要编号，不要其他说明文字
+2. 每条都必须原样包含占位符 {{coin}}（收集品名称）和 {{percent}}（积分变化幅度），不要写出具体数字
+3. 内容要简短有趣（50字以内），适合在群聊中播报，语气像游戏公告
+4. 可以是荒诞搞笑的事件（如：被猫咪偷吃了、被外星人带走了等）
+
+示例：
+突发！{{coin}}收集品被发现在农场和猪跳舞，人气大增，积分{"暴涨" if direction == "up" else "暴跌"}{{percent}}！"""
+
+
+def validate_template(text: str, coin: str) -> str | None:
+    """校验并规范化一条文案，不合格返回 None"""
+    text = _LIST_PREFIX_RE.sub("", text).strip().strip("\"'“”")
+    if not text:
+        return None
+    # LLM 直接写了币种名时替换为占位符
+    if "{coin}" not in text and coin in text:
+        text = text.replace(coin, "{coin}", 1)
+    if "{coin}" not in text or "{percent}" not in text:
+        return None
+    if "{" in _PLACEHOLDER_RE.sub("", text) or "}" in _PLACEHOLDER_RE.sub("", text):
+        return None
+    if len(text.format(coin=coin, percent="00.0%")) > MAX_TEXT_LENGTH:
+        return None
+    return text
+
+
+def parse_batch(response: str, coin: str) -> list[str]:
+    """从 LLM 返回中解析出合格的文案"""
+    templates = []
+    for line in response.splitlines():
+        template = validate_template(line, coin)
+        if template is not None and template not in templates:
+            templates.append(template)
+    return templates
+
+
+class EventTextPool:
+    """预生成事件文案池"""
+
+    def __init__(
+        self,
+        coins: list[str],
+        target_per_key: int = DEFAULT_TARGET_PER_KEY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        self.coins = coins
+        self.target_per_key = target_per_key
+        self.batch_size = batch_size
+        self._pool: dict[EventKey, list[str]] = {}
+        self._file: Path | None = None
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.rejected = 0
+
+    def keys(self) -> list[EventKey]:
+        return [
+            (coin, direction, name)
+            for coin in self.coins
+            for direction in ("up", "down")
+            for _, name in MAGNITUDE_BUCKETS
+        ]
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(texts) for texts in self._pool.values())
+
+    def take(self, coin: str, change_percent: float) -> str | None:
+        """取出一条文案并填入币种和涨跌幅，池中没有时返回 None"""
+        key = event_key(coin, change_percent)
+        with self._lock:
+            texts = self._pool.get(key)
+            if not texts:
+                self.misses += 1
+                return None
+            template = texts.pop(random.randrange(len(texts)))
+            self.hits += 1
+            self._dirty = True
+        self._maybe_save()
+        return template.format(coin=coin, percent=f"{abs(change_percent) * 100:.1f}%")
+
+    def next_refill(self) -> EventKey | None:
+        """缺口最大的一档，全部补满时返回 None"""
+        with self._lock:
+            key = min(self.keys(), key=lambda k: len(self._pool.get(k, [])))
+            if len(self._pool.get(key, [])) >= self.target_per_key:
+                return None
+            return key
+
+    def add(self, key: EventKey, response: str) -> int:
+        """解析 LLM 的批量返回并入池，返回入池条数"""
+        templates = parse_batch(response, key[0])
+        self.rejected += max(0, len(response.strip().splitlines()) - len(templates))
+        if not templates:
+            return 0
+        with self._lock:
+            texts = self._pool.setdefault(key, [])
+            room = max(0, self.target_per_key * 2 - len(texts))
+            added = [t for t in templates if t not in texts][:room]
+            texts.extend(added)
+            self.generated += len(added)
+            self._dirty = self._dirty or bool(added)
+        self._maybe_save()
+        return len(added)
+
+    def set_file(self, path: Path):
+        """设置持久化文件并加载已有内容"""
+        self._file = path
+        if not path.exists():
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            with self._lock:
+                for entry in data:
+                    key = (entry["coin"], entry["direction"], entry["bucket"])
+                    self._pool[key] = [
+                        t for t in entry["texts"] if validate_template(t, key[0]) == t
+                    ]
+            logger.info(f"[Event] 已加载 {self.size()} 条预生成事件文案")
+        except Exception as e:
+            logger.error(f"[Event] 加载事件文案池失败: {e}")
+
+    def _maybe_save(self):
+        """有变化且距上次写入超过 SAVE_INTERVAL 时写入"""
+        if self._dirty and time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self.save()
+
+    def flush(self):
+        """立即写入尚未保存的变化"""
+        if self._dirty:
+            self.save()
+
+    def save(self):
+        if self._file is None:
+            return
+        try:
+            with self._lock:
+                self._dirty = False
+                self._saved_at = time.monotonic()
+                data = [
+                    {"coin": k[0], "direction": k[1], "bucket": k[2], "texts": texts}
+                    for k, texts in self._pool.items()
+                    if texts
+                ]
+            tmp = self._file.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            tmp.replace(self._file)
+        except Exception as e:
+            logger.error(f"[Event] 保存事件文案池失败: {e}")
+
+
+__all__ = [
+    "EventTextPool",
+    "build_batch_prompt",
+    "event_key",
+]
@@ -0,0 +1,135 @@
+"""
+群聊活跃度索引
+
+按最后发言时间排序保存群聊（OrderedDict，有新消息就移到末尾），
+"最近 threshold 秒内有发言"的查询从末尾向前扫描，遇到第一个过期的群聊就停止，
+耗时只和活跃群聊数有关；过期的群聊在查询时从头部顺带清理。
+
+每个群聊另有一个分桶计数器（默认 5 个 60 秒的桶），
+记录最近一段时间的消息速率，供随机事件群发时决定发送顺序。
+
+消息在事件循环中记录，查询在市场更新线程中进行，两边共用一把 threading.Lock。
+时间取自注入的时钟（市场引擎传入自己的时钟，模拟和补算时与市场更新一致）。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+DEFAULT_RATE_BUCKET_SECONDS = 60  # 速率计数器每个桶的时长（秒）
+DEFAULT_RATE_BUCKETS = 5  # 速率计数器的桶数（统计最近 5 分钟）
+
+
+class _RateCounter:
+    """环形分桶计数器，记录最近 buckets * bucket_seconds 秒内的消息数"""
+
+    __slots__ = ("counts", "epochs")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.epochs = [-1] * buckets
+
+    def add(self, epoch: int):
+        slot = epoch % len(self.counts)
+        if self.epochs[slot] != epoch:
+            self.epochs[slot] = epoch
+            self.counts[slot] = 0
+        self.counts[slot] += 1
+
+    def total(self, epoch: int) -> int:
+        oldest = epoch - len(self.counts)
+        return sum(c for c, e in zip(self.counts, self.epochs) if e > oldest)
+
+
+class GroupActivityTracker:
+    """群聊活跃度与消息速率"""
+
+    def __init__(
+        self,
+        threshold: float,
+        bucket_seconds: int = DEFAULT_RATE_BUCKET_SECONDS,
+        buckets: int = DEFAULT_RATE_BUCKETS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.threshold = threshold
+        self._clock = clock
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self._last: OrderedDict[str, float] = OrderedDict()
+        self._rates: dict[str, _RateCounter] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, umo: str, now: float | None = None):
+        """记录一条消息"""
+        if now is None:
+            now = self._clock()
+        epoch = int(now // self.bucket_seconds)
+        with self._lock:
+            self._last[umo] = now
+            self._last.move_to_end(umo)
+            counter = self._rates.get(umo)
+            if counter is None:
+                counter = self._rates[umo] = _RateCounter(self.buckets)
+            counter.add(epoch)
+
+    def last_activity(self, umo: str) -> float:
+        """最后发言时间，没有记录时返回 0"""
+        with self._lock:
+            return self._last.get(umo, 0.0)
+
+    def _prune(self, now: float):
+        """从头部移除已过期的群聊（调用方持有锁）"""
+        while self._last:
+            umo, last = next(iter(self._last.items()))
+            if now - last < self.threshold:
+                break
+            self._last.popitem(last=False)
+            self._rates.pop(umo, None)
+
+    def active(self, now: float | None = None) -> list[str]:
+        """最近 threshold 秒内有发言的群聊，按最后发言时间从新到旧"""
+        if now is None:
+            now = self._clock()
+        with self._lock:
+            self._prune(now)
+            return list(reversed(self._last))
+
+    def has_active(self, now: float | None = None) -> bool:
+        if now is None:
+            now = self._clock()
+        with self._lock:
+            self._prune(now)
+            return bool(self._last)
+
+    def message_rate(self, umo: str, now: float | None = None) -> float:
+        """最近统计窗口内的消息速率（条/分钟）"""
+        if now is None:
+            now = self._clock()
+        epoch = int(now // self.bucket_seconds)
+        with self._lock:
+            counter = self._rates.get(umo)
+            count = counter.total(epoch) if counter is not None else 0
+        return count * 60 / (self.bucket_seconds * self.buckets)
+
+    def rates(self, umos: list[str], now: float | None = None) -> dict[str, float]:
+        """批量查询消息速率（条/分钟）"""
+        if now is None:
+            now = self._clock()
+        return {umo: self.message_rate(umo, now) for umo in umos}
+
+    def retain(self, umos: set[str] | frozenset[str]):
+        """只保留指定群聊的记录（白名单变更时调用）"""
+        with self._lock:
+            for umo in [u for u in self._last if u not in umos]:
+                del self._last[umo]
+                self._rates.pop(umo, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._last)
+
+
+__all__ = [
+    "GroupActivityTracker",
+]
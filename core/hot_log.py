@@ -0,0 +1,173 @@
+"""
+热路径日志
+
+高频代码路径（群聊活跃度、流动性压力、资金费、市场更新、回声洞等）不直接调用 logger.info，
+而是通过 hot_log(类别, 模板, *参数) 记录，每个类别可以单独配置：
+- 采样：每 sample_every 条只考虑输出 1 条
+- 限速：令牌桶，每秒最多输出 rate 条（0 表示不限）
+- 延迟格式化：决定输出后才用 str.format 填入参数，被丢弃的日志不做格式化
+- 汇总：每 summary_interval 秒输出一次各类别的调用次数，
+  例如 "[Log] 群聊活跃度更新: 最近60秒 1,204 次，输出 0 条"（窗口内没有被丢弃的日志时不输出）
+hot_count(类别) 只计数不输出单条日志，用于每条群消息都会经过的路径。
+
+计数不加锁，多线程同时记录时汇总数字可能略有偏差，不影响业务。
+"""
+
+import time
+from dataclasses import dataclass, field
+
+from astrbot.api import logger
+
+DEFAULT_SUMMARY_INTERVAL = 60.0  # 汇总输出间隔（秒）
+
+
+@dataclass
+class LogCategory:
+    """一类热路径日志的输出规则和计数"""
+
+    name: str
+    label: str  # 汇总日志中显示的名称
+    sample_every: int = 1  # 每 N 条考虑输出 1 条
+    rate: float = 0.0  # 每秒最多输出条数，0 表示不限
+    burst: int = 5  # 令牌桶容量
+    level: str = "info"
+    # 计数
+    calls: int = 0
+    emitted: int = 0
+    window_calls: int = 0
+    window_emitted: int = 0
+    tokens: float = field(default=0.0, repr=False)
+    updated: float = field(default_factory=time.monotonic, repr=False)
+
+    def __post_init__(self):
+        self.tokens = float(self.burst)
+
+    def admit(self) -> bool:
+        """计数，并决定本条是否输出"""
+        self.calls += 1
+        self.window_calls += 1
+        if self.sample_every > 1 and self.calls % self.sample_every:
+            return False
+        if self.rate > 0:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+        self.emitted += 1
+        self.window_emitted += 1
+        return True
+
+
+_categories: dict[str, LogCategory] = {
+    "activity": LogCategory("activity", "群聊活跃度更新"),
+    "liquidity": LogCategory("liquidity", "流动性压力变化", rate=1.0),
+    "funding": LogCategory("funding", "资金费结算", rate=2.0, burst=10),
+    "tick": LogCategory("tick", "市场更新", sample_every=10),
+    "cave": LogCategory("cave", "回声洞获取", rate=1.0),
+    "user": LogCategory("user", "用户命令", rate=1.0),
+}
+_summary_interval = DEFAULT_SUMMARY_INTERVAL
+_window_started = time.monotonic()
+
+
+def _category(name: str) -> LogCategory:
+    category = _categories.get(name)
+    if category is None:
+        category = _categories[name] = LogCategory(name, name)
+    return category
+
+
+def hot_log(name: str, message: str, *args) -> bool:
+    """按类别规则输出一条日志，message 为 str.format 模板
+
+    Returns:
+        是否实际输出
+    """
+    category = _categories.get(name) or _category(name)
+    if not category.admit():
+        _maybe_summarize()
+        return False
+    getattr(logger, category.level)(message.format(*args) if args else message)
+    _maybe_summarize()
+    return True
+
+
+def hot_count(name: str):
+    """只计数，不输出单条日志"""
+    category = _categories.get(name) or _category(name)
+    category.calls += 1
+    category.window_calls += 1
+
+
+def _maybe_summarize():
+    if time.monotonic() - _window_started >= _summary_interval:
+        log_summaries()
+
+
+def log_summaries():
+    """输出上一个汇总窗口内各类别的调用次数，并开始新的窗口
+
+    窗口内所有日志都已输出的类别不再重复汇总。由市场更新线程定期调用，
+    没有新日志时也能输出最后一个窗口的汇总。
+    """
+    global _window_started
+    now = time.monotonic()
+    elapsed = now - _window_started
+    if elapsed < _summary_interval:
+        return
+    _window_started = now
+    for category in list(_categories.values()):
+        calls, emitted = category.window_calls, category.window_emitted
+        category.window_calls = category.window_emitted = 0
+        if calls > emitted:
+            logger.info(
+                f"[Log] {category.label}: 最近{elapsed:.0f}秒 {calls:,} 次，输出 {emitted:,} 条"
+            )
+
+
+def configure_hot_log(rules: list[str] | None = None, summary_interval: float | None = None):
+    """设置各类别的采样和限速规则
+
+    Args:
+        rules: 规则列表，每条格式为 "类别:采样间隔:每秒条数"，
+            例如 "liquidity:10:1" 表示每10条考虑1条、每秒最多输出1条；后两项可省略
+        summary_interval: 汇总输出间隔（秒）
+    """
+    global _summary_interval
+    if summary_interval is not None:
+        _summary_interval = max(1.0, float(summary_interval))
+    for rule in rules or []:
+        parts = [p.strip() for p in str(rule).split(":")]
+        try:
+            if not parts[0]:
+                raise ValueError(rule)
+            sample_every = int(parts[1]) if len(parts) > 1 and parts[1] else None
+            rate = float(parts[2]) if len(parts) > 2 and parts[2] else None
+        except ValueError:
+            logger.warning(f"[Log] 无效的日志规则: {rule}")
+            continue
+        category = _category(parts[0])
+        if sample_every is not None:
+            category.sample_every = max(1, sample_every)
+        if rate is not None:
+            category.rate = max(0.0, rate)
+        limit = f"每秒最多 {category.rate:g} 条" if category.rate > 0 else "不限速"
+        logger.info(
+            f"[Log] 日志类别 {category.name}: 每 {category.sample_every} 条采样 1 条，{limit}"
+        )
+
+
+def get_log_categories() -> dict[str, LogCategory]:
+    return _categories
+
+
+__all__ = [
+    "LogCategory",
+    "configure_hot_log",
+    "get_log_categories",
+    "hot_count",
+    "hot_log",
+    "log_summaries",
+]
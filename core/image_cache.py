@@ -0,0 +1,291 @@
+"""
+磁盘图片缓存
+
+图片按内容的 SHA-256 存放（blobs/<前两位>/<摘要>.<扩展名>），相同内容只保存一份；
+缓存键（如签到卡片的 (qq, 日期)、回声洞图片的 URL 哈希）到内容摘要的映射保存在内存索引中，
+并持久化到 index.json，重启后无需扫描目录。索引有变化时最多每 INDEX_SAVE_INTERVAL 秒写一次，
+插件停用时 close_image_cache() 写入剩余的变化。异常退出时最多丢失最近一段时间的索引条目，
+对应的图片文件不再被引用，启动时扫描图片目录删除这些文件。
+总大小超过上限时按最近最少使用淘汰，没有键引用的图片文件随之删除。
+哈希和文件读写在事件循环中应通过 *_async 方法在线程中执行，避免大图片阻塞其他命令。
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from astrbot.api import logger
+from astrbot.core.utils.astrbot_path import get_astrbot_data_path
+
+from .metrics import register_collector
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024  # 默认缓存上限 200MB
+INDEX_FILE_NAME = "index.json"
+INDEX_SAVE_INTERVAL = 30.0  # 索引写入间隔（秒）
+
+# 常见图片格式的文件头，用于确定扩展名
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"RIFF", ".webp"),
+)
+
+
+def _guess_extension(content: bytes) -> str:
+    for signature, ext in _IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return ext
+    return ".img"
+
+
+def url_key(url: str) -> str:
+    """回声洞图片的缓存键"""
+    return "url:" + hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def check_card_key(qq: int, day: str) -> str:
+    """签到卡片的缓存键"""
+    return f"check:{qq}:{day}"
+
+
+class DiskImageCache:
+    """内容寻址的磁盘图片缓存，带 LRU 淘汰"""
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._blob_dir = directory / "blobs"
+        self._blob_dir.mkdir(parents=True, exist_ok=True)
+        self._index_file = directory / INDEX_FILE_NAME
+        # 键 -> 文件名（摘要+扩展名），按访问顺序排列
+        self._keys: OrderedDict[str, str] = OrderedDict()
+        # 文件名 -> (大小, 引用计数)
+        self._blobs: dict[str, tuple[int, int]] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._index_dirty = False
+        self._index_saved_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._load_index()
+        self._remove_orphans()
+
+    def _blob_path(self, name: str) -> Path:
+        return self._blob_dir / name[:2] / name
+
+    def _load_index(self):
+        """加载索引，丢弃文件已不存在的条目"""
+        if not self._index_file.exists():
+            return
+        try:
+            with open(self._index_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"[ImageCache] 索引读取失败，重建空缓存: {e}")
+            return
+        for key, name in entries:
+            if name in self._blobs:
+                size, refs = self._blobs[name]
+                self._blobs[name] = (size, refs + 1)
+            else:
+                path = self._blob_path(name)
+                if not path.exists():
+                    continue
+                size = path.stat().st_size
+                self._blobs[name] = (size, 1)
+                self.total_bytes += size
+            self._keys[key] = name
+        logger.info(
+            f"[ImageCache] 已加载 {len(self._keys)} 条图片缓存，"
+            f"共 {self.total_bytes / 1024 / 1024:.1f}MB"
+        )
+
+    def _remove_orphans(self):
+        """删除索引中没有引用的图片文件（异常退出前写入、索引尚未保存的图片，以及中断写入的临时文件）"""
+        removed = 0
+        freed = 0
+        for path in self._blob_dir.glob("*/*"):
+            if path.name in self._blobs:
+                continue
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"[ImageCache] 删除未引用的图片失败: {e}")
+                continue
+            removed += 1
+            freed += size
+        if removed:
+            logger.info(
+                f"[ImageCache] 已删除 {removed} 个未引用的图片文件，"
+                f"释放 {freed / 1024 / 1024:.1f}MB"
+            )
+
+    def _save_index(self):
+        """原子写入索引（先写临时文件再替换）"""
+        tmp = self._index_file.with_suffix(".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(list(self._keys.items()), f)
+            os.replace(tmp, self._index_file)
+        except Exception as e:
+            logger.error(f"[ImageCache] 保存索引失败: {e}")
+        self._index_dirty = False
+        self._index_saved_at = time.monotonic()
+
+    def _maybe_save_index(self):
+        """索引有变化且距上次写入超过 INDEX_SAVE_INTERVAL 时写入"""
+        if self._index_dirty and time.monotonic() - self._index_saved_at >= INDEX_SAVE_INTERVAL:
+            self._save_index()
+
+    def flush(self):
+        """立即写入尚未保存的索引变化"""
+        with self._lock:
+            if self._index_dirty:
+                self._save_index()
+
+    def get(self, key: str) -> Path | None:
+        """读取缓存图片的路径，不存在返回 None"""
+        with self._lock:
+            name = self._keys.get(key)
+            if name is None:
+                self.misses += 1
+                return None
+            path = self._blob_path(name)
+            if not path.exists():
+                self._remove_key(key)
+                self.misses += 1
+                return None
+            self._keys.move_to_end(key)
+            self.hits += 1
+            return path
+
+    def get_bytes(self, key: str) -> bytes | None:
+        """读取缓存图片的内容"""
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def put(self, key: str, content: bytes) -> Path | None:
+        """写入图片，返回缓存文件路径；写入失败返回 None"""
+        name = hashlib.sha256(content).hexdigest() + _guess_extension(content)
+        path = self._blob_path(name)
+        with self._lock:
+            try:
+                if name not in self._blobs:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = path.with_suffix(".tmp")
+                    tmp.write_bytes(content)
+                    os.replace(tmp, path)
+            except OSError as e:
+                logger.error(f"[ImageCache] 写入图片失败: {e}")
+                return None
+
+            if self._keys.get(key) != name:
+                self._remove_key(key)
+                size, refs = self._blobs.get(name, (len(content), 0))
+                if refs == 0:
+                    self.total_bytes += size
+                self._blobs[name] = (size, refs + 1)
+                self._keys[key] = name
+            self._keys.move_to_end(key)
+            self._evict()
+            self._index_dirty = True
+            self._maybe_save_index()
+            return path if key in self._keys else None
+
+    async def get_async(self, key: str) -> Path | None:
+        """get() 的线程版本，在事件循环中使用"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def get_bytes_async(self, key: str) -> bytes | None:
+        """get_bytes() 的线程版本，在事件循环中使用"""
+        return await asyncio.to_thread(self.get_bytes, key)
+
+    async def put_async(self, key: str, content: bytes) -> Path | None:
+        """put() 的线程版本，在事件循环中使用"""
+        return await asyncio.to_thread(self.put, key, content)
+
+    def _remove_key(self, key: str):
+        """删除键，图片不再被引用时删除文件"""
+        name = self._keys.pop(key, None)
+        if name is None:
+            return
+        self._index_dirty = True
+        size, refs = self._blobs.get(name, (0, 1))
+        if refs > 1:
+            self._blobs[name] = (size, refs - 1)
+            return
+        self._blobs.pop(name, None)
+        self.total_bytes -= size
+        try:
+            self._blob_path(name).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"[ImageCache] 删除图片失败: {e}")
+
+    def _evict(self):
+        """超过上限时淘汰最久未使用的条目"""
+        while self.total_bytes > self.max_bytes and self._keys:
+            key = next(iter(self._keys))
+            self._remove_key(key)
+
+
+# 插件级图片缓存，未初始化时不做磁盘缓存
+_image_cache: DiskImageCache | None = None
+
+
+def init_image_cache(plugin_name: str, max_mb: float | None = None):
+    """在插件数据目录下初始化图片缓存，max_mb 为 0 时关闭缓存"""
+    global _image_cache
+    max_bytes = DEFAULT_MAX_BYTES if max_mb is None else int(max_mb * 1024 * 1024)
+    if max_bytes <= 0:
+        _image_cache = None
+        logger.info("[ImageCache] 图片缓存已关闭")
+        return
+    directory = Path(get_astrbot_data_path()) / "plugin_data" / plugin_name / "image_cache"
+    _image_cache = DiskImageCache(directory, max_bytes)
+
+
+def get_image_cache() -> DiskImageCache | None:
+    return _image_cache
+
+
+def close_image_cache():
+    """写入尚未保存的索引变化（插件停用时调用）"""
+    if _image_cache is not None:
+        _image_cache.flush()
+
+
+def _collect_metrics():
+    cache = _image_cache
+    if cache is None:
+        return []
+    return [
+        ("image_cache_hits", {}, cache.hits),
+        ("image_cache_misses", {}, cache.misses),
+        ("image_cache_bytes", {}, cache.total_bytes),
+    ]
+
+
+register_collector(_collect_metrics)
+
+
+__all__ = [
+    "DiskImageCache",
+    "init_image_cache",
+    "get_image_cache",
+    "close_image_cache",
+    "url_key",
+    "check_card_key",
+]
@@ -0,0 +1,181 @@
+"""
+插件的 LLM 调用网关
+
+所有 LLM 调用经过 LLMGateway.generate：
+- provider id 缓存 provider_ttl 秒，不用每次调用都查询；调用出错时立即失效
+- 每次调用有截止时间（timeout），超时取消请求
+- 同时进行的调用数有上限（max_inflight），每小时调用次数有上限（max_calls_per_hour）
+- 超出预算、超时或出错时返回空字符串，由调用方退回模板文案
+记录调用次数、延迟和 token 用量（provider 返回 usage 时），可通过 snapshot() 查看。
+
+调用来自不同线程中各自的事件循环，计数只使用 threading.Lock，不持有 asyncio 对象。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from astrbot.api import logger
+from astrbot.api.star import Context
+
+DEFAULT_PROVIDER_TTL = 300.0  # provider id 缓存时长（秒）
+DEFAULT_TIMEOUT = 20.0  # 单次调用截止时间（秒）
+DEFAULT_MAX_INFLIGHT = 2  # 同时进行的调用数上限
+DEFAULT_MAX_CALLS_PER_HOUR = 60  # 每小时调用次数上限，0 表示不限
+LATENCY_SAMPLES = 200
+
+
+class LLMGateway:
+    """带缓存、超时和调用预算的 LLM 调用入口"""
+
+    def __init__(
+        self,
+        context: Context | None = None,
+        provider_ttl: float = DEFAULT_PROVIDER_TTL,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_inflight: int = DEFAULT_MAX_INFLIGHT,
+        max_calls_per_hour: int = DEFAULT_MAX_CALLS_PER_HOUR,
+    ):
+        self.context = context
+        self.provider_ttl = provider_ttl
+        self.timeout = timeout
+        self.max_inflight = max(1, max_inflight)
+        self.max_calls_per_hour = max_calls_per_hour
+        self._provider_id: str | None = None
+        self._provider_resolved_at = 0.0
+        self._inflight = 0
+        self._call_times: deque[float] = deque()
+        self._lock = threading.Lock()
+        # 统计
+        self.calls = 0
+        self.successes = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def invalidate_provider(self):
+        with self._lock:
+            self._provider_id = None
+            self._provider_resolved_at = 0.0
+
+    async def _get_provider_id(self, umo: str) -> str | None:
+        with self._lock:
+            if (
+                self._provider_id
+                and time.monotonic() - self._provider_resolved_at < self.provider_ttl
+            ):
+                return self._provider_id
+        assert self.context is not None
+        provider_id = await self.context.get_current_chat_provider_id(umo=umo)
+        with self._lock:
+            self._provider_id = provider_id or None
+            self._provider_resolved_at = time.monotonic()
+        return provider_id
+
+    def _acquire(self) -> bool:
+        """占用一个调用名额，超出并发或每小时预算时返回 False"""
+        with self._lock:
+            now = time.monotonic()
+            while self._call_times and now - self._call_times[0] > 3600:
+                self._call_times.popleft()
+            if self._inflight >= self.max_inflight:
+                return False
+            if self.max_calls_per_hour and len(self._call_times) >= self.max_calls_per_hour:
+                return False
+            self._inflight += 1
+            self._call_times.append(now)
+            self.calls += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._inflight -= 1
+
+    def _record_usage(self, llm_resp):
+        """记录 token 用量（OpenAI 兼容的 raw_completion.usage）"""
+        usage = getattr(getattr(llm_resp, "raw_completion", None), "usage", None)
+        if usage is None:
+            return
+        with self._lock:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    async def generate(
+        self, prompt: str, umo: str = "_default_", timeout: float | None = None
+    ) -> str:
+        """调用 LLM 生成文本
+
+        Returns:
+            生成的文本；没有可用 provider、超出预算、超时或出错时返回空字符串
+        """
+        if self.context is None:
+            logger.warning("[LLM] 插件Context未设置")
+            return ""
+        if not self._acquire():
+            with self._lock:
+                self.rejected += 1
+            logger.warning("[LLM] 超出调用预算（并发或每小时次数），跳过本次调用")
+            return ""
+
+        started = time.monotonic()
+        deadline = timeout if timeout is not None else self.timeout
+        try:
+            provider_id = await asyncio.wait_for(self._get_provider_id(umo), deadline)
+            if not provider_id:
+                logger.warning("[LLM] 未找到可用的LLM provider")
+                return ""
+            remaining = max(0.1, deadline - (time.monotonic() - started))
+            llm_resp = await asyncio.wait_for(
+                self.context.llm_generate(chat_provider_id=provider_id, prompt=prompt),
+                remaining,
+            )
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            logger.warning(f"[LLM] 调用超时（{deadline:g}s）")
+            return ""
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            self.invalidate_provider()
+            logger.error(f"[LLM] 调用异常: {e}")
+            return ""
+        finally:
+            self._release()
+
+        latency = time.monotonic() - started
+        with self._lock:
+            self.latencies.append(latency)
+        self._record_usage(llm_resp)
+        if llm_resp and llm_resp.completion_text:
+            with self._lock:
+                self.successes += 1
+            return llm_resp.completion_text
+        return ""
+
+    def snapshot(self) -> dict:
+        """统计快照"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                "calls": self.calls,
+                "successes": self.successes,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "inflight": self._inflight,
+                "calls_last_hour": len(self._call_times),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+                "latency_max": latencies[-1] if latencies else 0.0,
+            }
+
+
+__all__ = [
+    "LLMGateway",
+]
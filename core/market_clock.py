@@ -0,0 +1,44 @@
+"""
+市场引擎的时钟
+
+市场更新、挂单过期、资金费结算和随机事件冷却都通过注入的时钟取时间，而不是直接调用
+time.time() / datetime.now()：
+- MarketClock：真实时间（默认）
+- SimulatedClock：模拟时间，只在 advance() 时前进，用于离线快进和停机补算，
+  配合固定种子的 random.Random，同样的起点和参数总能得到同样的行情
+"""
+
+import time
+from datetime import datetime
+
+
+class MarketClock:
+    """真实时钟"""
+
+    def time(self) -> float:
+        return time.time()
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+
+class SimulatedClock(MarketClock):
+    """模拟时钟，从 start（秒级时间戳）开始，只在 advance() 时前进"""
+
+    def __init__(self, start: float):
+        self._now = float(start)
+
+    def time(self) -> float:
+        return self._now
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self._now)
+
+    def advance(self, seconds: float):
+        self._now += seconds
+
+
+__all__ = [
+    "MarketClock",
+    "SimulatedClock",
+]
@@ -0,0 +1,356 @@
+"""
+插件内置指标
+
+轻量的计数器（Counter）、仪表（Gauge）和延迟直方图（Histogram），用于观察热点路径耗时：
+- 市场更新每个阶段、数据库读写、K线图渲染、MikuChat SDK 调用、bi_* 命令
+- 直方图按 HDR 方式分桶：用 math.frexp 取二进制指数，每个 2 倍区间再分 8 个子桶，
+  相对误差约 6%，桶是稀疏字典，内存只和出现过的量级有关
+- 一次记录只有一次 frexp、一次字典自增和一把锁，开销在微秒以内
+
+其他模块已有的统计（重试/熔断、LLM 网关、群发、缓存命中）通过 register_collector
+注册的回调在导出时读取，不在热路径上重复计数。
+render_prometheus() 输出 Prometheus 文本格式，write_prometheus() 写入文件。
+"""
+
+import asyncio
+import functools
+import inspect
+import math
+import threading
+import time
+from collections.abc import Callable, Iterable
+from contextlib import contextmanager
+from math import frexp
+from pathlib import Path
+
+from astrbot.api import logger
+
+HISTOGRAM_SUB_BUCKETS = 8  # 每个 2 倍区间的子桶数
+HISTOGRAM_MIN_VALUE = 1e-7  # 小于该值的记录归入最小桶
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels_key(labels: dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Counter:
+    """单调递增计数"""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """当前值"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram:
+    """HDR 风格的对数分桶直方图"""
+
+    __slots__ = ("buckets", "count", "total", "max", "_lock")
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _index(value: float) -> int:
+        mantissa, exponent = math.frexp(max(value, HISTOGRAM_MIN_VALUE))
+        # mantissa 在 [0.5, 1) 内，均分为 HISTOGRAM_SUB_BUCKETS 份
+        return exponent * HISTOGRAM_SUB_BUCKETS + int((mantissa - 0.5) * 2 * HISTOGRAM_SUB_BUCKETS)
+
+    @staticmethod
+    def _upper(index: int) -> float:
+        exponent, sub = divmod(index, HISTOGRAM_SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub + 1) / (2 * HISTOGRAM_SUB_BUCKETS), exponent)
+
+    def observe(self, value: float):
+        # 与 _index 相同，内联以减少热路径上的函数调用
+        mantissa, exponent = frexp(value if value > HISTOGRAM_MIN_VALUE else HISTOGRAM_MIN_VALUE)
+        index = exponent * HISTOGRAM_SUB_BUCKETS + int((mantissa - 0.5) * 2 * HISTOGRAM_SUB_BUCKETS)
+        with self._lock:
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """分位数（返回所在桶的上界）"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for index in sorted(self.buckets):
+                seen += self.buckets[index]
+                if seen >= rank:
+                    return min(self._upper(index), self.max)
+            return self.max
+
+
+class MetricsRegistry:
+    """按 (名称, 标签) 保存指标"""
+
+    def __init__(self):
+        self._metrics: dict[str, dict[Labels, Counter | Gauge | Histogram]] = {}
+        self._types: dict[str, type] = {}
+        self._help: dict[str, str] = {}
+        self._collectors: list[Callable[[], Iterable[tuple[str, dict, float]]]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, kind: type, name: str, labels: dict[str, object]):
+        key = _labels_key(labels)
+        series = self._metrics.get(name)
+        if series is not None:
+            metric = series.get(key)
+            if metric is not None:
+                return metric
+        with self._lock:
+            if self._types.setdefault(name, kind) is not kind:
+                raise ValueError(f"指标 {name} 已注册为 {self._types[name].__name__}")
+            series = self._metrics.setdefault(name, {})
+            metric = series.get(key)
+            if metric is None:
+                metric = series[key] = kind()
+            return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self._get(Gauge, name, labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get(Histogram, name, labels)
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def register_collector(self, collector: Callable[[], Iterable[tuple[str, dict, float]]]):
+        """注册导出时调用的回调，回调返回 [(指标名, 标签, 值)]，作为 gauge 导出"""
+        self._collectors.append(collector)
+
+    def _collect(self) -> dict[str, dict[Labels, float]]:
+        collected: dict[str, dict[Labels, float]] = {}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    collected.setdefault(name, {})[_labels_key(labels)] = float(value)
+            except Exception as e:
+                logger.warning(f"[Metrics] 读取统计失败: {e}")
+        return collected
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（直方图以 summary 形式导出分位数）"""
+        lines = []
+        with self._lock:
+            metrics = {name: dict(series) for name, series in self._metrics.items()}
+        for name in sorted(metrics):
+            kind = self._types[name]
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            if kind is Histogram:
+                lines.append(f"# TYPE {name} summary")
+                for labels, hist in sorted(metrics[name].items()):
+                    for q in SUMMARY_QUANTILES:
+                        lines.append(
+                            f"{name}{_format_labels(labels, (('quantile', str(q)),))} {hist.quantile(q):.9g}"
+                        )
+                    lines.append(f"{name}_sum{_format_labels(labels)} {hist.total:.9g}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+            else:
+                lines.append(f"# TYPE {name} {'counter' if kind is Counter else 'gauge'}")
+                for labels, metric in sorted(metrics[name].items()):
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value:.9g}")
+        for name, series in sorted(self._collect().items()):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def histograms(self, prefix: str = "") -> list[tuple[str, Labels, Histogram]]:
+        with self._lock:
+            return [
+                (name, labels, metric)
+                for name, series in self._metrics.items()
+                if name.startswith(prefix) and self._types[name] is Histogram
+                for labels, metric in series.items()
+            ]
+
+    def collected(self) -> dict[str, dict[Labels, float]]:
+        return self._collect()
+
+
+# 插件全局指标
+registry = MetricsRegistry()
+
+
+def counter(name: str, **labels) -> Counter:
+    return registry.counter(name, **labels)
+
+
+def gauge(name: str, **labels) -> Gauge:
+    return registry.gauge(name, **labels)
+
+
+def histogram(name: str, **labels) -> Histogram:
+    return registry.histogram(name, **labels)
+
+
+def register_collector(collector: Callable[[], Iterable[tuple[str, dict, float]]]):
+    registry.register_collector(collector)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """记录代码块耗时（秒）到直方图"""
+    hist = registry.histogram(name, **labels)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observe(time.perf_counter() - started)
+
+
+def timed(name: str, key: str = "op"):
+    """记录函数耗时的装饰器，标签 {key: 函数名}
+
+    支持普通函数、协程函数和异步生成器（记录从开始到迭代结束的总耗时）。
+    抛出异常时另外计入 {name 去掉 _seconds}_errors_total（协程和异步生成器被取消也计入）。
+    """
+    errors_name = name.removesuffix("_seconds") + "_errors_total"
+
+    def decorator(func):
+        labels = {key: func.__name__}
+        hist = registry.histogram(name, **labels)
+
+        def record_error():
+            registry.counter(errors_name, **labels).inc()
+
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def asyncgen_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except (Exception, asyncio.CancelledError):
+                    record_error()
+                    raise
+                finally:
+                    hist.observe(time.perf_counter() - started)
+
+            return asyncgen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except (Exception, asyncio.CancelledError):
+                    record_error()
+                    raise
+                finally:
+                    hist.observe(time.perf_counter() - started)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                record_error()
+                raise
+            finally:
+                hist.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def render_prometheus() -> str:
+    return registry.render_prometheus()
+
+
+def write_prometheus(path: Path):
+    """把当前指标以 Prometheus 文本格式写入文件（先写临时文件再替换）"""
+    try:
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(render_prometheus(), encoding="utf-8")
+        tmp.replace(path)
+    except Exception as e:
+        logger.error(f"[Metrics] 写入指标快照失败: {e}")
+
+
+def format_stats(prefixes: Iterable[str]) -> list[str]:
+    """按前缀列出直方图的次数和分位数（毫秒），用于 bi_stats 命令"""
+    lines = []
+    for prefix in prefixes:
+        for name, labels, hist in sorted(
+            registry.histograms(prefix), key=lambda item: (item[0], item[1])
+        ):
+            if not hist.count:
+                continue
+            label = ",".join(v for _, v in labels) or name
+            lines.append(
+                f"{label}: {hist.count}次 p50 {hist.quantile(0.5) * 1000:.2f}ms "
+                f"p99 {hist.quantile(0.99) * 1000:.2f}ms max {hist.max * 1000:.2f}ms"
+            )
+    return lines
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "counter",
+    "format_stats",
+    "gauge",
+    "histogram",
+    "register_collector",
+    "registry",
+    "render_prometheus",
+    "timed",
+    "timer",
+    "write_prometheus",
+]
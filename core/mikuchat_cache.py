@@ -0,0 +1,166 @@
+"""
+MikuChat API 异步读穿缓存
+
+缓存未命中时调用 fetch 获取数据并写入缓存；同一个 key 同时只会有一个请求在进行，
+并发的相同请求等待同一个结果。请求作为独立任务运行，单个等待者被取消不影响其他等待者，
+所有等待者都取消后才取消请求。invalidate() 之前发起、之后才返回的请求结果不写入缓存。
+超过 maxsize 时淘汰最久未使用的条目，
+ttl 为 None 时条目永不过期（用于不可变数据，如回声洞）。
+过期条目在被 LRU 淘汰前仍然保留，请求失败时（如 API 熔断）可以退回使用过期数据。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Generic, TypeVar
+
+V = TypeVar("V")
+
+
+class AsyncTTLCache(Generic[V]):
+    """带 TTL 和 LRU 淘汰的异步缓存，合并并发的相同请求"""
+
+    def __init__(self, maxsize: int = 256, ttl: float | None = None):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float | None, V]] = OrderedDict()
+        self._inflight: dict[Hashable, _Inflight] = {}
+        # 有未完成请求的 key 被 invalidate 的次数，以及未完成的请求数（包括已被 invalidate 分离的）
+        self._generations: dict[Hashable, int] = {}
+        self._pending: dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def get(self, key: Hashable) -> V | None:
+        """读取缓存（不发起请求），过期或不存在返回 None"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get_stale(self, key: Hashable) -> V | None:
+        """读取缓存，包括已过期的条目"""
+        entry = self._data.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key: Hashable, value: V):
+        """写入缓存"""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """删除缓存条目，进行中的请求结果不再写入缓存，之后的请求重新获取"""
+        self._data.pop(key, None)
+        self._inflight.pop(key, None)
+        if key in self._pending:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        self._data.clear()
+        self._inflight.clear()
+        for key in self._pending:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def metric_samples(self, name: str) -> list[tuple[str, dict, float]]:
+        """命中统计，供指标导出（见 metrics.register_collector）"""
+        labels = {"cache": name}
+        return [
+            ("mikuchat_cache_hits", labels, self.hits),
+            ("mikuchat_cache_misses", labels, self.misses),
+            ("mikuchat_cache_stale_hits", labels, self.stale_hits),
+            ("mikuchat_cache_size", labels, len(self._data)),
+        ]
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[V | None]],
+        stale_on_error: bool = True,
+    ) -> V | None:
+        """读取缓存，未命中时调用 fetch 并缓存结果（None 不缓存）
+
+        stale_on_error 为 True 时，fetch 抛出异常且存在过期条目则返回过期条目。
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            generation = self._generations.get(key, 0)
+            task = asyncio.ensure_future(self._fetch(key, fetch, stale_on_error, generation))
+            inflight = _Inflight(task)
+            self._inflight[key] = inflight
+            self._pending[key] = self._pending.get(key, 0) + 1
+            task.add_done_callback(lambda t: self._fetch_done(key, inflight))
+
+        inflight.waiters += 1
+        try:
+            return await asyncio.shield(inflight.task)
+        except asyncio.CancelledError:
+            # 最后一个等待者取消时才取消请求
+            if inflight.waiters == 1 and not inflight.task.done():
+                inflight.task.cancel()
+            raise
+        finally:
+            inflight.waiters -= 1
+
+    async def _fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[V | None]],
+        stale_on_error: bool,
+        generation: int,
+    ) -> V | None:
+        try:
+            value = await fetch()
+        except Exception:
+            stale = self.get_stale(key) if stale_on_error else None
+            if stale is not None:
+                self.stale_hits += 1
+                return stale
+            raise
+        # 发起后被 invalidate 过的请求结果可能已过时，只返回给本次的等待者
+        if value is not None and self._generations.get(key, 0) == generation:
+            self.set(key, value)
+        return value
+
+    def _fetch_done(self, key: Hashable, inflight: "_Inflight"):
+        if self._inflight.get(key) is inflight:
+            del self._inflight[key]
+        if self._pending[key] > 1:
+            self._pending[key] -= 1
+        else:
+            del self._pending[key]
+            self._generations.pop(key, None)
+        # 没有等待者时避免 "exception was never retrieved" 警告
+        if not inflight.task.cancelled():
+            inflight.task.exception()
+
+
+class _Inflight:
+    """进行中的请求及其等待者数量"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+__all__ = [
+    "AsyncTTLCache",
+]
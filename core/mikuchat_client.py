@@ -0,0 +1,186 @@
+"""
+MikuChat API 共享 HTTP 客户端
+
+所有 mikuchat.apis 封装（Cave / User / UserCheck）共用一个插件级的 httpx.AsyncClient，
+复用 keep-alive 连接，避免每条命令重新建立 TCP/TLS 连接。安装了 h2 时自动启用 HTTP/2。
+httpx.AsyncClient 绑定创建时的事件循环，每个事件循环各有一个客户端，在第一次使用时创建。
+各插件类加载时调用 acquire_http_client()、停用时调用 release_http_client()，
+最后一个使用者释放时才关闭客户端，停用其中一个插件类不影响其他插件类进行中的请求。
+"""
+
+import asyncio
+import importlib.util
+import re
+from collections.abc import Awaitable, Callable, Iterable
+from typing import TypeVar
+
+import httpx
+from astrbot.api import logger
+
+# 连接池与超时配置
+HTTP_MAX_CONNECTIONS = 20  # 最大连接数
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10  # 最大空闲保持连接数
+HTTP_KEEPALIVE_EXPIRY = 60.0  # 空闲连接保持时间（秒）
+HTTP_TIMEOUT = 10.0  # 请求超时（秒）
+HTTP_CONNECT_TIMEOUT = 5.0  # 建立连接超时（秒）
+
+# 批量查询配置
+BATCH_CONCURRENCY = 5  # 批量查询时同时进行的请求数
+BATCH_MAX_SIZE = 10  # 单条命令最多查询的条数
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# 是否可用 HTTP/2（需要安装 h2: pip install httpx[http2]）
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 事件循环 -> 该循环的客户端（不在事件循环中创建的客户端键为 None）
+_clients: dict[asyncio.AbstractEventLoop | None, httpx.AsyncClient] = {}
+_client_users = 0
+
+
+def set_http_client_options(
+    max_connections: int | None = None,
+    max_keepalive_connections: int | None = None,
+    keepalive_expiry: float | None = None,
+    timeout: float | None = None,
+    connect_timeout: float | None = None,
+):
+    """设置连接池和超时参数，在下次创建客户端时生效"""
+    global \
+        HTTP_MAX_CONNECTIONS, \
+        HTTP_MAX_KEEPALIVE_CONNECTIONS, \
+        HTTP_KEEPALIVE_EXPIRY, \
+        HTTP_TIMEOUT, \
+        HTTP_CONNECT_TIMEOUT
+
+    if max_connections is not None:
+        HTTP_MAX_CONNECTIONS = max_connections
+    if max_keepalive_connections is not None:
+        HTTP_MAX_KEEPALIVE_CONNECTIONS = max_keepalive_connections
+    if keepalive_expiry is not None:
+        HTTP_KEEPALIVE_EXPIRY = keepalive_expiry
+    if timeout is not None:
+        HTTP_TIMEOUT = timeout
+    if connect_timeout is not None:
+        HTTP_CONNECT_TIMEOUT = connect_timeout
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取当前事件循环的共享 HTTP 客户端，不存在时创建"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    client = _clients.get(loop)
+    if client is not None and not client.is_closed:
+        return client
+
+    # 已关闭的事件循环中的客户端无法再使用，也无法在其循环中关闭，只移除引用
+    for other in [other for other in _clients if other is not None and other.is_closed()]:
+        del _clients[other]
+
+    client = httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+    _clients[loop] = client
+    logger.info(
+        f"[MikuChat] HTTP 客户端已创建 (http2={HTTP2_AVAILABLE}, "
+        f"max_connections={HTTP_MAX_CONNECTIONS}, timeout={HTTP_TIMEOUT}s)"
+    )
+    return client
+
+
+def acquire_http_client():
+    """登记一个共享客户端的使用者（插件类加载时调用）"""
+    global _client_users
+    _client_users += 1
+
+
+async def release_http_client():
+    """注销一个使用者，最后一个使用者注销时关闭客户端（插件类停用时调用）"""
+    global _client_users
+    _client_users = max(0, _client_users - 1)
+    if _client_users == 0:
+        await close_http_client()
+
+
+def parse_id_list(text: int | str) -> list[int]:
+    """解析逗号/空格分隔的ID列表，去重并保持顺序"""
+    if isinstance(text, int):
+        return [text]
+    ids: list[int] = []
+    for part in re.split(r"[\s,，]+", text.strip()):
+        if not part:
+            continue
+        if not part.isdigit():
+            raise ValueError(f"ID不是数字: {part}")
+        if int(part) not in ids:
+            ids.append(int(part))
+    if len(ids) > BATCH_MAX_SIZE:
+        raise ValueError(f"一次最多查询 {BATCH_MAX_SIZE} 个")
+    return ids
+
+
+async def gather_limited(
+    func: Callable[[T], Awaitable[R]], items: Iterable[T], limit: int | None = None
+) -> list[R | BaseException]:
+    """并发执行 func(item)，同时最多 limit 个，结果按输入顺序返回（异常作为结果返回）"""
+    semaphore = asyncio.Semaphore(limit or BATCH_CONCURRENCY)
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+
+async def close_http_client():
+    """关闭所有事件循环的共享 HTTP 客户端（可重复调用）
+
+    每个客户端在自己的事件循环中关闭：当前循环直接关闭，其他线程中运行的循环通过
+    run_coroutine_threadsafe 关闭，已停止的循环无法再关闭连接，只移除引用。
+    """
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+
+    clients = list(_clients.items())
+    _clients.clear()
+    for loop, client in clients:
+        if client.is_closed:
+            continue
+        try:
+            if loop is None or loop is current:
+                await client.aclose()
+            elif loop.is_running():
+                future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+                if current is not None:
+                    await asyncio.wrap_future(future)
+                else:
+                    future.result()
+            else:
+                continue
+        except Exception as e:
+            logger.warning(f"[MikuChat] 关闭 HTTP 客户端失败: {e}")
+            continue
+        logger.info("[MikuChat] HTTP 客户端已关闭")
+
+
+__all__ = [
+    "get_http_client",
+    "acquire_http_client",
+    "release_http_client",
+    "close_http_client",
+    "set_http_client_options",
+    "parse_id_list",
+    "gather_limited",
+]
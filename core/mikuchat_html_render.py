@@ -6,6 +6,8 @@ import jinja2
 
 from playwright.async_api import async_playwright
 
+from .metrics import timed
+
 TEMPLATES_PATH = str(Path(__file__).parent / "templates")
 
 env = jinja2.Environment(
@@ -70,6 +72,7 @@ async def html_to_pic(
             await _ctx.close()
 
 
+@timed("render_seconds")
 async def template_to_pic(
         template_path: str,
         template_name: str,
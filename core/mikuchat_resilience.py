@@ -0,0 +1,331 @@
+"""
+MikuChat API 容错调用
+
+所有 SDK 调用经过 call_api：
+- 每个接口有独立的超时（生成图片的签到卡片比普通 JSON 接口慢）
+- 网络错误、超时和 5xx 响应按指数退避加随机抖动重试，次数有上限；
+  非幂等接口（修改昵称、签到）只在请求确定没有发出（连接失败）时重试
+- 每个接口一个熔断器：连续失败达到阈值后打开，冷却期内直接失败（由调用方回退到过期缓存），
+  冷却结束后放行一个探测请求，成功则恢复
+- 可选的对冲请求：幂等 GET 在 hedge_delay 内没有返回时再发一个相同请求，取先返回的结果
+"""
+
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import TypeVar
+
+import httpx
+from astrbot.api import logger
+
+from .metrics import register_collector, timer
+from .mikuchat_client import get_http_client
+
+T = TypeVar("T")
+
+# 重试配置
+RETRY_ATTEMPTS = 3  # 最多尝试次数（含第一次）
+RETRY_BASE_DELAY = 0.2  # 退避基数（秒）
+RETRY_MAX_DELAY = 2.0  # 单次退避上限（秒）
+
+# 熔断配置
+BREAKER_FAILURE_THRESHOLD = 5  # 连续失败次数达到该值时熔断
+BREAKER_RESET_TIMEOUT = 30.0  # 熔断后多久放行探测请求（秒）
+
+# 对冲请求
+HEDGE_ENABLED = False
+HEDGE_DELAY = 0.8  # 超过该时间未返回时发出对冲请求（秒）
+
+
+class MikuChatUnavailableError(ValueError):
+    """MikuChat API 不可用（熔断中或重试后仍失败）"""
+
+    def __init__(self, endpoint: str, reason: str = ""):
+        super().__init__("MikuChat 服务暂时不可用，请稍后再试")
+        self.endpoint = endpoint
+        self.reason = reason
+
+
+class _ServerError(Exception):
+    """5xx 响应，可重试"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class EndpointPolicy:
+    """接口调用策略
+
+    Attributes:
+        timeout: 单次请求超时（秒）
+        idempotent: 是否幂等（决定能否在请求已发出后重试、能否对冲）
+    """
+
+    timeout: float = 5.0
+    idempotent: bool = True
+
+
+DEFAULT_POLICY = EndpointPolicy()
+
+# 接口名 -> 调用策略，未列出的使用 DEFAULT_POLICY
+ENDPOINT_POLICIES: dict[str, EndpointPolicy] = {
+    "Cave.get_cave": EndpointPolicy(timeout=5.0),
+    "Cave.select_cave": EndpointPolicy(timeout=5.0),
+    "User.get_user_info": EndpointPolicy(timeout=5.0),
+    "User.update_user_name": EndpointPolicy(timeout=8.0, idempotent=False),
+    "User.update_user_check": EndpointPolicy(timeout=8.0, idempotent=False),
+    "UserCheck.get": EndpointPolicy(timeout=15.0),
+    "image": EndpointPolicy(timeout=10.0),
+}
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器"""
+
+    def __init__(
+        self,
+        failure_threshold: int | None = None,
+        reset_timeout: float | None = None,
+    ):
+        # 未指定时使用当前配置（set_resilience_options 可能在类定义之后修改）
+        self.failure_threshold = (
+            BREAKER_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        )
+        self.reset_timeout = BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """是否放行请求；半开状态下同时只放行一个探测请求"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self):
+        """探测请求没有结果就结束（被取消）时释放名额，下一个请求可以继续探测"""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # 半开探测失败时重新计时
+            self.opened_at = time.monotonic()
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+# 调用统计
+stats = {
+    "calls": 0,
+    "retries": 0,
+    "hedges": 0,
+    "short_circuits": 0,
+    "failures": 0,
+}
+
+
+def _collect_metrics():
+    samples = [(f"mikuchat_{name}", {}, value) for name, value in stats.items()]
+    for endpoint, breaker in list(_breakers.items()):
+        samples.append(
+            ("mikuchat_breaker_open", {"endpoint": endpoint}, breaker.state != "closed")
+        )
+    return samples
+
+
+register_collector(_collect_metrics)
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker()
+    return breaker
+
+
+def set_resilience_options(
+    retry_attempts: int | None = None,
+    breaker_failure_threshold: int | None = None,
+    breaker_reset_timeout: float | None = None,
+    hedge_enabled: bool | None = None,
+    hedge_delay: float | None = None,
+):
+    """设置重试、熔断和对冲参数"""
+    global RETRY_ATTEMPTS, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, HEDGE_ENABLED, HEDGE_DELAY
+
+    if retry_attempts is not None:
+        RETRY_ATTEMPTS = max(1, retry_attempts)
+    if breaker_failure_threshold is not None:
+        BREAKER_FAILURE_THRESHOLD = max(1, breaker_failure_threshold)
+    if breaker_reset_timeout is not None:
+        BREAKER_RESET_TIMEOUT = breaker_reset_timeout
+    if hedge_enabled is not None:
+        HEDGE_ENABLED = hedge_enabled
+    if hedge_delay is not None:
+        HEDGE_DELAY = hedge_delay
+    for breaker in _breakers.values():
+        breaker.failure_threshold = BREAKER_FAILURE_THRESHOLD
+        breaker.reset_timeout = BREAKER_RESET_TIMEOUT
+
+
+def _retryable(error: BaseException, idempotent: bool) -> bool:
+    """判断错误是否可以重试"""
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        # 请求没有发出，任何接口都可以重试
+        return True
+    if not idempotent:
+        return False
+    return isinstance(
+        error, (httpx.TransportError, asyncio.TimeoutError, _ServerError)
+    )
+
+
+def _backoff(attempt: int) -> float:
+    """指数退避加全抖动"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+
+async def _hedged(send: Callable[[], Awaitable[T]], timeout: float) -> T:
+    """发出请求，HEDGE_DELAY 内没有返回时再发一个，取先成功的结果
+
+    返回、失败或调用方被取消时，取消仍在进行的请求。
+    """
+    first = asyncio.ensure_future(asyncio.wait_for(send(), timeout))
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=HEDGE_DELAY)
+        if done:
+            return first.result()
+
+        stats["hedges"] += 1
+        pending.add(asyncio.ensure_future(asyncio.wait_for(send(), timeout)))
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        assert error is not None
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def request(endpoint: str, send: Callable[[], Awaitable[T]]) -> T:
+    """按接口策略执行请求（超时、重试、熔断、对冲）
+
+    Raises:
+        MikuChatUnavailableError: 熔断中，或重试后仍然失败
+    """
+    policy = ENDPOINT_POLICIES.get(endpoint, DEFAULT_POLICY)
+    breaker = get_breaker(endpoint)
+    stats["calls"] += 1
+    probe = breaker.state == "half_open"
+    if not breaker.allow():
+        stats["short_circuits"] += 1
+        raise MikuChatUnavailableError(endpoint, "circuit open")
+
+    try:
+        with timer("mikuchat_request_seconds", endpoint=endpoint):
+            return await _request_with_retries(endpoint, send, policy, breaker)
+    finally:
+        if probe:
+            breaker.release_probe()
+
+
+async def _request_with_retries(
+    endpoint: str,
+    send: Callable[[], Awaitable[T]],
+    policy: EndpointPolicy,
+    breaker: CircuitBreaker,
+) -> T:
+    hedge = HEDGE_ENABLED and policy.idempotent
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            if hedge:
+                result = await _hedged(send, policy.timeout)
+            else:
+                result = await asyncio.wait_for(send(), policy.timeout)
+        except Exception as e:
+            if attempt + 1 < RETRY_ATTEMPTS and _retryable(e, policy.idempotent):
+                stats["retries"] += 1
+                delay = _backoff(attempt)
+                logger.warning(
+                    f"[MikuChat] {endpoint} 请求失败（{type(e).__name__}: {e}），"
+                    f"{delay:.2f}s 后重试"
+                )
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_failure()
+            stats["failures"] += 1
+            logger.error(f"[MikuChat] {endpoint} 请求失败: {type(e).__name__}: {e}")
+            raise MikuChatUnavailableError(endpoint, str(e)) from e
+        breaker.record_success()
+        return result
+    raise MikuChatUnavailableError(endpoint)
+
+
+async def call_api(api_cls: Callable[..., T], api_name: str, **params) -> T:
+    """调用 SDK 接口，返回完成请求的 API 对象（可读取 .model / .error / .raw）"""
+    endpoint = f"{getattr(api_cls, '__name__', api_cls)}.{api_name}"
+
+    async def send() -> T:
+        api = api_cls(client=get_http_client())
+        response: httpx.Response = await getattr(api, api_name)(**params)
+        if response.status_code >= 500:
+            raise _ServerError(response.status_code)
+        return api
+
+    return await request(endpoint, send)
+
+
+async def fetch_url(url: str) -> bytes:
+    """下载资源（图片），失败抛出 MikuChatUnavailableError"""
+
+    async def send() -> httpx.Response:
+        response = await get_http_client().get(url, follow_redirects=True)
+        if response.status_code >= 500:
+            raise _ServerError(response.status_code)
+        return response
+
+    # 4xx 是资源本身的问题，不计入熔断
+    response = await request("image", send)
+    response.raise_for_status()
+    return response.content
+
+
+__all__ = [
+    "MikuChatUnavailableError",
+    "EndpointPolicy",
+    "CircuitBreaker",
+    "call_api",
+    "fetch_url",
+    "request",
+    "set_resilience_options",
+    "stats",
+]
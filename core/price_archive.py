@@ -0,0 +1,173 @@
+"""
+价格历史列式归档
+
+每个币种两个只追加文件：
+    <COIN>.ts  int64 毫秒时间戳（本机字节序，等价于 array('q')）
+    <COIN>.px  float64 价格（本机字节序，等价于 array('d')）
+第 i 条记录的时间和价格分别位于两个文件的第 i 个元素，按时间递增写入。
+
+读取时通过 mmap 映射文件，返回 memoryview 切片，不复制数据；
+需要 numpy 时可以直接 numpy.frombuffer(view) 或
+numpy.memmap(path, dtype="<i8"/"<f8") 零拷贝读取。
+时间范围查找先在内存中的稀疏索引（每 SPARSE_INDEX_STRIDE 条取一个时间戳）上二分，
+再在对应的块内二分，只会触及映射文件的一小段。
+"""
+
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+from astrbot.api import logger
+
+TS_ITEM_SIZE = array("q").itemsize
+PX_ITEM_SIZE = array("d").itemsize
+SPARSE_INDEX_STRIDE = 1024  # 稀疏索引间隔（条）
+
+
+class _CoinArchive:
+    """单个币种的归档文件映射"""
+
+    def __init__(self, ts_path: Path, px_path: Path):
+        self.ts_path = ts_path
+        self.px_path = px_path
+        self.count = 0
+        self.ts_view: memoryview | None = None
+        self.px_view: memoryview | None = None
+        self.sparse_index = array("q")
+        self._repair()
+        self.remap()
+
+    def _repair(self):
+        """两个文件长度不一致时（写入中断）截断到相同条数"""
+        ts_count = self.ts_path.stat().st_size // TS_ITEM_SIZE if self.ts_path.exists() else 0
+        px_count = self.px_path.stat().st_size // PX_ITEM_SIZE if self.px_path.exists() else 0
+        count = min(ts_count, px_count)
+        for path, item_size in ((self.ts_path, TS_ITEM_SIZE), (self.px_path, PX_ITEM_SIZE)):
+            if path.exists() and path.stat().st_size != count * item_size:
+                logger.warning(f"[Archive] 归档文件长度不一致，截断到 {count} 条: {path}")
+                os.truncate(path, count * item_size)
+
+    def remap(self):
+        """重新映射文件（追加数据后调用）
+
+        旧的 memoryview 仍由调用方持有时不受影响，释放后旧映射自动回收。
+        """
+        count = self.ts_path.stat().st_size // TS_ITEM_SIZE if self.ts_path.exists() else 0
+        self.count = count
+        if count == 0:
+            self.ts_view = memoryview(array("q"))
+            self.px_view = memoryview(array("d"))
+            self.sparse_index = array("q")
+            return
+        with open(self.ts_path, "rb") as f:
+            ts_map = mmap.mmap(f.fileno(), count * TS_ITEM_SIZE, access=mmap.ACCESS_READ)
+        with open(self.px_path, "rb") as f:
+            px_map = mmap.mmap(f.fileno(), count * PX_ITEM_SIZE, access=mmap.ACCESS_READ)
+        self.ts_view = memoryview(ts_map).cast("q")
+        self.px_view = memoryview(px_map).cast("d")
+        self.sparse_index = array("q", self.ts_view[::SPARSE_INDEX_STRIDE])
+
+    def search(self, ts: int, right: bool = False) -> int:
+        """返回时间戳 ts 在归档中的插入位置"""
+        assert self.ts_view is not None
+        search = bisect_right if right else bisect_left
+        # 稀疏索引定位块，结果一定落在 [block, block + 2) 个间隔内
+        block = max(0, search(self.sparse_index, ts) - 1)
+        lo = block * SPARSE_INDEX_STRIDE
+        hi = min(self.count, (block + 2) * SPARSE_INDEX_STRIDE)
+        return search(self.ts_view, ts, lo, hi)
+
+
+class PriceArchive:
+    """按币种组织的列式价格归档"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._coins: dict[str, _CoinArchive] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, coin: str) -> _CoinArchive:
+        archive = self._coins.get(coin)
+        if archive is None:
+            archive = _CoinArchive(
+                self.directory / f"{coin}.ts", self.directory / f"{coin}.px"
+            )
+            self._coins[coin] = archive
+        return archive
+
+    def append(self, coin: str, timestamps, prices) -> int:
+        """追加价格记录（按时间递增），早于已归档最后时间的记录会被跳过
+
+        Returns:
+            实际写入的条数
+        """
+        with self._lock:
+            archive = self._get(coin)
+            last_ts = archive.ts_view[-1] if archive.count else None
+
+            ts_out, px_out = array("q"), array("d")
+            for ts, price in zip(timestamps, prices):
+                if last_ts is not None and ts <= last_ts:
+                    continue
+                ts_out.append(ts)
+                px_out.append(price)
+                last_ts = ts
+            if not ts_out:
+                return 0
+
+            # 先写价格再写时间，中断时由 _repair 截断多余部分
+            with open(archive.px_path, "ab") as f:
+                px_out.tofile(f)
+            with open(archive.ts_path, "ab") as f:
+                ts_out.tofile(f)
+            archive.remap()
+            return len(ts_out)
+
+    def first_timestamp(self, coin: str) -> int | None:
+        """已归档的最早时间戳"""
+        with self._lock:
+            archive = self._get(coin)
+            return archive.ts_view[0] if archive.count else None
+
+    def last_timestamp(self, coin: str) -> int | None:
+        """已归档的最晚时间戳"""
+        with self._lock:
+            archive = self._get(coin)
+            return archive.ts_view[-1] if archive.count else None
+
+    def read(
+        self,
+        coin: str,
+        start_ms: int | None = None,
+        end_ms: int | None = None,
+        limit: int | None = None,
+    ) -> tuple[memoryview, memoryview]:
+        """读取时间范围 [start_ms, end_ms] 内的记录（零拷贝），指定 limit 时只取最后 limit 条
+
+        Returns:
+            (timestamps, prices): 'q' 和 'd' 格式的 memoryview 切片，按时间正序
+        """
+        with self._lock:
+            archive = self._get(coin)
+            assert archive.ts_view is not None and archive.px_view is not None
+            if not archive.count:
+                return archive.ts_view, archive.px_view
+            lo = archive.search(start_ms) if start_ms is not None else 0
+            hi = archive.search(end_ms, right=True) if end_ms is not None else archive.count
+            if limit:
+                lo = max(lo, hi - limit)
+            return archive.ts_view[lo:hi], archive.px_view[lo:hi]
+
+    def size(self, coin: str) -> int:
+        """已归档的记录条数"""
+        with self._lock:
+            return self._get(coin).count
+
+
+__all__ = [
+    "PriceArchive",
+]
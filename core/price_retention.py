@@ -0,0 +1,332 @@
+"""
+价格历史分级保留
+
+原始价格记录只保留最近 raw_retention_ms，更早的数据逐级降采样为K线：
+    原始记录 -> 5分钟K线 -> 1小时K线 -> 1天K线
+每一级都有自己的保留时长，超出后继续合并到下一级，最后一级永久保留，
+因此数据库大小会趋于稳定而不是无限增长。
+
+降采样按批进行：每批只处理一段完整的时间桶，写入K线后按主键范围删除源数据，
+每次运行有时间预算，可以在市场更新线程中增量执行。
+K线记录开盘和收盘价格的时间（open_ts / close_ts），迟到的源数据（如停机补算写入的记录）
+落入已合并的时间桶时与已有K线合并，而不是覆盖。
+设置了 archive 时，原始记录在删除前会先追加到列式归档（见 price_archive），
+完整精度的历史保存在归档文件中。
+"""
+
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from astrbot.api import logger
+
+from .price_archive import PriceArchive
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+
+DEFAULT_RAW_RETENTION_MS = 48 * HOUR_MS  # 原始记录默认保留48小时
+DEFAULT_BATCH_ROWS = 5000  # 每批最多读取的源数据行数
+DEFAULT_RUN_INTERVAL = 600  # 追平后每10分钟检查一次
+
+
+@dataclass(frozen=True)
+class RetentionTier:
+    """K线级别
+
+    Attributes:
+        resolution_ms: K线周期（毫秒）
+        retention_ms: 该级别保留时长，None 表示永久保留
+    """
+
+    resolution_ms: int
+    retention_ms: int | None
+
+
+# 默认分级：5分钟K线保留30天，1小时K线保留1年，1天K线永久保留
+DEFAULT_TIERS = (
+    RetentionTier(5 * MINUTE_MS, 30 * DAY_MS),
+    RetentionTier(HOUR_MS, 365 * DAY_MS),
+    RetentionTier(DAY_MS, None),
+)
+
+
+class PriceRetention:
+    """价格历史保留策略执行器"""
+
+    def __init__(
+        self,
+        raw_retention_ms: int = DEFAULT_RAW_RETENTION_MS,
+        tiers: tuple[RetentionTier, ...] = DEFAULT_TIERS,
+        batch_rows: int = DEFAULT_BATCH_ROWS,
+        run_interval: float = DEFAULT_RUN_INTERVAL,
+        archive: PriceArchive | None = None,
+    ):
+        self.raw_retention_ms = raw_retention_ms
+        self.tiers = tiers
+        self.batch_rows = batch_rows
+        self.run_interval = run_interval
+        self.archive = archive
+        self._next_run = 0.0
+
+    def maybe_run(self, db_file: Path | None, budget: float, now: float | None = None) -> int:
+        """到达检查时间时执行一次保留策略
+
+        有积压时每次调用都会继续处理，追平后按 run_interval 间隔检查。
+
+        Args:
+            now: 当前时间（秒级时间戳，取自市场时钟），默认取系统时间
+
+        Returns:
+            本次处理的源数据行数
+        """
+        if now is None:
+            now = time.time()
+        # 下次检查时间超出一个间隔说明时钟被调回（如切换回真实时钟），立即检查
+        if db_file is None or 0 <= self._next_run - now <= self.run_interval:
+            return 0
+        processed, finished = self.run(db_file, budget, int(now * 1000))
+        if finished:
+            self._next_run = now + self.run_interval
+        return processed
+
+    def run(self, db_file: Path, budget: float, now_ms: int | None = None) -> tuple[int, bool]:
+        """在时间预算内执行降采样和清理
+
+        Args:
+            db_file: 数据库路径
+            budget: 时间预算（秒）
+            now_ms: 当前时间（毫秒），默认取系统时间
+
+        Returns:
+            (处理的源数据行数, 是否已全部处理完)
+        """
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        deadline = time.monotonic() + budget
+        processed = 0
+        try:
+            conn = sqlite3.connect(str(db_file))
+            cursor = conn.cursor()
+            cursor.execute("SELECT coin_id, coin FROM price_coins")
+            coins = cursor.fetchall()
+
+            # (源级别, 目标级别, 源数据截止时间)；源级别 None 表示原始记录
+            steps: list[tuple[RetentionTier | None, RetentionTier, int]] = []
+            source: RetentionTier | None = None
+            source_retention = self.raw_retention_ms
+            for tier in self.tiers:
+                if source_retention is None:
+                    break
+                steps.append((source, tier, now_ms - source_retention))
+                source, source_retention = tier, tier.retention_ms
+
+            for source, target, cutoff_ms in steps:
+                for coin_id, coin in coins:
+                    while True:
+                        if time.monotonic() >= deadline:
+                            conn.close()
+                            return processed, False
+                        rows = self._rollup_batch(
+                            conn, coin_id, coin, source, target, cutoff_ms
+                        )
+                        processed += rows
+                        if rows == 0:
+                            break
+            conn.close()
+            if processed:
+                logger.info(f"[Retention] 价格历史降采样完成，处理 {processed} 条记录")
+            return processed, True
+        except Exception as e:
+            logger.error(f"[Retention] 价格历史降采样失败: {e}")
+            return processed, True
+
+    def _rollup_batch(
+        self,
+        conn: sqlite3.Connection,
+        coin_id: int,
+        coin: str,
+        source: RetentionTier | None,
+        target: RetentionTier,
+        cutoff_ms: int,
+    ) -> int:
+        """把截止时间之前最早的一批源数据合并为目标级别K线并删除源数据
+
+        Returns:
+            处理的源数据行数，0 表示没有需要处理的数据
+        """
+        res = target.resolution_ms
+        end_ms = cutoff_ms - cutoff_ms % res  # 只处理完整的时间桶
+        cursor = conn.cursor()
+
+        if source is None:
+            select = """
+                SELECT ts, price, price, price, price, 1, ts, ts FROM price_history
+                WHERE coin_id = ? AND ts < ?
+                ORDER BY ts
+            """
+            params: tuple = (coin_id,)
+        else:
+            select = """
+                SELECT ts, open, high, low, close, count, open_ts, close_ts FROM price_candles
+                WHERE coin_id = ? AND resolution = ? AND ts < ?
+                ORDER BY ts
+            """
+            params = (coin_id, source.resolution_ms)
+        cursor.execute(select + " LIMIT ?", params + (end_ms, self.batch_rows))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        start_ms = rows[0][0] - rows[0][0] % res
+        batch_end_ms = end_ms
+        if len(rows) == self.batch_rows:
+            # 最后一个时间桶可能不完整，留到下一批
+            last_bucket = rows[-1][0] - rows[-1][0] % res
+            if last_bucket > start_ms:
+                batch_end_ms = last_bucket
+                rows = [row for row in rows if row[0] < last_bucket]
+            else:
+                # 单个时间桶超过批大小，整桶读取
+                batch_end_ms = start_ms + res
+                cursor.execute(select, params + (batch_end_ms,))
+                rows = cursor.fetchall()
+
+        # 聚合 OHLC（源数据按时间排序）
+        candles: dict[int, list] = {}
+        for ts, open_, high, low, close, count, open_ts, close_ts in rows:
+            bucket = ts - ts % res
+            candle = candles.get(bucket)
+            if candle is None:
+                candles[bucket] = [open_, high, low, close, count, open_ts, close_ts]
+            else:
+                candle[1] = max(candle[1], high)
+                candle[2] = min(candle[2], low)
+                candle[3] = close
+                candle[4] += count
+                candle[6] = close_ts
+
+        # 时间桶已有K线时合并：开盘取更早的、收盘取更晚的，最高/最低/条数合并
+        cursor.executemany(
+            """
+            INSERT INTO price_candles
+            (coin_id, resolution, ts, open, high, low, close, count, open_ts, close_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (coin_id, resolution, ts) DO UPDATE SET
+                open = CASE WHEN excluded.open_ts < open_ts THEN excluded.open ELSE open END,
+                high = MAX(high, excluded.high),
+                low = MIN(low, excluded.low),
+                close = CASE WHEN excluded.close_ts >= close_ts THEN excluded.close ELSE close END,
+                count = count + excluded.count,
+                open_ts = MIN(open_ts, excluded.open_ts),
+                close_ts = MAX(close_ts, excluded.close_ts)
+        """,
+            [
+                (coin_id, res, bucket, *candle)
+                for bucket, candle in candles.items()
+            ],
+        )
+        if source is None:
+            # 删除前先归档完整精度的原始记录
+            if self.archive is not None:
+                self.archive.append(
+                    coin, [row[0] for row in rows], [row[1] for row in rows]
+                )
+            cursor.execute(
+                "DELETE FROM price_history WHERE coin_id = ? AND ts >= ? AND ts < ?",
+                (coin_id, start_ms, batch_end_ms),
+            )
+        else:
+            cursor.execute(
+                """
+                DELETE FROM price_candles
+                WHERE coin_id = ? AND resolution = ? AND ts >= ? AND ts < ?
+            """,
+                (coin_id, source.resolution_ms, start_ms, batch_end_ms),
+            )
+        conn.commit()
+        return len(rows)
+
+    def read_candles(
+        self,
+        cursor: sqlite3.Cursor,
+        coin_id: int,
+        start_ms: int | None,
+        before_ms: int | None,
+        limit: int | None = None,
+    ) -> tuple[list[int], list[float]]:
+        """读取降采样后的历史（早于 before_ms 的部分）
+
+        每根K线展开为开、高、低、收四个价格点（时间戳保持在K线周期内），
+        按任意整数倍周期重新聚合时 OHLC 不变。
+        指定 limit 时只读取最近的 limit 个价格点所需的K线（从 before_ms 向前倒序读取）。
+
+        Returns:
+            (timestamps, prices): 按时间正序
+        """
+        timestamps: list[int] = []
+        prices: list[float] = []
+        upper = before_ms
+        for tier in self.tiers:
+            res = tier.resolution_ms
+            query = """
+                SELECT ts, open, high, low, close FROM price_candles
+                WHERE coin_id = ? AND resolution = ?
+            """
+            params: list = [coin_id, res]
+            if upper is not None:
+                # 只取完整落在 upper 之前的K线，跨越 upper 的部分已由更精细的数据覆盖
+                query += " AND ts <= ?"
+                params.append(upper - res)
+            if start_ms is not None:
+                query += " AND ts > ?"
+                params.append(start_ms - res)
+            if limit:
+                # 每根K线最多4个点，多取两根覆盖边界上被过滤的点
+                query += " ORDER BY ts DESC LIMIT ?"
+                params.append((limit - len(timestamps)) // 4 + 2)
+            else:
+                query += " ORDER BY ts"
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+            if limit:
+                rows.reverse()
+
+            tier_ts: list[int] = []
+            tier_prices: list[float] = []
+            for ts, open_, high, low, close in rows:
+                for point_ts, price in (
+                    (ts, open_),
+                    (ts + 1, high),
+                    (ts + 2, low),
+                    (ts + res - 1, close),
+                ):
+                    if start_ms is not None and point_ts < start_ms:
+                        continue
+                    if upper is not None and point_ts >= upper:
+                        continue
+                    tier_ts.append(point_ts)
+                    tier_prices.append(price)
+            # 更粗级别的数据更早，拼接在前面
+            timestamps = tier_ts + timestamps
+            prices = tier_prices + prices
+            upper = rows[0][0]
+            if limit and len(timestamps) >= limit:
+                break
+        if limit and len(timestamps) > limit:
+            del timestamps[:-limit]
+            del prices[:-limit]
+        return timestamps, prices
+
+
+__all__ = [
+    "RetentionTier",
+    "PriceRetention",
+    "DEFAULT_TIERS",
+    "DEFAULT_RAW_RETENTION_MS",
+    "HOUR_MS",
+]
@@ -0,0 +1,137 @@
+"""
+最近价格的内存环形缓冲区
+
+每个币种一个固定容量的环形缓冲区，保存最近 capacity 条价格记录，
+时间戳（毫秒）和价格分别存放在预分配的 array('q') / array('d') 中。
+写入不分配内存，覆盖最旧的记录；时间窗口完全落在缓冲区内的查询可以不访问数据库。
+
+内存占用：每条记录 16 字节（8 字节时间戳 + 8 字节价格），
+每个币种 capacity * 16 字节，默认 1440 条（每分钟一条约 24 小时）约 22.5 KB。
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+DEFAULT_RING_CAPACITY = 1440  # 默认每个币种保留最近1440条（约24小时）
+
+
+class _Ring:
+    """单个币种的环形缓冲区"""
+
+    __slots__ = ("capacity", "timestamps", "prices", "head", "count")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = array("q", bytes(8 * capacity))
+        self.prices = array("d", bytes(8 * capacity))
+        self.head = 0  # 下一个写入位置
+        self.count = 0
+
+    def append(self, ts: int, price: float):
+        self.timestamps[self.head] = ts
+        self.prices[self.head] = price
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def oldest(self) -> int | None:
+        if not self.count:
+            return None
+        return self.timestamps[(self.head - self.count) % self.capacity]
+
+    def newest(self) -> int | None:
+        if not self.count:
+            return None
+        return self.timestamps[(self.head - 1) % self.capacity]
+
+    def segments(self) -> list[tuple[int, int]]:
+        """按时间顺序排列的连续区间 [(start, end), ...]"""
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return [(start, start + self.count)]
+        return [(start, self.capacity), (0, self.head)]
+
+
+class PriceRingBuffer:
+    """按币种组织的最近价格环形缓冲区"""
+
+    def __init__(self, capacity: int = DEFAULT_RING_CAPACITY):
+        self.capacity = max(1, capacity)
+        self._rings: dict[str, _Ring] = {}
+        self._lock = threading.Lock()
+
+    def clear(self, capacity: int | None = None):
+        """清空所有缓冲区，可同时修改容量"""
+        with self._lock:
+            if capacity is not None:
+                self.capacity = max(1, capacity)
+            self._rings.clear()
+
+    def append(self, coin: str, ts: int, price: float):
+        """追加一条价格记录，早于缓冲区最新记录的时间戳会被忽略"""
+        with self._lock:
+            ring = self._rings.get(coin)
+            if ring is None:
+                ring = self._rings[coin] = _Ring(self.capacity)
+            newest = ring.newest()
+            if newest is not None and ts <= newest:
+                return
+            ring.append(ts, price)
+
+    def extend(self, coin: str, timestamps, prices):
+        """批量追加（用于启动时从数据库预热）"""
+        for ts, price in zip(timestamps, prices):
+            self.append(coin, ts, price)
+
+    def window(
+        self,
+        coin: str,
+        start_ms: int | None = None,
+        end_ms: int | None = None,
+        limit: int | None = None,
+    ) -> tuple[array, array] | None:
+        """从缓冲区读取时间窗口，参数含义同 get_price_series
+
+        Returns:
+            (timestamps, prices)；窗口超出缓冲区覆盖范围时返回 None，需要查询数据库
+        """
+        with self._lock:
+            ring = self._rings.get(coin)
+            if ring is None or not ring.count:
+                return None
+            oldest = ring.oldest()
+            if start_ms is not None and start_ms < oldest:
+                return None
+            if start_ms is None and not limit:
+                return None
+
+            timestamps, prices = array("q"), array("d")
+            for seg_start, seg_end in ring.segments():
+                lo = seg_start
+                if start_ms is not None:
+                    lo = bisect_left(ring.timestamps, start_ms, seg_start, seg_end)
+                hi = seg_end
+                if end_ms is not None:
+                    hi = bisect_right(ring.timestamps, end_ms, lo, seg_end)
+                timestamps.extend(ring.timestamps[lo:hi])
+                prices.extend(ring.prices[lo:hi])
+
+            if limit:
+                if start_ms is None and len(timestamps) < limit:
+                    # 缓冲区内的记录不足 limit 条，更早的记录在数据库中
+                    return None
+                del timestamps[:-limit]
+                del prices[:-limit]
+            return timestamps, prices
+
+    def memory_bytes(self) -> int:
+        """缓冲区占用的内存（字节）"""
+        with self._lock:
+            return len(self._rings) * self.capacity * 16
+
+
+__all__ = [
+    "PriceRingBuffer",
+    "DEFAULT_RING_CAPACITY",
+]
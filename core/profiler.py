@@ -0,0 +1,280 @@
+"""
+按需性能剖析
+
+管理员用 bi_profile 命令为某个目标（"tick" 表示市场更新，或 bi_* 命令名）预约接下来 N 次执行的剖析，
+不用重新部署就能定位线上慢在哪里：
+- cprofile：用 cProfile 记录，保存 .prof（可用 snakeviz / pstats 打开）和按累计耗时排序的 .txt
+- sample：后台线程每 SAMPLE_INTERVAL 秒采样一次执行线程的调用栈，保存为折叠栈 .folded
+  （可直接交给 flamegraph.pl / speedscope 生成火焰图），开销比 cProfile 小
+输出文件在插件数据目录的 profiles 下。
+
+异步命令在事件循环线程中执行，剖析期间同一线程上交错执行的其他协程也会被记录。
+同一时间只进行一次剖析，其他预约的执行照常运行、不计次数。
+
+memory_snapshot() 用 tracemalloc 记录内存分配：第一次调用开始追踪，之后每次输出插件代码中
+占用最多的分配位置，以及与上一次快照相比的增长。
+"""
+
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from astrbot.api import logger
+
+PROFILE_MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL = 0.005  # 采样间隔（秒）
+MAX_PROFILE_COUNT = 20  # 一次最多预约的执行次数
+PSTATS_TOP = 30  # .txt 中列出的函数数
+TRACEMALLOC_FRAMES = 10  # tracemalloc 记录的调用栈深度
+MEMORY_TOP = 10  # 内存快照列出的分配位置数
+
+_PLUGIN_DIR = str(Path(__file__).resolve().parent)
+
+_profile_dir: Path | None = None
+_armed: dict[str, tuple[str, int]] = {}  # 目标 -> (模式, 剩余次数)
+_active = False  # 是否正在剖析（同一时间只剖析一次执行）
+_lock = threading.Lock()
+_last_memory_snapshot: tracemalloc.Snapshot | None = None
+
+
+def set_profile_dir(directory: Path):
+    global _profile_dir
+    _profile_dir = directory
+
+
+def arm(target: str, count: int = 1, mode: str = "cprofile") -> str:
+    """预约剖析 target 接下来的 count 次执行"""
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"剖析模式需为 {' / '.join(PROFILE_MODES)}")
+    count = max(1, min(MAX_PROFILE_COUNT, count))
+    with _lock:
+        _armed[target] = (mode, count)
+    logger.info(f"[Profile] 已预约剖析 {target} 接下来 {count} 次执行（{mode}）")
+    return f"已预约剖析 {target} 接下来 {count} 次执行（{mode}）"
+
+
+def disarm(target: str | None = None):
+    """取消预约，不指定目标时全部取消"""
+    with _lock:
+        if target is None:
+            _armed.clear()
+        else:
+            _armed.pop(target, None)
+
+
+def armed() -> dict[str, tuple[str, int]]:
+    with _lock:
+        return dict(_armed)
+
+
+def _take(target: str) -> str | None:
+    """占用一次剖析名额，返回模式；没有预约或已有剖析在进行时返回 None"""
+    global _active
+    if target not in _armed:
+        return None
+    with _lock:
+        entry = _armed.get(target)
+        if entry is None or _active:
+            return None
+        mode, remaining = entry
+        if remaining <= 1:
+            del _armed[target]
+        else:
+            _armed[target] = (mode, remaining - 1)
+        _active = True
+        return mode
+
+
+def _release():
+    global _active
+    with _lock:
+        _active = False
+
+
+def _output_path(target: str, suffix: str) -> Path | None:
+    if _profile_dir is None:
+        return None
+    _profile_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return _profile_dir / f"{target}-{stamp}{suffix}"
+
+
+def _save_cprofile(target: str, profiler: cProfile.Profile, elapsed: float):
+    path = _output_path(target, ".prof")
+    if path is None:
+        return
+    profiler.dump_stats(str(path))
+    text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=text)
+    stats.sort_stats("cumulative").print_stats(PSTATS_TOP)
+    path.with_suffix(".txt").write_text(text.getvalue(), encoding="utf-8")
+    logger.info(f"[Profile] {target} 耗时 {elapsed * 1000:.1f}ms，剖析结果已保存: {path.name}")
+
+
+class _StackSampler:
+    """后台线程定时采样目标线程的调用栈，按折叠栈格式计数"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+
+def _save_samples(target: str, sampler: _StackSampler, elapsed: float):
+    path = _output_path(target, ".folded")
+    if path is None:
+        return
+    lines = [f"{stack} {count}" for stack, count in sampler.stacks.most_common()]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    logger.info(
+        f"[Profile] {target} 耗时 {elapsed * 1000:.1f}ms，"
+        f"{sum(sampler.stacks.values())} 个采样已保存: {path.name}"
+    )
+
+
+@contextmanager
+def profile_scope(target: str):
+    """预约了 target 时剖析代码块，否则直接执行"""
+    mode = _take(target)
+    if mode is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    profiler: cProfile.Profile | None = None
+    sampler: _StackSampler | None = None
+    try:
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = _StackSampler(threading.get_ident())
+            sampler.start()
+    except Exception as e:
+        # 其他剖析工具正在运行等情况
+        _release()
+        logger.warning(f"[Profile] 无法开始剖析 {target}: {e}")
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        try:
+            if profiler is not None:
+                profiler.disable()
+                _save_cprofile(target, profiler, elapsed)
+            if sampler is not None:
+                sampler.stop()
+                _save_samples(target, sampler, elapsed)
+        except Exception as e:
+            logger.error(f"[Profile] 保存剖析结果失败: {e}")
+        finally:
+            _release()
+
+
+def profiled(func):
+    """按函数名预约剖析的装饰器（异步生成器命令）"""
+    target = func.__name__
+
+    if not inspect.isasyncgenfunction(func):
+        raise TypeError("profiled 只用于异步生成器命令")
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if target not in _armed:
+            async for item in func(*args, **kwargs):
+                yield item
+            return
+        with profile_scope(target):
+            async for item in func(*args, **kwargs):
+                yield item
+
+    return wrapper
+
+
+def memory_snapshot() -> str:
+    """记录一次内存快照，返回插件代码中占用最多的分配位置和相对上次快照的增长"""
+    global _last_memory_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        _last_memory_snapshot = None
+        return "已开始追踪内存分配，稍后再次执行以获取快照"
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(True, f"{_PLUGIN_DIR}/*")]
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"追踪中的内存: 当前 {current / 1024 / 1024:.1f}MB，峰值 {peak / 1024 / 1024:.1f}MB"]
+    lines.append("插件代码占用最多的位置:")
+    for stat in snapshot.statistics("lineno")[:MEMORY_TOP]:
+        frame = stat.traceback[0]
+        lines.append(
+            f"• {Path(frame.filename).name}:{frame.lineno} {stat.size / 1024:.1f}KB（{stat.count} 个对象）"
+        )
+    if _last_memory_snapshot is not None:
+        lines.append("相对上次快照的增长:")
+        for stat in snapshot.compare_to(_last_memory_snapshot, "lineno")[:MEMORY_TOP]:
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            lines.append(
+                f"• {Path(frame.filename).name}:{frame.lineno} +{stat.size_diff / 1024:.1f}KB"
+            )
+    _last_memory_snapshot = snapshot
+
+    path = _output_path("memory", ".txt")
+    if path is not None:
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        lines.append(f"已保存: {path.name}")
+    return "\n".join(lines)
+
+
+def stop_memory_tracing():
+    global _last_memory_snapshot
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _last_memory_snapshot = None
+
+
+__all__ = [
+    "arm",
+    "armed",
+    "disarm",
+    "memory_snapshot",
+    "profile_scope",
+    "profiled",
+    "set_profile_dir",
+    "stop_memory_tracing",
+]
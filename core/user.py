@@ -2,15 +2,70 @@ from astrbot.api.event import AstrMessageEvent
 from astrbot.api import logger
 from astrbot.api.message_components import Image, Plain, Reply
 
-import httpx
+import asyncio
 import re
+from datetime import date
 from mikuchat.apis import User, UserCheck
 from mikuchat.models import UserModel
 
+from .image_cache import check_card_key, get_image_cache
+from .metrics import register_collector
+from .hot_log import hot_log
+from .mikuchat_cache import AsyncTTLCache
+from .mikuchat_client import gather_limited, parse_id_list
+from .mikuchat_resilience import call_api
+
+# 用户资料缓存，短时间内重复查询不再请求 API；修改昵称、签到后失效
+USER_INFO_CACHE_SIZE = 256
+USER_INFO_CACHE_TTL = 60.0  # 秒
+_user_cache: AsyncTTLCache[UserModel] = AsyncTTLCache(
+    maxsize=USER_INFO_CACHE_SIZE, ttl=USER_INFO_CACHE_TTL
+)
+
+
+def set_user_info_cache_ttl(ttl: float):
+    """设置用户资料缓存时长（秒），0 表示不缓存"""
+    _user_cache.ttl = max(0.0, ttl)
+    _user_cache.clear()
+
+
+# 当天的签到卡片缓存，键为 (qq, 日期)；同一天重复签到直接返回卡片
+CHECK_CARD_CACHE_SIZE = 512
+_check_card_cache: AsyncTTLCache[bytes] = AsyncTTLCache(
+    maxsize=CHECK_CARD_CACHE_SIZE, ttl=None
+)
+_check_card_day: date | None = None
+
+register_collector(
+    lambda: [
+        *_user_cache.metric_samples("user_info"),
+        *_check_card_cache.metric_samples("check_card"),
+    ]
+)
+
+
+def _check_card_key(qq: int) -> tuple[int, str]:
+    """签到卡片缓存键，日期变化时清空前一天的卡片"""
+    global _check_card_day
+    today = date.today()
+    if _check_card_day != today:
+        _check_card_cache.clear()
+        _check_card_day = today
+    return qq, today.isoformat()
+
+
+async def _fetch_user_info(qq: int) -> UserModel | None:
+    """获取用户资料（不经过缓存），失败返回 None"""
+    user = await call_api(User, "get_user_info", qq=qq)
+    if user.error or user.model is None:
+        return None
+    data: list[UserModel] | UserModel | None = user.model.user
+    return data if isinstance(data, UserModel) else None
+
 
 async def user_update_name(event: AstrMessageEvent, name: str, qq: int | None = None):
     user_id = qq or event.get_sender_id()
-    logger.info(f"{user_id=}")
+    hot_log("user", "user_id={!r}", user_id)
     if not isinstance(user_id, int) and not user_id.isdigit():
         logger.warning("用户ID不是数字")
         raise ValueError("用户ID不是数字")
@@ -19,100 +74,176 @@ async def user_update_name(event: AstrMessageEvent, name: str, qq: int | None =
         logger.warning("昵称只能包含数字、字母和下划线")
         raise ValueError("昵称只能包含数字、字母和下划线")
     
-    async with httpx.AsyncClient() as client:
-        user = User(client=client)
-        await user.update_user_name(qq=int(user_id), name=name)
-        if user.error:
-            logger.warning("参数错误或账号不存在")
-            raise ValueError("参数错误或账号不存在")
+    user = await call_api(User, "update_user_name", qq=int(user_id), name=name)
+    _user_cache.invalidate(int(user_id))
+    if user.error:
+        logger.warning("参数错误或账号不存在")
+        raise ValueError("参数错误或账号不存在")
         
-        yield event.plain_result(f"更新用户{user_id}的用户名成功: {name}")    
+    yield event.plain_result(f"更新用户{user_id}的用户名成功: {name}")    
+
+def _user_text(data: UserModel) -> str:
+    return (
+        f"{data.qq=}"
+        f"\n{data.id=}"
+        f"\n{data.name=}"
+        f"\n{data.kook_id=}"
+        f"\n{data.telegram_name=}"
+        f"\n{data.osu_name=}"
+        f"\n{data.favorability=}"
+        f"\n{data.coin=}"
+        f"\n{data.group=}"
+        f"\n{data.item=}"
+        f"\n{data.badge=}"
+    )
+
+
+async def _get_user_info(qq: int) -> UserModel | None:
+    """获取用户资料（经过缓存）"""
+    return await _user_cache.get_or_fetch(qq, lambda: _fetch_user_info(qq))
+
+
+async def user_get(event: AstrMessageEvent, qq: int | str | None = None):
+    if isinstance(qq, str) and not qq.strip().isdigit():
+        # 多个用户：逗号或空格分隔的 qq 列表，并发查询后合并为一条消息
+        ids = parse_id_list(qq)
+        hot_log("user", "ids={!r}", ids)
+        results = await gather_limited(_get_user_info, ids)
+        chain: list = []
+        for user_id, data in zip(ids, results):
+            if chain:
+                chain.append(Plain("\n\n"))
+            if data is None or isinstance(data, BaseException):
+                if isinstance(data, BaseException):
+                    logger.warning(f"获取用户{user_id}信息失败: {data}")
+                chain.append(Plain(f"用户{user_id}信息获取失败"))
+            else:
+                chain.append(Plain(_user_text(data)))
+        yield event.chain_result(chain)
+        return
 
-async def user_get(event: AstrMessageEvent, qq: int | None = None):
     user_id = qq or event.get_sender_id()
-    logger.info(f"{user_id=}")
+    hot_log("user", "user_id={!r}", user_id)
     if not isinstance(user_id, int) and not user_id.isdigit():
         logger.warning("用户ID不是数字")
         raise ValueError("用户ID不是数字")
     
-    async with httpx.AsyncClient() as client:
-        user = User(client=client)
-        await user.get_user_info(qq=int(user_id))
-        data: list[UserModel] | UserModel | None = user.model.user
-        if data is None or isinstance(data, list):
-            logger.error("用户信息解析出错")
-            raise ValueError("用户信息解析出错")
+    data: UserModel | None = await _get_user_info(int(user_id))
+    if data is None:
+        logger.error("用户信息解析出错")
+        raise ValueError("用户信息解析出错")
         
-        yield event.chain_result([
-            Plain(
-                f"{data.qq=}"
-                f"\n{data.id=}"
-                f"\n{data.name=}"
-                f"\n{data.kook_id=}"
-                f"\n{data.telegram_name=}"
-                f"\n{data.osu_name=}"
-                f"\n{data.favorability=}"
-                f"\n{data.coin=}"
-                f"\n{data.group=}"
-                f"\n{data.item=}"
-                f"\n{data.badge=}"
-            )
-        ])
+    yield event.chain_result([
+        Plain(_user_text(data))
+    ])
 
 
-async def user_update_check(event: AstrMessageEvent, qq: int | None = None):
-    user_id = qq or event.get_sender_id()
-    logger.info(f"{user_id=}")
-    if not isinstance(user_id, int) and not user_id.isdigit():
-        logger.warning("用户ID不是数字")
-        raise ValueError("用户ID不是数字")
-    
-    async with httpx.AsyncClient() as client:
-        user = User(client=client)
-        await user.get_user_info(qq=int(user_id))
-        data: list[UserModel] | UserModel | None = user.model.user
+async def _fetch_check_card(qq: int) -> bytes | None:
+    """读取签到卡片（只读，不签到）"""
+    user_check = await call_api(UserCheck, "get", qq=qq)
+    return user_check.raw or None
+
+
+async def _sign_in(qq: int) -> bytes | None:
+    """签到并获取签到卡片
+
+    三个请求中只有签到有副作用，API 的顺序约束是：签到必须在昵称检查之后（未设置昵称的用户不签到），
+    新签到的卡片必须在签到之后读取（卡片内容包含本次签到结果）。因此：
+    - 卡片读取与昵称检查、签到并发进行（预取），签到返回"今日已签到"时预取的卡片即为结果，
+      资料已缓存时只需一次往返
+    - 新签到时丢弃预取的卡片，签到后重新读取；资料已缓存时为签到和卡片两次往返，这是 API 顺序决定的下限
+    """
+    prefetch = asyncio.ensure_future(_fetch_check_card(qq))
+    try:
+        data: UserModel | None = await _get_user_info(qq)
         if data is None:
             logger.error("用户信息获取失败")
             raise ValueError("用户信息获取失败")
-        
-        if isinstance(data, UserModel) and data.name == "DEFAULT_USER_NAME":
+
+        if data.name == "DEFAULT_USER_NAME":
             logger.warning("用户未设置昵称")
             raise ValueError("用户未设置昵称")
-    
-    async with httpx.AsyncClient() as client:
-        user = User(client=client)
-        await user.update_user_check(qq=int(user_id))
-        data: list[UserModel] | UserModel | None = user.model.user
 
+        user = await call_api(User, "update_user_check", qq=qq)
+        _user_cache.invalidate(qq)
+
+        already_checked = False
         if user.error:
             if user.raw_code == 302:
                 logger.info("用户今日已签到")
+                already_checked = True
             else:
                 logger.warning("参数错误或账号不存在")
                 raise ValueError("参数错误或账号不存在")
 
-        if data is None or isinstance(data, list):
+        checked: list[UserModel] | UserModel | None = user.model.user if user.model else None
+        if checked is None or isinstance(checked, list):
             logger.error("用户签到失败")
             raise ValueError("用户签到失败")
-        
-        user_check = UserCheck(client=client)
-        await user_check.get(qq=int(user_id))
-        img: bytes = user_check.raw
-        
-        yield event.chain_result([
-            Reply(id=event.message_obj.message_id),
-            Image.fromBytes(img)
-        ])
+
+        if already_checked:
+            try:
+                img = await prefetch
+            except Exception as e:
+                logger.warning(f"预取签到卡片失败，重新获取: {e}")
+            else:
+                if img is not None:
+                    return img
+        return await _fetch_check_card(qq)
+    finally:
+        if not prefetch.done():
+            prefetch.cancel()
+        elif not prefetch.cancelled():
+            # 未使用的预取结果中的异常不再抛出
+            prefetch.exception()
+
+
+async def _load_check_card(qq: int, key: tuple[int, str]) -> bytes | None:
+    """读取当天的签到卡片，磁盘缓存中没有时签到并写入缓存"""
+    image_cache = get_image_cache()
+    disk_key = check_card_key(*key)
+    if image_cache is not None:
+        img = await image_cache.get_bytes_async(disk_key)
+        if img is not None:
+            return img
+    img = await _sign_in(qq)
+    if img is not None and image_cache is not None:
+        await image_cache.put_async(disk_key, img)
+    return img
+
+
+async def user_update_check(event: AstrMessageEvent, qq: int | None = None):
+    user_id = qq or event.get_sender_id()
+    hot_log("user", "user_id={!r}", user_id)
+    if not isinstance(user_id, int) and not user_id.isdigit():
+        logger.warning("用户ID不是数字")
+        raise ValueError("用户ID不是数字")
+    
+    key = _check_card_key(int(user_id))
+    img = await _check_card_cache.get_or_fetch(
+        key, lambda: _load_check_card(int(user_id), key)
+    )
+    if img is None:
+        logger.error("签到卡片获取失败")
+        raise ValueError("签到卡片获取失败")
+
+    yield event.chain_result([
+        Reply(id=event.message_obj.message_id),
+        Image.fromBytes(img)
+    ])
 
 async def user_check(event: AstrMessageEvent, qq: int):
-    async with httpx.AsyncClient() as client:
-        user_check = UserCheck(client=client)
-
-        await user_check.get(qq=qq)
-        img: bytes = user_check.raw
-        yield event.chain_result([
-            Image.fromBytes(img)
-        ])
+    key = _check_card_key(qq)
+    img = _check_card_cache.get(key)
+    image_cache = get_image_cache()
+    if img is None and image_cache is not None:
+        img = await image_cache.get_bytes_async(check_card_key(*key))
+    if img is None:
+        user_check = await call_api(UserCheck, "get", qq=qq)
+        img = user_check.raw
+    yield event.chain_result([
+        Image.fromBytes(img)
+    ])
 
 __all__ = [
     "user_update_name",
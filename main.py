@@ -1,18 +1,73 @@
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star
 from astrbot.api import AstrBotConfig, logger
-from astrbot.core.platform.message_session import MessageSession
 
 from .core.cave import *
 from .core.user import *
 from .core.bi import *
-from .core.bi import update_group_activity, set_plugin_context, set_whitelist_groups, get_whitelist_groups, save_bi_data, load_bi_data, set_plugin_path
-
+from .core.mikuchat_client import acquire_http_client, release_http_client, set_http_client_options
+from .core.image_cache import close_image_cache, init_image_cache
+from .core.mikuchat_resilience import set_resilience_options
+from .core.cave import set_cave_cache_size, set_cave_prefetch_size, stop_cave_prefetch
+from .core.user import set_user_info_cache_ttl
+from .core.hot_log import configure_hot_log
+from .core.bi import record_group_message, set_plugin_context, set_whitelist_groups, save_bi_data, load_bi_data, set_plugin_path, set_user_cache_size, set_price_retention_hours, set_price_archive_enabled, set_price_ring_capacity, set_broadcast_options, set_llm_options, set_catchup_max_ticks, catch_up_market
+
+
+# 共用 MikuChat 服务的插件类数量
+_shared_users = 0
+
+
+def _acquire_shared_services(plugin_name: str, config: AstrBotConfig | None):
+    """登记一个使用共享 MikuChat 服务的插件类
+
+    连接池、重试熔断、回声洞/用户资料缓存和图片磁盘缓存由各插件类共用：
+    第一个加载的插件类按配置初始化，任一插件类单独启用都能正常工作。
+    """
+    global _shared_users
+    _shared_users += 1
+    acquire_http_client()
+    if _shared_users > 1:
+        return
+    config = config or {}
+
+    # 设置 MikuChat API 连接池与超时
+    set_http_client_options(
+        max_connections=config.get('http_max_connections', 20),
+        max_keepalive_connections=config.get('http_max_keepalive_connections', 10),
+        timeout=config.get('http_timeout', 10.0),
+    )
+
+    # 设置 MikuChat API 重试、熔断和对冲请求
+    set_resilience_options(
+        retry_attempts=config.get('mikuchat_retry_attempts', 3),
+        breaker_failure_threshold=config.get('mikuchat_breaker_threshold', 5),
+        breaker_reset_timeout=config.get('mikuchat_breaker_reset_seconds', 30.0),
+        hedge_enabled=config.get('mikuchat_hedge_enabled', False),
+    )
+
+    # 设置回声洞和用户资料缓存
+    set_cave_cache_size(config.get('cave_cache_size', 512))
+    set_user_info_cache_ttl(config.get('user_info_cache_ttl', 60))
+    set_cave_prefetch_size(config.get('cave_prefetch_size', 8))
+
+    # 设置签到卡片和回声洞图片的磁盘缓存
+    init_image_cache(plugin_name, config.get('image_cache_max_mb', 200))
+
+
+async def _release_shared_services():
+    """注销一个插件类，最后一个插件类停用时关闭共享的 HTTP 客户端并保存图片缓存索引"""
+    global _shared_users
+    _shared_users = max(0, _shared_users - 1)
+    await release_http_client()
+    if _shared_users == 0:
+        close_image_cache()
 
 
 class UserPlugin(Star):
-    def __init__(self, context: Context):
+    def __init__(self, context: Context, config: AstrBotConfig | None = None):
         super().__init__(context)
+        _acquire_shared_services(self.name, config)
 
     @filter.command("user_update_name")
     async def user_update_name(self, event: AstrMessageEvent, name: str, qq: int | None = None):
@@ -20,35 +75,50 @@ class UserPlugin(Star):
             yield msg
 
     @filter.command("user_get")
-    async def user_get(self, event: AstrMessageEvent, qq: int | None = None):
+    async def user_get(self, event: AstrMessageEvent, qq: str | None = None):
+        """查询用户资料，可用逗号分隔多个 qq 一次查询"""
         async for msg in user_get(event, qq):
             yield msg
 
+    async def terminate(self):
+        await _release_shared_services()
+
 
 class UserCheckPlugin(Star):
-    def __init__(self, context: Context):
+    def __init__(self, context: Context, config: AstrBotConfig | None = None):
         super().__init__(context)
+        _acquire_shared_services(self.name, config)
 
     @filter.command("user_update_check")
     async def user_update_check(self, event: AstrMessageEvent, qq: int | None = None):
         async for msg in user_update_check(event, qq):
             yield msg
 
+    async def terminate(self):
+        await _release_shared_services()
+
 
 class CavePlugin(Star):
-    def __init__(self, context: Context):
+    def __init__(self, context: Context, config: AstrBotConfig | None = None):
         super().__init__(context)
+        _acquire_shared_services(self.name, config)
 
     @filter.command("cave_get")
-    async def cave_get(self, event: AstrMessageEvent):
-        async for msg in cave_get(event):
+    async def cave_get(self, event: AstrMessageEvent, count: int = 1):
+        """随机回声洞，可指定条数"""
+        async for msg in cave_get(event, count):
             yield msg
 
     @filter.command("cave_select")
-    async def cave_select(self, event: AstrMessageEvent, id_: int):
+    async def cave_select(self, event: AstrMessageEvent, id_: str):
+        """按编号查看回声洞，可用逗号分隔多个编号"""
         async for msg in cave_select(event, id_):
             yield msg
 
+    async def terminate(self):
+        await stop_cave_prefetch()
+        await _release_shared_services()
+
 
 class BiPlugin(Star):
     def __init__(self, context: Context, config: AstrBotConfig):
@@ -58,12 +128,51 @@ class BiPlugin(Star):
         # 设置插件上下文（用于LLM调用）
         set_plugin_context(context)
 
+        # 设置热路径日志的采样、限速和汇总间隔
+        configure_hot_log(
+            rules=self.config.get('hot_log_rules', []),
+            summary_interval=self.config.get('hot_log_summary_seconds', 60),
+        )
+
         # 设置数据文件路径（使用插件名称）
         set_plugin_path(self.name)
 
+        # 设置用户账户缓存上限
+        set_user_cache_size(self.config.get('user_cache_size', 1024))
+
+        # 设置原始价格记录保留时长
+        set_price_retention_hours(self.config.get('price_raw_retention_hours', 48))
+
+        # 设置是否归档完整精度的价格历史
+        set_price_archive_enabled(self.config.get('price_archive_enabled', True))
+
+        # 设置最近价格缓冲区容量
+        set_price_ring_capacity(self.config.get('price_ring_capacity', 1440))
+
+        # 设置随机事件群发的并发数、超时和平台限速
+        set_broadcast_options(
+            concurrency=self.config.get('broadcast_concurrency', 8),
+            timeout=self.config.get('broadcast_timeout', 10.0),
+            platform_rate=self.config.get('broadcast_platform_rate', 5.0),
+        )
+
+        # 设置随机事件的LLM调用超时和调用预算
+        set_llm_options(
+            timeout=self.config.get('llm_timeout', 20.0),
+            max_inflight=self.config.get('llm_max_inflight', 2),
+            max_calls_per_hour=self.config.get('llm_max_calls_per_hour', 60),
+        )
+
+        # 设置 MikuChat 连接池、缓存和图片磁盘缓存（与其他插件类共用）
+        _acquire_shared_services(self.name, self.config)
+
         # 加载上次保存的数据
         load_bi_data()
 
+        # 补算停机期间缺失的市场更新
+        set_catchup_max_ticks(self.config.get('catchup_max_ticks', 10080))
+        catch_up_market()
+
         if 'enabled_bi_groups' not in self.config:
             logger.error("[BiPlugin] 配置项缺少 enabled_bi_groups 键")
 
@@ -80,34 +189,8 @@ class BiPlugin(Star):
     @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
     async def on_message(self, event: AstrMessageEvent):
         """监听所有群聊信息，更新群聊活跃度"""
-        try:
-            # 获取消息来源UMO
-            umo: MessageSession = MessageSession.from_str(event.unified_msg_origin)
-            
-            # platform_name = event.get_platform_name()
-            # platform_id = event.get_platform_id()
-            # session_id = event.get_session_id()
-            # self_id = event.get_self_id()
-            # logger.info(
-            #     f"[BiPlugin] 收到消息来自 {umo} "
-            #     f"({platform_name=}, "  # aiocqhttp
-            #     f"{platform_id=}, "  # 桐乃酱
-            #     f"{session_id=})"   # 群号
-            #     f"{self_id=}"       # bot qq号
-            # )
-            # 
-            # logger.info(f"{WHITELIST_SESSIONS=}")
-            # logger.info(f"{(umo.platform_name, umo.message_type.value, umo.session_id)=}")
-            # logger.info(f"platfrom_id: {self.config['platform_id']}")
-            # logger.info(f"config: {self.config['platform_id']}")
-            
-            # 检查是否是白名单群聊
-            if (umo.platform_name, umo.message_type.value, umo.session_id) in get_whitelist_groups():
-                # 更新群聊活跃度
-                update_group_activity(str(umo))
-                logger.info(f"[BiPlugin] 更新群聊活跃度: {umo}")
-        except Exception as e:
-            logger.info(f"[BiPlugin] 更新群聊活跃度失败: {e}")
+        # 每条群消息都会经过这里：只用UMO字符串查一次白名单集合，不解析、不写日志
+        record_group_message(event.unified_msg_origin)
 
     @filter.command("bi_price")
     async def bi_price(self, event: AstrMessageEvent, coin: str = ""):
@@ -149,6 +232,27 @@ class BiPlugin(Star):
         async for msg in bi_volatility(event):
             yield msg
 
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("bi_stats")
+    async def bi_stats(self, event: AstrMessageEvent):
+        """查看插件运行指标（管理员）"""
+        async for msg in bi_stats(event):
+            yield msg
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("bi_profile")
+    async def bi_profile(self, event: AstrMessageEvent, target: str = "status", count: int = 1, mode: str = "cprofile"):
+        """预约剖析市场更新（tick）或 bi_* 命令接下来几次执行（管理员）"""
+        async for msg in bi_profile(event, target, count, mode):
+            yield msg
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("bi_memory")
+    async def bi_memory(self, event: AstrMessageEvent, action: str = ""):
+        """记录内存快照，stop 停止追踪（管理员）"""
+        async for msg in bi_memory(event, action):
+            yield msg
+
     @filter.command("bi_history")
     async def bi_history(self, event: AstrMessageEvent, coin: str, timeframe: int = 10):
         async for msg in bi_history(self, event, coin, timeframe):
@@ -183,3 +287,4 @@ class BiPlugin(Star):
         """可选择实现异步的插件销毁方法，当插件被卸载/停用时会调用。"""
         bi_stop_market_updates()
         save_bi_data()
+        await _release_shared_services()